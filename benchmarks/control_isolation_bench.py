@@ -0,0 +1,187 @@
+"""
+Control latency with and without bulk video load, on the shared loop vs the isolated control loop.
+
+A server process runs a real WebSocketHandler with the main loop (port 19280) and the
+control loop (port 19282), and publishes a pre-encoded JPEG of --frame-kb at --fps to
+every /video viewer. A client process connects --viewers video viewers and one telemetry
+client to the main port, plus two /control senders at --control-hz: one on the main port
+(shared loop) and one on the control port (isolated loop).
+
+Control latency is client send (wall clock in the control frame) -> handler receives the
+message on its loop, measured in the server process. Each phase is run idle and loaded.
+
+Usage:
+    python benchmarks/control_isolation_bench.py --viewers 8 --frame-kb 200 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAIN_PORT = 19280
+CONTROL_PORT = 19282
+SHARED_ANGLE = 0.25
+ISOLATED_ANGLE = -0.25
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 2),
+            "p95": round(values[int(last * 0.95)], 2), "p99": round(values[int(last * 0.99)], 2),
+            "max": round(values[last], 2)}
+
+
+class _StubLinkSampler:
+    snapshot = {"ap_mac": "00:00:00:00:00:00", "signal_strength": -50}
+
+    def start(self):
+        pass
+
+
+def run_server(fps, frame_kb, switch_interval_ms, ready, stop, result_queue):
+    from controllers.control_protocol import decode_control_message
+    from controllers.websocket_handler import WebSocketHandler
+    from core.teleop_decision_manager import TeleopDecisionManager
+    from services.video_broadcaster import EncodedFrame
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if switch_interval_ms:
+        sys.setswitchinterval(switch_interval_ms / 1000)
+    latency = {"shared": [], "isolated": []}
+
+    class BenchHandler(WebSocketHandler):
+        async def _on_control_message(self, websocket, message):
+            control_input = decode_control_message(message)
+            key = "isolated" if control_input.angle < 0 else "shared"
+            latency[key].append(time.time() * 1000 - control_input.client_time_ms)
+            await super()._on_control_message(websocket, message)
+
+    loops = []
+    for name in ("teleop-loop", "teleop-control"):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name=name, daemon=True).start()
+        loops.append(loop)
+    handler = BenchHandler(loops[0], TeleopDecisionManager(), port=MAIN_PORT, link_sampler=_StubLinkSampler(),
+                           telemetry_interval_s=0.05, control_loop=loops[1], control_port=CONTROL_PORT,
+                           video_max_age_ms=250)
+
+    # Incompressible payload of the requested size; the viewers do not decode it
+    jpeg = os.urandom(frame_kb * 1024)
+    time.sleep(0.5)
+    ready.set()
+    period = 1.0 / fps
+    next_tick = time.monotonic()
+    frame_id = 0
+    while not stop.is_set():
+        frame_id += 1
+        if handler.video_broadcaster.has_subscribers():
+            loops[0].call_soon_threadsafe(handler.video_broadcaster.publish, EncodedFrame(jpeg, frame_id))
+        next_tick += period
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    result_queue.put({"latency": latency, "budgets": handler.get_budget_stats()})
+
+
+def run_clients(viewers, control_hz, seconds, result_queue):
+    import websockets
+
+    from controllers.control_protocol import BINARY_SUBPROTOCOL, encode_control_frame
+
+    received = {"frames": 0, "bytes": 0}
+
+    async def control(port, angle, deadline):
+        seq = 0
+        async with websockets.connect(f"ws://127.0.0.1:{port}/control", subprotocols=[BINARY_SUBPROTOCOL]) as ws:
+            while time.monotonic() < deadline:
+                seq += 1
+                await ws.send(encode_control_frame(0.2, angle, seq))
+                await asyncio.sleep(1.0 / control_hz)
+
+    async def video(deadline):
+        async with websockets.connect(f"ws://127.0.0.1:{MAIN_PORT}/video", max_size=None, compression=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                received["frames"] += 1
+                received["bytes"] += len(message)
+
+    async def telemetry(deadline):
+        async with websockets.connect(f"ws://127.0.0.1:{MAIN_PORT}/telemetry", max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def main():
+        deadline = time.monotonic() + seconds
+        tasks = [control(MAIN_PORT, SHARED_ANGLE, deadline), control(CONTROL_PORT, ISOLATED_ANGLE, deadline)]
+        if viewers:
+            tasks += [telemetry(deadline)] + [video(deadline) for _ in range(viewers)]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+    result_queue.put({"video_mbit_per_s": round(received["bytes"] * 8 / 1e6 / seconds, 1),
+                      "video_frames": received["frames"]})
+
+
+def run_phase(context, viewers, args):
+    ready, stop = context.Event(), context.Event()
+    server_results, client_results = context.Queue(), context.Queue()
+    server = context.Process(target=run_server, args=(args.fps, args.frame_kb, args.switch_interval_ms, ready, stop,
+                                                       server_results))
+    server.start()
+    ready.wait(timeout=30)
+
+    clients = context.Process(target=run_clients, args=(viewers, args.control_hz, args.seconds, client_results))
+    clients.start()
+    client_result = client_results.get(timeout=args.seconds + 30)
+    clients.join()
+    stop.set()
+    server_result = server_results.get(timeout=30)
+    server.join()
+
+    return {
+        "viewers": viewers,
+        "control_latency_ms": {key: percentiles(values) for key, values in server_result["latency"].items()},
+        "budgets": server_result["budgets"],
+        **client_result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, default=8)
+    parser.add_argument("--frame-kb", type=int, default=200)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--control-hz", type=float, default=50.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--switch-interval-ms", type=float, help="GIL switch interval in the server process")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    result = {"idle": run_phase(context, 0, args), "loaded": run_phase(context, args.viewers, args)}
+
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
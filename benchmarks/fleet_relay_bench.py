@@ -0,0 +1,251 @@
+"""
+Local multi-car simulation of the fleet relay.
+
+For every car count in --cars, starts:
+- a "cars" process with that many real WebSocketHandler instances on consecutive ports,
+  each publishing a pre-encoded JPEG at --fps (camera and encoder are not simulated);
+- the relay (relay/fleet_relay.py) in its own process, unless the mode is "direct";
+- an "operators" process with, per car, one /control sender, one /autonomy heartbeat,
+  one /telemetry client and --viewers /video viewers, connected through the relay or
+  directly to the cars.
+
+Reports per step: relay CPU percent (one core = 100), video frames per second per viewer,
+frame latency car publish -> viewer receive, and control latency operator send -> car apply.
+All processes share the host's clocks: the simulated cars put their monotonic publish
+time (ms) in the frame id, and control frames carry the operator's wall-clock send time.
+
+Usage:
+    python benchmarks/fleet_relay_bench.py --cars 1,4,8,12 --viewers 2 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CAR_BASE_PORT = 19100
+RELAY_PORT = 19000
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 2),
+            "p95": round(values[int(last * 0.95)], 2), "p99": round(values[int(last * 0.99)], 2),
+            "max": round(values[last], 2)}
+
+
+def process_cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class _StubLinkSampler:
+    snapshot = {"ap_mac": "00:00:00:00:00:00", "signal_strength": -50}
+
+    def start(self):
+        pass
+
+
+def run_cars(count, fps, frame_size, ready, stop, result_queue):
+    import cv2
+    import numpy as np
+
+    from controllers.control_protocol import decode_control_message
+    from controllers.websocket_handler import WebSocketHandler
+    from core.teleop_decision_manager import TeleopDecisionManager
+    from services.video_broadcaster import EncodedFrame
+
+    logging.getLogger().setLevel(logging.WARNING)
+    control_latency = []
+
+    class BenchCarHandler(WebSocketHandler):
+        async def _on_control_message(self, websocket, message):
+            control_latency.append(time.time() * 1000 - decode_control_message(message).client_time_ms)
+            await super()._on_control_message(websocket, message)
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    handlers = [BenchCarHandler(loop, TeleopDecisionManager(), port=CAR_BASE_PORT + i,
+                                link_sampler=_StubLinkSampler()) for i in range(count)]
+
+    width, height = frame_size
+    rgb = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 2)
+    jpeg = cv2.imencode(".jpg", rgb, [int(cv2.IMWRITE_JPEG_QUALITY), 80])[1].tobytes()
+
+    time.sleep(0.5)
+    ready.set()
+    period = 1.0 / fps
+    next_tick = time.monotonic()
+    while not stop.is_set():
+        frame_id = int(time.monotonic() * 1000) & 0xFFFFFFFF
+        for handler in handlers:
+            if handler.video_broadcaster.has_subscribers():
+                loop.call_soon_threadsafe(handler.video_broadcaster.publish, EncodedFrame(jpeg, frame_id))
+        next_tick += period
+        time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    result_queue.put({"control_latency": control_latency, "jpeg_bytes": len(jpeg)})
+
+
+def run_relay(count, ready):
+    from relay.fleet_relay import FleetRelay
+
+    logging.getLogger().setLevel(logging.WARNING)
+    relay = FleetRelay({f"car{i}": f"ws://127.0.0.1:{CAR_BASE_PORT + i}" for i in range(count)},
+                       host="127.0.0.1", port=RELAY_PORT)
+    loop = asyncio.new_event_loop()
+    loop.call_later(0.3, ready.set)
+    loop.run_until_complete(relay.run())
+
+
+def run_operators(urls, viewers, control_hz, seconds, result_queue):
+    import websockets
+
+    from controllers.control_protocol import BINARY_SUBPROTOCOL, encode_control_frame
+    from services.video_broadcaster import FRAME_HEADER, VIDEO_FRAMED_SUBPROTOCOL
+
+    video_latency = []
+    frames = [0] * (len(urls) * viewers)
+
+    async def control(url, deadline):
+        seq = 0
+        async with websockets.connect(url + "/control", subprotocols=[BINARY_SUBPROTOCOL]) as ws:
+            while time.monotonic() < deadline:
+                seq += 1
+                await ws.send(encode_control_frame(0.2, 0.0, seq))
+                await asyncio.sleep(1.0 / control_hz)
+
+    async def autonomy(url, deadline):
+        async with websockets.connect(url + "/autonomy") as ws:
+            while time.monotonic() < deadline:
+                await ws.send(json.dumps({"autonomy": False}))
+                await asyncio.sleep(0.05)
+
+    async def telemetry(url, deadline):
+        async with websockets.connect(url + "/telemetry", max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def video(url, index, deadline):
+        async with websockets.connect(url + "/video", subprotocols=[VIDEO_FRAMED_SUBPROTOCOL],
+                                      max_size=None, compression=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                frame_id, _ = FRAME_HEADER.unpack_from(message)
+                video_latency.append(((int(time.monotonic() * 1000) & 0xFFFFFFFF) - frame_id) % 0x100000000)
+                frames[index] += 1
+
+    async def main():
+        deadline = time.monotonic() + seconds
+        tasks = []
+        for car, url in enumerate(urls):
+            tasks += [autonomy(url, deadline), control(url, deadline), telemetry(url, deadline)]
+            tasks += [video(url, car * viewers + v, deadline) for v in range(viewers)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return [repr(r) for r in results if isinstance(r, Exception)]
+
+    errors = asyncio.run(main())
+    result_queue.put({"video_latency": video_latency, "frames": frames, "errors": errors[:5]})
+
+
+def run_step(context, count, mode, args):
+    ready_cars, stop_cars = context.Event(), context.Event()
+    car_results, operator_results = context.Queue(), context.Queue()
+    cars = context.Process(target=run_cars, args=(count, args.fps, args.frame_size, ready_cars, stop_cars,
+                                                  car_results))
+    cars.start()
+    ready_cars.wait(timeout=30)
+
+    relay = None
+    if mode == "relay":
+        ready_relay = context.Event()
+        relay = context.Process(target=run_relay, args=(count, ready_relay), daemon=True)
+        relay.start()
+        ready_relay.wait(timeout=30)
+        urls = [f"ws://127.0.0.1:{RELAY_PORT}/car{i}" for i in range(count)]
+    else:
+        urls = [f"ws://127.0.0.1:{CAR_BASE_PORT + i}" for i in range(count)]
+
+    operators = context.Process(target=run_operators, args=(urls, args.viewers, args.control_hz, args.seconds,
+                                                            operator_results))
+    operators.start()
+    # Measure the steady state: skip connection setup at the start
+    time.sleep(1.0)
+    relay_cpu_start = process_cpu_seconds(relay.pid) if relay else 0.0
+    cars_cpu_start = process_cpu_seconds(cars.pid)
+    window_start = time.monotonic()
+    time.sleep(max(0.5, args.seconds - 2.0))
+    window = time.monotonic() - window_start
+    relay_cpu = process_cpu_seconds(relay.pid) - relay_cpu_start if relay else 0.0
+    cars_cpu = process_cpu_seconds(cars.pid) - cars_cpu_start
+
+    operator_result = operator_results.get(timeout=args.seconds + 30)
+    operators.join()
+    stop_cars.set()
+    car_result = car_results.get(timeout=30)
+    cars.join()
+    if relay:
+        relay.terminate()
+        relay.join()
+
+    frames = operator_result["frames"]
+    return {
+        "cars": count,
+        "mode": mode,
+        "viewers_per_car": args.viewers,
+        "relay_cpu_percent": round(100.0 * relay_cpu / window, 1) if relay else None,
+        "cars_cpu_percent": round(100.0 * cars_cpu / window, 1),
+        "video_fps_per_viewer": round(sum(frames) / len(frames) / args.seconds, 1) if frames else 0.0,
+        "video_latency_ms": percentiles(operator_result["video_latency"]),
+        "control_latency_ms": percentiles(car_result["control_latency"]),
+        "jpeg_bytes": car_result["jpeg_bytes"],
+        "errors": operator_result["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", default="1,4,8,12", help="comma separated car counts")
+    parser.add_argument("--modes", default="relay,direct", help="relay and/or direct")
+    parser.add_argument("--viewers", type=int, default=2, help="video viewers per car")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--control-hz", type=float, default=50.0)
+    parser.add_argument("--frame-size", default="640x480")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+    args.frame_size = tuple(int(v) for v in args.frame_size.split("x"))
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for count in (int(v) for v in args.cars.split(",")):
+        for mode in args.modes.split(","):
+            results.append(run_step(context, count, mode, args))
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Reaction to Wi-Fi handovers: `iw event` stream vs BSSID polling, replayed without Wi-Fi.
+
+Replays a recorded `iw event -t` capture (default benchmarks/data/iw_event_roaming.log)
+through a LinkEventMonitor wired to the real TeleopControlPart handover reaction: a
+TeleopDecisionManager, a VideoStreamer on a WebSocketHandler and an ExperimentLogger
+in a temporary directory. A 30 Hz simulated drive loop holds full user throttle.
+
+Reports:
+- reaction time from the event line reaching the monitor to the throttle cap being
+  in the control state (and so in the next drive loop iteration);
+- drive loop iterations during each handover that still ran above the cap;
+- logged handover durations;
+- for comparison, the expected detection delay of a BSSID poll every --poll-s seconds
+  (the old approach), i.e. the time driven on a dead link before anything reacts.
+
+Usage:
+    python benchmarks/handover_bench.py --speed 1.0 --poll-s 1.0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_CAPTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "iw_event_roaming.log")
+PORT = 19480
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 3),
+            "p95": round(values[int(last * 0.95)], 3), "max": round(values[last], 3)}
+
+
+class _StubLinkSampler:
+    snapshot = {"ap_mac": "00:00:00:00:00:00", "signal_strength": -50}
+
+    def start(self):
+        pass
+
+    def refresh_bssid(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capture", default=DEFAULT_CAPTURE)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up factor")
+    parser.add_argument("--poll-s", type=float, default=1.0, help="BSSID poll interval to compare against")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    from controllers.websocket_handler import WebSocketHandler
+    from core.teleop_control_part import TeleopControlPart
+    from core.teleop_decision_manager import TeleopDecisionManager
+    from services.experiment_logger import ExperimentLogger
+    from services.link_events import LinkEventMonitor, parse_iw_event, replay_iw_events
+    from services.video_streamer import VideoStreamer
+
+    logging.getLogger().setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    decision_manager = TeleopDecisionManager(timeout_ms=60_000)
+    ws_handler = WebSocketHandler(loop, decision_manager, port=PORT, link_sampler=_StubLinkSampler())
+    log_dir = tempfile.mkdtemp(prefix="handover-bench-")
+    experiment_logger = ExperimentLogger(base_dir=log_dir, flush_interval_s=0.1)
+
+    line_times = {}
+
+    def stamped(lines):
+        # Remembers when each event line reached the monitor, keyed by its iw timestamp
+        for line in lines:
+            event = parse_iw_event(line)
+            if event is not None:
+                line_times[event.timestamp] = time.perf_counter()
+            yield line
+
+    # The part's real reaction code, on just the components it touches
+    part = types.SimpleNamespace(teleop_decision_manager=decision_manager, link_sampler=_StubLinkSampler(),
+                                 logger=experiment_logger, handover_throttle_cap=0.1,
+                                 video_streamer=VideoStreamer(ws_handler, loop, handover_policy="shrink"))
+    monitor = LinkEventMonitor(source=stamped(replay_iw_events(args.capture, speed=args.speed)))
+    part.link_events = monitor
+    monitor.add_listener(lambda event, duration_ms: TeleopControlPart._on_link_event(part, event, duration_ms))
+
+    reactions = []
+    video_levels = []
+
+    def on_handover_started(event, duration_ms):
+        if duration_ms is None:
+            video_levels.append(part.video_streamer.quality_controller.level)
+
+    monitor.add_listener(on_handover_started)
+
+    def on_state(state, changes):
+        if changes.get("throttle_cap") is not None:
+            event_time = line_times.get(monitor._handover_start.timestamp) if monitor._handover_start else None
+            if event_time is not None:
+                reactions.append((time.perf_counter() - event_time) * 1000)
+
+    decision_manager.state.add_listener(on_state)
+
+    # Simulated drive loop: full throttle from the user, capped during handovers
+    over_cap = []
+    stop = threading.Event()
+
+    def drive():
+        decision_manager.update_user_input(1.0, 0.0)
+        count = 0
+        while not stop.is_set():
+            decision_manager.update_user_input(1.0, 0.0)
+            _, throttle, _, _ = decision_manager.get_active_control(None)
+            if monitor.in_handover and throttle > 0.1:
+                count += 1
+            if not monitor.in_handover and count:
+                over_cap.append(count)
+                count = 0
+            time.sleep(1 / 30)
+
+    drive_thread = threading.Thread(target=drive, daemon=True)
+    drive_thread.start()
+    started = time.monotonic()
+    monitor.start()
+    monitor._thread.join()
+    stop.set()
+    drive_thread.join()
+    elapsed = time.monotonic() - started
+    experiment_logger.close()
+
+    with open(experiment_logger.log_file) as f:
+        logged = [json.loads(line) for line in f if '"handover"' in line]
+    durations = [entry["duration_ms"] for entry in logged if entry["event"] == "end"]
+    downs = [d for d in durations if d > 0]
+
+    result = {
+        "capture": os.path.basename(args.capture),
+        "replay_seconds": round(elapsed, 2),
+        "handovers": monitor.handovers,
+        "logged_durations_ms": durations,
+        "event_to_cap_ms": percentiles(reactions),
+        "video_level_during_handover": video_levels,
+        "drive_iterations_over_cap": sum(over_cap),
+        "polling": {
+            "interval_s": args.poll_s,
+            # A poll lands uniformly within the interval; outages shorter than the gap to the next poll go unseen
+            "expected_detection_ms": round(args.poll_s * 500, 1),
+            "outages_shorter_than_interval": sum(1 for d in downs if d < args.poll_s * 1000),
+        },
+    }
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+    part.video_streamer.stop()
+
+
+if __name__ == "__main__":
+    main()
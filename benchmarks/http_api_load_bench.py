@@ -0,0 +1,151 @@
+"""
+Load test for the HTTP control API while /video is streaming.
+
+Starts the WebSocket server, the HTTP API and the video streamer in-process on one
+event loop (no camera or drive train needed), feeds synthetic 640x480 frames at
+the drive loop rate, and hammers /ping, /recording and /autonomy from a separate
+process. Each scenario reports request latency percentiles, with and without a
+video viewer attached. Non-2xx responses are counted per route and left out of the
+latencies; the bench exits non-zero if there were any.
+
+Usage:
+    python benchmarks/http_api_load_bench.py --seconds 10 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.control_api_handler import ControlAPIHandler  # noqa: E402
+from controllers.websocket_handler import ConnectionState, WebSocketHandler  # noqa: E402
+from core.teleop_decision_manager import TeleopDecisionManager  # noqa: E402
+from services.video_streamer import VideoStreamer  # noqa: E402
+
+
+class _BenchPart:
+    """The attributes of TeleopControlPart that ControlAPIHandler uses."""
+
+    def __init__(self, ws_port, http_port):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.teleop_decision_manager = TeleopDecisionManager(marker_tracking=False)
+        self.ws_handler = WebSocketHandler(self.loop, self.teleop_decision_manager, port=ws_port)
+        self.ws_handler.autonomy_connection_state = ConnectionState.CONNECTED
+        self.http_handler = ControlAPIHandler(self, port=http_port)
+        self.http_handler.start()
+        self.video_streamer = VideoStreamer(self.ws_handler, self.loop)
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 2),
+            "p95": round(values[int(last * 0.95)], 2), "p99": round(values[int(last * 0.99)], 2),
+            "max": round(values[last], 2)}
+
+
+def _run_clients(api_url, video_url, seconds, concurrency, with_video, result_queue):
+    import aiohttp
+    import websockets
+
+    async def http_worker(session, latencies, errors, deadline):
+        requests = [("GET", "/ping", None), ("GET", "/recording", None), ("GET", "/autonomy", None),
+                    ("POST", "/autonomy", {"autonomy": False})]
+        i = 0
+        while time.monotonic() < deadline:
+            method, path, body = requests[i % len(requests)]
+            i += 1
+            start = time.perf_counter()
+            async with session.request(method, api_url + path, json=body) as response:
+                await response.read()
+            if not 200 <= response.status < 300:
+                route = f"{method} {path}"
+                errors[route] = errors.get(route, 0) + 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def video_reader(deadline, counter):
+        async with websockets.connect(video_url, max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    counter[0] += 1
+                except asyncio.TimeoutError:
+                    pass
+
+    async def main():
+        deadline = time.monotonic() + seconds
+        latencies = []
+        errors = {}
+        frames = [0]
+        tasks = []
+        if with_video:
+            tasks.append(video_reader(deadline, frames))
+        async with aiohttp.ClientSession() as session:
+            tasks.extend(http_worker(session, latencies, errors, deadline) for _ in range(concurrency))
+            await asyncio.gather(*tasks)
+        return latencies, errors, frames[0]
+
+    result_queue.put(asyncio.run(main()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--hz", type=float, default=30.0, help="synthetic drive loop rate")
+    parser.add_argument("--ws-port", type=int, default=18080)
+    parser.add_argument("--http-port", type=int, default=18081)
+    args = parser.parse_args()
+
+    part = _BenchPart(args.ws_port, args.http_port)
+    time.sleep(0.5)
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    stop = threading.Event()
+
+    def drive_loop():
+        while not stop.is_set():
+            part.video_streamer.submit_frame(frame)
+            time.sleep(1.0 / args.hz)
+
+    threading.Thread(target=drive_loop, daemon=True).start()
+
+    context = multiprocessing.get_context("spawn")
+    failed = 0
+    for with_video in (False, True):
+        result_queue = context.Queue()
+        process = context.Process(target=_run_clients, args=(
+            f"http://127.0.0.1:{args.http_port}", f"ws://127.0.0.1:{args.ws_port}/video",
+            args.seconds, args.concurrency, with_video, result_queue))
+        process.start()
+        latencies, errors, frames = result_queue.get()
+        process.join()
+        failed += sum(errors.values())
+        print(json.dumps({
+            "video_stream": with_video,
+            "video_frames_received": frames,
+            "requests_per_s": round(len(latencies) / args.seconds, 1),
+            "latency_ms": _percentiles(latencies),
+            "non_2xx": errors,
+        }))
+
+    stop.set()
+    part.video_streamer.stop()
+    if failed:
+        sys.exit(f"{failed} requests failed")
+
+
+if __name__ == "__main__":
+    main()
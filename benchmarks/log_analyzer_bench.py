@@ -0,0 +1,232 @@
+"""
+Experiment log analysis: loading whole logs vs the streaming, indexed LogAnalyzer.
+
+Writes a synthetic field log of about --mb MB with the real BatchedLogWriter (rotated
+into .1, .2, ... at a third of the size; gzip members with --compress): a "sys" entry
+per second as written by ResourceMonitor, an AP switch every few minutes with a CPU
+bump after it, handover and mode switch entries. The live plain file gets a few blank
+lines; with --compress its last gzip member is cut short, as after a power loss.
+
+Each task then runs in a fresh process, reporting its time and peak RSS:
+- load_all: the old way, every file json-loaded into a list, then the CPU median in
+  the 10 s before and after each AP switch in plain Python (bisect on the sorted samples);
+- index_cold / index_warm: building the sidecar indexes / loading them;
+- index_append: indexing again after the live log grew by about 1 MB;
+- query_*: all ap_switch entries, and 5 minutes of "sys" entries from the middle of
+  the logs, via the index and by reading everything (scan);
+- columns: converting to .npy columns;
+- around_columns: the same CPU percentiles, vectorized on the memory-mapped columns.
+
+Usage:
+    python benchmarks/log_analyzer_bench.py --mb 100 [--compress]
+"""
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+THREADS = ("MainThread", "teleop-loop", "teleop-control", "video-encoder", "link-sampler", "log-writer")
+START_MS = 1_746_000_000_000
+
+
+def sys_entry(rng, timestamp, bump):
+    threads = {name: round(rng.uniform(0.5, 12.0) + (bump if name == "teleop-loop" else 0.0), 1) for name in THREADS}
+    return {"type": "sys", "cpu": round(rng.uniform(35, 55) + bump, 1), "mem_mb": round(rng.uniform(400, 550), 1),
+            "process_cpu": round(sum(threads.values()), 1), "threads": threads,
+            "rss_mb": round(rng.uniform(180, 220), 1),
+            "loop_lag_ms": {"teleop-loop": round(rng.uniform(0.1, 3.0), 2),
+                            "teleop-control": round(rng.uniform(0.05, 1.0), 2)},
+            "gc_pause_ms": round(rng.uniform(0.0, 2.0), 2), "timestamp": timestamp}
+
+
+def write_log(directory, megabytes, compress):
+    from services.log_writer import BatchedLogWriter
+
+    rng = random.Random(3)
+    path = os.path.join(directory, "experiment_log.jsonl")
+    writer = BatchedLogWriter(path, batch_size=256, flush_interval_s=0.2, max_pending=10 ** 9,
+                              max_bytes=megabytes * 1024 * 1024 // 3, backup_count=5, compress=compress)
+    target = megabytes * 1024 * 1024
+    size = 0
+    timestamp = START_MS
+    next_switch = timestamp + rng.randint(120, 420) * 1000
+    bump_until = 0
+    entries = switches = 0
+    while size < target:
+        if timestamp >= next_switch:
+            bssid = ":".join(f"{rng.randint(0, 255):02X}" for _ in range(6))
+            writer.write({"type": "handover", "event": "start", "previous_bssid": "unknown", "timestamp": timestamp - 300})
+            writer.write({"type": "ap_switch", "bssid": bssid, "timestamp": timestamp})
+            writer.write({"type": "handover", "event": "end", "bssid": bssid, "duration_ms": 288.1,
+                          "timestamp": timestamp})
+            writer.write({"type": "mode_auto_switch", "mode": "local_angle", "reason": "heartbeat_timeout",
+                          "elapsed_ms": 201.3, "timestamp": timestamp + 200})
+            bump_until = timestamp + 8000
+            next_switch = timestamp + rng.randint(120, 420) * 1000
+            switches += 1
+        entry = sys_entry(rng, timestamp, 15.0 if timestamp < bump_until else 0.0)
+        writer.write(entry)
+        entries += 1
+        # Uncompressed size, whether or not the members are gzipped
+        size += len(json.dumps(entry)) + 1
+        timestamp += 1000
+        if entries % 50_000 == 0:
+            writer.flush(timeout=60.0)
+    writer.close()
+    if compress:
+        # Power loss in the middle of the last batch
+        with open(writer.path, "r+b") as f:
+            f.truncate(os.path.getsize(writer.path) - 200)
+    else:
+        with open(writer.path, "a") as f:
+            f.write("\n\n")
+    return writer.path, entries, switches, (START_MS, timestamp)
+
+
+def append_to_log(path, compress):
+    from services.log_writer import BatchedLogWriter
+
+    rng = random.Random(4)
+    writer = BatchedLogWriter(path[:-3] if compress else path, batch_size=256, max_pending=10 ** 9,
+                              max_bytes=10 ** 12, compress=compress)
+    timestamp = 2 * START_MS
+    for _ in range(3500):
+        writer.write(sys_entry(rng, timestamp, 0.0))
+        timestamp += 1000
+    writer.close()
+
+
+def peak_rss_mb():
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_task(task, path, time_range, columns_dir, result_queue):
+    import gzip
+
+    from services.log_analyzer import ColumnarLog, LogAnalyzer, log_files
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    detail = {}
+    middle = (time_range[0] + time_range[1]) // 2
+    window = (middle, middle + 5 * 60 * 1000)
+
+    if task == "load_all":
+        entries = []
+        for file in log_files(path):
+            opener = gzip.open if file.endswith(".gz") or ".gz." in file else open
+            with opener(file, "rt") as f:
+                try:
+                    for line in f:
+                        if line.strip():
+                            try:
+                                entries.append(json.loads(line))
+                            except ValueError:
+                                pass
+                except EOFError:
+                    pass
+        detail["load_seconds"] = round(time.perf_counter() - started, 3)
+        samples = sorted((e["timestamp"], e["cpu"]) for e in entries if e["type"] == "sys")
+        times = [t for t, _ in samples]
+        results = []
+        for switch in (e for e in entries if e["type"] == "ap_switch"):
+            t = switch["timestamp"]
+            stats = {}
+            for name, low, high in (("before", t - 10_000, t), ("after", t, t + 10_000)):
+                first = bisect.bisect_left(times, low)
+                last = bisect.bisect_left(times, high) if name == "before" else bisect.bisect_right(times, high)
+                values = sorted(cpu for _, cpu in samples[first:last])
+                stats[name] = values[len(values) // 2] if values else None
+            results.append(stats)
+        detail.update({"entries": len(entries), "anchors": len(results)})
+    elif task == "index_cold":
+        for file in log_files(path):
+            if os.path.exists(file + ".idx.json"):
+                os.remove(file + ".idx.json")
+        indexes = LogAnalyzer(path).build_indexes()
+        detail = {"blocks": sum(len(index.blocks) for index in indexes),
+                  "index_bytes": sum(os.path.getsize(index.index_path) for index in indexes)}
+    elif task in ("index_warm", "index_append"):
+        indexes = LogAnalyzer(path).build_indexes()
+        detail = {"blocks": sum(len(index.blocks) for index in indexes)}
+    elif task.startswith("query_"):
+        analyzer = LogAnalyzer(path)
+        query = analyzer.scan if task.endswith("_scan") else analyzer.entries
+        if task.startswith("query_ap_switch"):
+            detail = {"entries": sum(1 for _ in query(["ap_switch"]))}
+        else:
+            detail = {"entries": sum(1 for _ in query(["sys"], *window))}
+    elif task == "columns":
+        columnar = LogAnalyzer(path).to_columns(columns_dir)
+        detail = {"rows": {entry_type: columnar.rows(entry_type) for entry_type in columnar.types}}
+    elif task == "around_columns":
+        columnar = ColumnarLog(columns_dir)
+        stats = columnar.window_stats("ap_switch", "sys", "cpu", 10_000, 10_000)
+        before = [s["before"]["p50"] for s in stats if s["before"]["count"]]
+        after = [s["after"]["p50"] for s in stats if s["after"]["count"]]
+        detail = {"anchors": len(stats), "mean_p50_before": round(sum(before) / max(1, len(before)), 1),
+                  "mean_p50_after": round(sum(after) / max(1, len(after)), 1)}
+
+    result_queue.put({"task": task, "seconds": round(time.perf_counter() - started, 3),
+                      "peak_rss_mb": peak_rss_mb(), "rss_before_mb": baseline, **detail})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=int, default=100, help="approximate uncompressed size of all the logs")
+    parser.add_argument("--compress", action="store_true", help="gzip members, as TELEOP_LOG_COMPRESS")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="log-analyzer-bench-")
+    started = time.perf_counter()
+    path, entries, switches, time_range = write_log(directory, args.mb, args.compress)
+    generate_s = time.perf_counter() - started
+    columns_dir = os.path.join(directory, "columns")
+
+    from services.log_analyzer import log_files
+
+    files = log_files(path)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for task in ("load_all", "index_cold", "index_warm", "query_ap_switch", "query_ap_switch_scan", "query_sys_5_min",
+                 "query_sys_5_min_scan", "columns", "around_columns", "append", "index_append"):
+        if task == "append":
+            append_to_log(path, args.compress)
+            continue
+        result_queue = context.Queue()
+        process = context.Process(target=run_task, args=(task, path, time_range, columns_dir, result_queue))
+        process.start()
+        results[task] = result_queue.get(timeout=1800)
+        process.join()
+        del results[task]["task"]
+
+    result = {
+        "compress": args.compress,
+        "files": [os.path.basename(file) for file in files],
+        "bytes_on_disk": sum(os.path.getsize(file) for file in files),
+        "entries": entries,
+        "ap_switches": switches,
+        "generate_s": round(generate_s, 1),
+        "tasks": results,
+    }
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
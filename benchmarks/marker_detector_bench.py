@@ -0,0 +1,94 @@
+"""
+Compares the full-frame ArUco detector with TrackingMarkerDetector.
+
+Frames are read from a directory of recorded images (e.g. a DonkeyCar tub's
+images folder), or generated: a marker drifting over a noisy background that
+enters and leaves the picture. The full-frame detector is the reference; recall
+is the share of its (frame, marker id) detections that the tracking detector also
+reports.
+
+Usage:
+    python benchmarks/marker_detector_bench.py [--frames path/to/images] [--count 600]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from cv2 import aruco
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.marker_detector import TrackingMarkerDetector  # noqa: E402
+from services.vision_worker import detect_marker_ids  # noqa: E402
+
+
+def load_frames(path, count):
+    files = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))[:count]
+    return [cv2.cvtColor(cv2.imread(f), cv2.COLOR_BGR2GRAY) for f in files]
+
+
+def synthetic_frames(count, width=640, height=480, seed=0):
+    rng = np.random.default_rng(seed)
+    aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_100)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width), dtype=np.uint8), (0, 0), 3)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        phase = i % 200
+        if phase < 150:
+            size = 40 + int(60 * phase / 150)
+            marker = aruco.drawMarker(aruco_dict, 7, size)
+            x = int(50 + 3 * phase) % (width - size)
+            y = int(height / 2 + 80 * np.sin(phase / 20)) - size // 2
+            frame[y:y + size, x:x + size] = marker
+        frames.append(frame)
+    return frames
+
+
+def run(detect, frames):
+    results = []
+    start = time.perf_counter()
+    for gray in frames:
+        results.append(set(detect(gray)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", help="directory with recorded .jpg/.png frames")
+    parser.add_argument("--count", type=int, default=600)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.count) if args.frames else synthetic_frames(args.count)
+    if not frames:
+        sys.exit("no frames found")
+
+    aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_100)
+    aruco_params = aruco.DetectorParameters_create()
+    tracker = TrackingMarkerDetector(aruco_dict, aruco_params)
+
+    reference, reference_time = run(lambda gray: detect_marker_ids(gray, aruco_dict, aruco_params), frames)
+    tracked, tracked_time = run(tracker.detect, frames)
+
+    expected = sum(len(ids) for ids in reference)
+    matched = sum(len(ref & got) for ref, got in zip(reference, tracked))
+    extra = sum(len(got - ref) for ref, got in zip(reference, tracked))
+
+    print(json.dumps({
+        "frames": len(frames),
+        "full_frame_fps": round(len(frames) / reference_time, 1),
+        "tracking_fps": round(len(frames) / tracked_time, 1),
+        "speedup": round(reference_time / tracked_time, 2),
+        "reference_detections": expected,
+        "recall": round(matched / expected, 4) if expected else None,
+        "extra_detections": extra,
+    }))
+
+
+if __name__ == "__main__":
+    main()
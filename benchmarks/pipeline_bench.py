@@ -0,0 +1,248 @@
+"""
+Hardware-free benchmark of the full TeleopControlPart pipeline.
+
+Builds TeleopControlPart from a stub config, puts a fake `iw` on PATH, drives
+run_threaded at a fixed rate with synthetic or recorded 640x480 frames, and attaches
+local clients on /control, /video, /telemetry and /autonomy from a separate process.
+
+Reports (as one JSON document):
+- drive loop tick duration distribution and missed deadlines
+- video frames per second delivered to the viewer
+- control-to-output latency: client send -> first run_threaded tick returning that throttle
+- CPU time per thread
+- the pipeline's own latency histograms (services.latency_metrics)
+
+Usage:
+    python benchmarks/pipeline_bench.py --seconds 20 --hz 30 [--frames path/to/images] [--output result.json]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_IW_OUTPUT = """Connected to 1c:d1:e0:3d:7b:ae (on wlan0)
+\tSSID: bench
+\tfreq: 5180
+\tsignal: -58 dBm
+\ttx bitrate: 390.0 MBit/s
+"""
+
+
+class BenchConfig:
+    IMAGE_W = 640
+    IMAGE_H = 480
+    IMAGE_DEPTH = 3
+    DRIVE_LOOP_HZ = 30
+    TELEOP_WS_PORT = 18080
+    TELEOP_HTTP_PORT = 18081
+    TELEOP_CONTROL_WS_PORT = 18082
+    TELEOP_TELEMETRY_HZ = 5.0
+
+
+def install_fake_iw():
+    directory = tempfile.mkdtemp(prefix="fake-iw-")
+    path = os.path.join(directory, "iw")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\ncat <<'EOF'\n" + FAKE_IW_OUTPUT + "EOF\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+
+
+def load_frames(path, width, height):
+    if path:
+        files = sorted(glob.glob(os.path.join(path, "*.jpg")) + glob.glob(os.path.join(path, "*.png")))
+        frames = [cv2.resize(cv2.cvtColor(cv2.imread(f), cv2.COLOR_BGR2RGB), (width, height)) for f in files[:300]]
+        if frames:
+            return frames
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 2)
+    # Shift the picture a little every frame so the encoder sees motion
+    return [np.roll(base, shift=4 * i, axis=1) for i in range(60)]
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "mean": round(sum(values) / len(values), 3),
+            "p50": round(values[int(last * 0.5)], 3), "p95": round(values[int(last * 0.95)], 3),
+            "p99": round(values[int(last * 0.99)], 3), "max": round(values[last], 3)}
+
+
+def thread_cpu_seconds():
+    """CPU seconds (user + system) per thread name, from /proc/self/task."""
+    names = {t.native_id: t.name for t in threading.enumerate()}
+    ticks = os.sysconf("SC_CLK_TCK")
+    usage = {}
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        name = names.get(int(tid), f"tid-{tid}")
+        usage[name] = usage.get(name, 0.0) + (int(fields[11]) + int(fields[12])) / ticks
+    return usage
+
+
+def run_clients(ws_url, seconds, control_hz, send_log, result_queue):
+    import websockets
+
+    from controllers.control_protocol import BINARY_SUBPROTOCOL, encode_control_frame
+
+    async def control(deadline):
+        seq = 0
+        async with websockets.connect(ws_url + "/control", subprotocols=[BINARY_SUBPROTOCOL]) as ws:
+            while time.monotonic() < deadline:
+                seq += 1
+                throttle = (seq % 1000) / 1000.0
+                now_ms = time.time() * 1000
+                send_log[seq % 1000] = now_ms
+                await ws.send(encode_control_frame(throttle, 0.0, seq, now_ms))
+                await asyncio.sleep(1.0 / control_hz)
+
+    async def video(deadline, counters):
+        async with websockets.connect(ws_url + "/video", max_size=None) as ws:
+            first = None
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                first = first or time.monotonic()
+                counters["frames"] += 1
+            counters["video_seconds"] = time.monotonic() - first if first else 0.0
+
+    async def telemetry(deadline, counters):
+        async with websockets.connect(ws_url + "/telemetry", max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    counters["telemetry"] += 1
+                except asyncio.TimeoutError:
+                    pass
+
+    async def autonomy(deadline):
+        async with websockets.connect(ws_url + "/autonomy") as ws:
+            while time.monotonic() < deadline:
+                await ws.send(json.dumps({"autonomy": False}))
+                await asyncio.sleep(0.05)
+
+    async def main():
+        deadline = time.monotonic() + seconds
+        counters = {"frames": 0, "telemetry": 0, "video_seconds": 0.0}
+        # Autonomy heartbeat first: video is only streamed while the autonomy link is up
+        await asyncio.gather(autonomy(deadline), control(deadline), video(deadline, counters),
+                             telemetry(deadline, counters), return_exceptions=True)
+        return counters
+
+    result_queue.put(asyncio.run(main()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--hz", type=float, default=BenchConfig.DRIVE_LOOP_HZ, help="drive loop rate")
+    parser.add_argument("--control-hz", type=float, default=50.0)
+    parser.add_argument("--frames", help="directory with recorded frames (default: synthetic)")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    install_fake_iw()
+
+    from core.teleop_control_part import TeleopControlPart
+    from services.latency_metrics import metrics
+
+    cfg = BenchConfig()
+    part = TeleopControlPart(cfg)
+    frames = load_frames(args.frames, cfg.IMAGE_W, cfg.IMAGE_H)
+    time.sleep(1.0)
+
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    send_log = manager.dict()
+    result_queue = context.Queue()
+    clients = context.Process(target=run_clients, args=(f"ws://127.0.0.1:{cfg.TELEOP_WS_PORT}", args.seconds,
+                                                        args.control_hz, send_log, result_queue))
+    clients.start()
+    time.sleep(0.5)
+
+    period = 1.0 / args.hz
+    tick_ms = []
+    missed = 0
+    outputs = []
+    last_throttle_key = None
+    cpu_start = thread_cpu_seconds()
+    wall_start = time.monotonic()
+    next_tick = wall_start
+    index = 0
+    while time.monotonic() - wall_start < args.seconds - 0.5:
+        start = time.perf_counter()
+        angle, throttle, mode, recording, resized = part.run_threaded(frames[index % len(frames)])
+        duration = time.perf_counter() - start
+        tick_ms.append(duration * 1000)
+        index += 1
+
+        key = round(throttle * 1000)
+        if key != last_throttle_key:
+            outputs.append((key, time.time() * 1000))
+            last_throttle_key = key
+
+        next_tick += period
+        delay = next_tick - time.monotonic()
+        if delay < 0:
+            missed += 1
+            next_tick = time.monotonic()
+        else:
+            time.sleep(delay)
+    wall = time.monotonic() - wall_start
+    cpu_end = thread_cpu_seconds()
+
+    client_counters = result_queue.get()
+    clients.join()
+    sent = dict(send_log)
+
+    control_latency = [output_ms - sent[key] for key, output_ms in outputs
+                       if key in sent and 0 <= output_ms - sent[key] < 1000]
+
+    result = {
+        "config": {"seconds": args.seconds, "hz": args.hz, "control_hz": args.control_hz,
+                   "frames": "recorded" if args.frames else "synthetic"},
+        "drive_loop": {"ticks": len(tick_ms), "missed_deadlines": missed, "tick_ms": percentiles(tick_ms)},
+        "video": {"frames_received": client_counters["frames"],
+                  "fps": round(client_counters["frames"] / client_counters["video_seconds"], 2)
+                  if client_counters["video_seconds"] else 0.0,
+                  "streamer": part.video_streamer.get_stats()},
+        "telemetry_messages": client_counters["telemetry"],
+        "control_to_output_ms": percentiles(control_latency),
+        "cpu_percent_by_thread": {name: round(100.0 * (cpu_end.get(name, 0.0) - cpu_start.get(name, 0.0)) / wall, 2)
+                                  for name in sorted(cpu_end)},
+        "latency_metrics_ms": metrics.get_snapshot(),
+    }
+
+    part.shutdown()
+    manager.shutdown()
+
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
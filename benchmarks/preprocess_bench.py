@@ -0,0 +1,89 @@
+"""
+Before/after measurement of per-frame preprocessing in the drive loop.
+
+"before" repeats what run_threaded, send_camera_frame and evaluate_aruco_signals
+used to do per frame: cv2.resize to 160x120, np.uint8 copy + PIL Image.fromarray,
+and a grayscale conversion. "after" is FramePreprocessor.prepare() plus the model
+image and grayscale views. JPEG encoding is excluded from both.
+
+Allocations are counted with tracemalloc (numpy reports its buffers to it).
+
+Usage:
+    python benchmarks/preprocess_bench.py --frames 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.frame_preprocessor import FramePreprocessor  # noqa: E402
+
+
+def before(frame):
+    resized = cv2.resize(frame, (160, 120))
+    image = Image.fromarray(np.uint8(frame))
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    return resized, image, gray
+
+
+def make_after():
+    preprocessor = FramePreprocessor()
+
+    def after(frame):
+        prepared = preprocessor.prepare(frame)
+        return prepared.model, prepared.rgb, prepared.gray
+
+    return after
+
+
+def measure(step, frames):
+    # Warm up so one-off buffer allocation is not counted per frame
+    for frame in frames[:5]:
+        step(frame)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    allocated = 0
+    for frame in frames:
+        snapshot_before = tracemalloc.get_traced_memory()[0]
+        result = step(frame)
+        allocated += max(0, tracemalloc.get_traced_memory()[0] - snapshot_before)
+        del result
+    peak = tracemalloc.get_traced_memory()[1] - start_bytes
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for frame in frames:
+        step(frame)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "ms_per_frame": round(1000 * elapsed / len(frames), 3),
+        "bytes_allocated_per_frame": int(allocated / len(frames)),
+        "peak_bytes": int(peak),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(8)]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+
+    print(json.dumps({"before": measure(before, frames), "after": measure(make_after(), frames)}))
+
+
+if __name__ == "__main__":
+    main()
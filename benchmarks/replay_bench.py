@@ -0,0 +1,305 @@
+"""
+Replay of a recorded session: speed-up over real time and determinism.
+
+Synthesizes a session with the real SessionRecorder (JPEG frames at --fps and its message
+journal) from a scripted drive, then replays it with SessionReplay as fast as possible,
+twice, and once more decoding every frame. Per --minutes of session, the script has:
+
+- /control inputs at 50 Hz (binary frames, a JSON frame every 50th), 2% of them lost,
+  and a 300 ms gap every 10 s so input hold and ramp-down are exercised;
+- autonomy enabled over HTTP (a state change) at 15 s, an /autonomy client requesting
+  the autonomous source from 20 s whose heartbeats stop at 30 s (failover at the 200 ms
+  deadline), a marker in view from 25 s to 28 s, autonomy disabled at 40 s;
+- a handover throttle cap from 45 s to 47 s.
+
+The scripted car applies the same events through the real decision manager and
+drive path on a virtual clock, so the recorded outputs are what replay must reproduce.
+
+A second, live check drives the part in real time for --live-seconds with its own
+recorder attached, as on the car: user inputs, a switch to the autonomous source (a
+marker in view part of the time) and back. That session must contain the autonomous
+frames and replay to the same outputs.
+
+Usage:
+    python benchmarks/replay_bench.py --minutes 2
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FRAME_SHAPE = (480, 640, 3)
+
+
+def make_frames():
+    import cv2
+    import numpy as np
+    from cv2 import aruco
+
+    rng = np.random.default_rng(7)
+    background = rng.integers(60, 190, size=FRAME_SHAPE, dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (9, 9), 0)
+    with_marker = background.copy()
+    marker = aruco.drawMarker(aruco.Dictionary_get(aruco.DICT_4X4_100), 7, 120)
+    with_marker[180:340, 260:420] = 255
+    with_marker[200:320, 280:400] = marker[:, :, None]
+    return background, with_marker
+
+
+def script(minutes, fps):
+    """Scripted events as (offset ms, endpoint, event, message) and frame offsets, in time order."""
+    from controllers.control_protocol import encode_control_frame
+
+    events = []
+    seq = 0
+    for minute in range(minutes):
+        base = minute * 60_000
+        t = 0.0
+        while t < 60_000:
+            seq += 1
+            in_gap = (t % 10_000) >= 9_700
+            lost = seq % 50 == 13
+            if not in_gap and not lost:
+                angle = round(0.5 * ((t % 4000) / 2000 - 1), 3)
+                if seq % 50 == 0:
+                    message = json.dumps({"throttle": 0.4, "angle": angle, "seq": seq})
+                else:
+                    message = encode_control_frame(0.4, angle, seq, client_time_ms=1_000_000 + base + t)
+                events.append((base + t, "control", "message", message))
+            t += 20.0
+        events.append((base + 15_000, "state", "change", {"autonomy": True}))
+        events.append((base + 20_000, "autonomy", "open", None))
+        for beat in range(200):
+            events.append((base + 20_000 + beat * 50 + 1, "autonomy", "message", json.dumps({"autonomy": True})))
+        events.append((base + 35_000, "autonomy", "close", None))
+        events.append((base + 40_000, "state", "change", {"autonomy": False}))
+        events.append((base + 40_001, "autonomy", "open", None))
+        events.append((base + 40_002, "autonomy", "message", json.dumps({"autonomy": False})))
+        events.append((base + 40_003, "autonomy", "close", None))
+        events.append((base + 45_000, "state", "change", {"throttle_cap": 0.1}))
+        events.append((base + 47_000, "state", "change", {"throttle_cap": None}))
+    events.sort(key=lambda event: event[0])
+    frames = [n * 1000.0 / fps for n in range(int(minutes * 60 * fps))]
+    return events, frames
+
+
+def record_session(base_dir, minutes, fps):
+    from controllers.control_protocol import ControlChannel, decode_control_message
+    from core.teleop_control_part import TeleopControlPart
+    from core.teleop_decision_manager import ControlSource
+    from services.session_recorder import SessionRecorder
+    from services.session_replay import ReplayClock
+
+    background, with_marker = make_frames()
+    events, frame_times = script(minutes, fps)
+    clock = ReplayClock()
+    cfg = types.SimpleNamespace(IMAGE_H=FRAME_SHAPE[0], IMAGE_W=FRAME_SHAPE[1], IMAGE_DEPTH=FRAME_SHAPE[2])
+    car = TeleopControlPart.for_replay(cfg, clock)
+    decision_manager = car.teleop_decision_manager
+    decision_manager.recording_enabled = True
+
+    def context():
+        return {"state": decision_manager.state.snapshot.to_dict(), "input_gap_ms": None,
+                "config": {"IMAGE_H": FRAME_SHAPE[0], "IMAGE_W": FRAME_SHAPE[1], "IMAGE_DEPTH": FRAME_SHAPE[2],
+                           "TELEOP_INPUT_TIMEOUT_MS": 400, "TELEOP_INPUT_HOLD_MS": 100,
+                           "TELEOP_MARKER_TRACKING": True, "TELEOP_CONTROL_MAX_AGE_MS": 150,
+                           "TELEOP_AUTONOMY_DEADLINE_MS": 200}}
+
+    recorder = SessionRecorder(base_dir, frame_shape=FRAME_SHAPE, slots=16, context_provider=context)
+    # Virtual times start after the recorder's own start entry
+    recorder.start()
+    origin_ns = time.monotonic_ns() + 1_000_000_000
+    channel = ControlChannel("bench")
+    deadline_ns = 200_000_000
+    autonomy_beat = None
+
+    def check_failover(now_ns):
+        # The car's heartbeat watchdog, firing right at the deadline
+        nonlocal autonomy_beat
+        if autonomy_beat is not None and now_ns >= autonomy_beat + deadline_ns:
+            clock.now_ns = autonomy_beat + deadline_ns
+            decision_manager.set_control_source(ControlSource.AUTONOMOUS)
+            autonomy_beat = None
+
+    def apply(received_ns, endpoint, event, message):
+        nonlocal autonomy_beat
+        check_failover(received_ns)
+        wall_ms = 1_000_000 + (received_ns - origin_ns) / 1_000_000
+        clock.now_ns = received_ns
+        recorder.record_message(endpoint, event, message, received_ns=received_ns, wall_ms=wall_ms)
+        if endpoint == "state":
+            decision_manager.state.update(**message)
+        elif endpoint == "control" and event == "message":
+            control_input = decode_control_message(message)
+            if channel.accept(control_input, now_ms=wall_ms):
+                decision_manager.update_user_input(control_input.throttle, control_input.angle, seq=control_input.seq)
+        elif endpoint == "autonomy":
+            autonomy_beat = received_ns if event != "close" else None
+            if event == "message":
+                source = ControlSource.AUTONOMOUS if json.loads(message)["autonomy"] else ControlSource.USER
+                decision_manager.set_control_source(source)
+
+    timed = [(origin_ns + int(offset_ms * 1_000_000), endpoint, event, message)
+             for offset_ms, endpoint, event, message in events]
+    index = 0
+    for offset_ms in frame_times:
+        capture_ns = origin_ns + int(offset_ms * 1_000_000)
+        while index < len(timed) and timed[index][0] <= capture_ns:
+            apply(*timed[index])
+            index += 1
+        check_failover(capture_ns)
+        clock.now_ns = capture_ns
+        marker_in_view = 25_000 <= offset_ms % 60_000 < 28_000
+        rgb = with_marker if marker_in_view else background
+        angle, throttle, mode, recording, _ = car.run_threaded(rgb)
+        while recorder.backlog >= recorder.slots - 1:
+            time.sleep(0.001)
+        recorder.record(rgb, throttle, angle, mode, capture_ns=capture_ns)
+    recorder.stop()
+    recorder.close()
+    return recorder.session_dir, len(frame_times), len(events)
+
+
+def record_live(base_dir, seconds, fps):
+    """Drives the part in real time with its recorder, across a USER -> AUTONOMOUS -> USER switch."""
+    from controllers.control_protocol import ControlChannel, decode_control_message, encode_control_frame
+    from core.teleop_control_part import TeleopControlPart
+    from core.teleop_decision_manager import ControlSource
+    from services.session_recorder import SessionRecorder
+
+    background, with_marker = make_frames()
+    cfg = types.SimpleNamespace(IMAGE_H=FRAME_SHAPE[0], IMAGE_W=FRAME_SHAPE[1], IMAGE_DEPTH=FRAME_SHAPE[2])
+    car = TeleopControlPart.for_replay(cfg, time.monotonic_ns)
+    decision_manager = car.teleop_decision_manager
+    car.ws_handler = types.SimpleNamespace(control_max_age_ms=150, autonomy_deadline_ms=200)
+    car.session_recorder = SessionRecorder(base_dir, frame_shape=FRAME_SHAPE, slots=16,
+                                           context_provider=car._recording_context)
+    decision_manager.state.add_listener(car._journal_state)
+    recorder = car.session_recorder
+    channel = ControlChannel("live")
+
+    # Autonomous from 40% to 75% of the session, with the marker in view for part of it
+    autonomous = (0.4 * seconds, 0.75 * seconds)
+    marker = (0.5 * seconds, 0.6 * seconds)
+    decision_manager.state.update(autonomy=True, recording=True)
+    started = time.monotonic()
+    next_input = next_frame = next_beat = 0.0
+    seq = 0
+    autonomy_open = False
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= seconds:
+            break
+        if autonomous[0] <= elapsed < autonomous[1]:
+            if not autonomy_open:
+                recorder.record_message("autonomy", "open")
+                autonomy_open = True
+            if elapsed >= next_beat:
+                message = json.dumps({"autonomy": True})
+                recorder.record_message("autonomy", "message", message)
+                decision_manager.set_control_source(ControlSource.AUTONOMOUS)
+                next_beat = elapsed + 0.05
+        elif autonomy_open:
+            message = json.dumps({"autonomy": False})
+            recorder.record_message("autonomy", "message", message)
+            decision_manager.set_control_source(ControlSource.USER)
+            recorder.record_message("autonomy", "close")
+            autonomy_open = False
+        if elapsed >= next_input:
+            seq += 1
+            message = encode_control_frame(0.4, round(0.5 * ((elapsed % 4) / 2 - 1), 3), seq)
+            received_ns = time.monotonic_ns()
+            recorder.record_message("control", "message", message, received_ns=received_ns)
+            control_input = decode_control_message(message)
+            if channel.accept(control_input):
+                decision_manager.update_user_input(control_input.throttle, control_input.angle,
+                                                   received_ns=received_ns, seq=control_input.seq)
+            next_input = elapsed + 0.02
+        if elapsed >= next_frame:
+            car.run_threaded(with_marker if marker[0] <= elapsed < marker[1] else background)
+            next_frame = elapsed + 1.0 / fps
+        time.sleep(0.001)
+    decision_manager.state.update(recording=False)
+    session_dir = recorder.session_dir
+    recorder.close()
+    return session_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=2)
+    parser.add_argument("--fps", type=float, default=20.0)
+    parser.add_argument("--live-seconds", type=float, default=6.0, help="length of the real-time recording check")
+    parser.add_argument("--keep", action="store_true", help="keep the synthesized session")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    from services.session_replay import SessionReplay, diff_outputs
+
+    logging.getLogger().setLevel(logging.WARNING)
+    base_dir = tempfile.mkdtemp(prefix="replay-bench-")
+    started = time.perf_counter()
+    session_dir, frames, events = record_session(base_dir, args.minutes, args.fps)
+    record_s = time.perf_counter() - started
+    with contextlib.redirect_stdout(io.StringIO()):
+        live_dir = record_live(os.path.join(base_dir, "live"), args.live_seconds, args.fps)
+
+    runs = {}
+    outputs = {}
+    for name, decode in (("auto", "auto"), ("auto_again", "auto"), ("all", "all")):
+        replay = SessionReplay(session_dir, decode=decode)
+        # The in-process detector prints every marker it finds
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs[name] = replay.run()
+        runs[name] = replay.get_stats()
+
+    live = SessionReplay(live_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        live_outputs = live.run()
+    # Live inputs are applied a few us after they are journaled, which moves hold extrapolation by ~1e-4
+    live_differences = diff_outputs(live_outputs, tolerance=1e-3)
+    live_modes = [output["recorded"]["mode"] for output in live_outputs]
+
+    session_s = runs["auto"]["session_s"]
+    result = {
+        "session_minutes": args.minutes,
+        "frames": frames,
+        "journal_entries": events,
+        "record_s": round(record_s, 1),
+        "session_bytes": sum(os.path.getsize(os.path.join(session_dir, name)) for name in os.listdir(session_dir)),
+        "replays": runs,
+        "thirty_minute_estimate_s": {name: round(run["wall_s"] * 1800 / session_s, 1) for name, run in runs.items()},
+        "differences": {
+            "auto_vs_recording": len(diff_outputs(outputs["auto"])),
+            "auto_vs_auto_again": len(diff_outputs(outputs["auto"], outputs["auto_again"], tolerance=0.0)),
+            "auto_vs_all": len(diff_outputs(outputs["auto"], outputs["all"], tolerance=0.0)),
+        },
+        "first_differences_vs_recording": diff_outputs(outputs["auto"])[:5],
+        "live_failover": {
+            "frames": len(live_outputs),
+            "recorded_modes": {mode: live_modes.count(mode) for mode in sorted(set(live_modes))},
+            "differences_vs_recording": len(live_differences),
+            "first_differences": live_differences[:5],
+        },
+    }
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+    if not args.keep:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == "__main__":
+    main()
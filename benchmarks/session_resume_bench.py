@@ -0,0 +1,225 @@
+"""
+Time to control restored after a forced disconnect, with and without session resumption.
+
+A server process runs a real WebSocketHandler (main port 19580, control port 19582) that
+publishes a small JPEG at --fps. A client process repeats --cycles times, per mode:
+
+- "resume": drive /control?session=<token> for a moment, abort the TCP connection
+  (no close handshake), reconnect with the token, wait for the catch-up message and
+  send the next input with its "next_seq";
+- "half_open": as "resume", but the old socket is left open, as after a roam where the
+  old connection never saw a FIN; the server must close it;
+- "fresh": the pre-session behaviour: reconnect without a token and open /state to
+  learn the current mode before driving again.
+
+Time to control restored is reconnect start (client) -> that input applied by the
+decision manager (server); both processes share the host clock. /video first-frame
+time is measured with and without ?session (the catch-up keyframe).
+
+Usage:
+    python benchmarks/session_resume_bench.py --cycles 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAIN_PORT = 19580
+CONTROL_PORT = 19582
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 2),
+            "p95": round(values[int(last * 0.95)], 2), "max": round(values[last], 2)}
+
+
+class _StubLinkSampler:
+    snapshot = {"ap_mac": "00:00:00:00:00:00", "signal_strength": -50}
+
+    def start(self):
+        pass
+
+
+def run_server(fps, ready, stop, result_queue):
+    from controllers.websocket_handler import WebSocketHandler
+    from core.teleop_decision_manager import TeleopDecisionManager
+    from services.video_broadcaster import EncodedFrame
+
+    logging.getLogger().setLevel(logging.WARNING)
+    applied = {}
+
+    class BenchHandler(WebSocketHandler):
+        def _apply_control_input(self, channel):
+            control_input = channel.pending_input
+            super()._apply_control_input(channel)
+            if control_input is not None:
+                # The angle carries the client's cycle id, so inputs of different modes cannot collide
+                applied.setdefault(round(control_input.angle * 1000), time.time() * 1000)
+
+    loops = []
+    for name in ("teleop-loop", "teleop-control"):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name=name, daemon=True).start()
+        loops.append(loop)
+    handler = BenchHandler(loops[0], TeleopDecisionManager(), port=MAIN_PORT, link_sampler=_StubLinkSampler(),
+                           control_loop=loops[1], control_port=CONTROL_PORT)
+    time.sleep(0.5)
+    ready.set()
+    jpeg = os.urandom(20 * 1024)
+    frame_id = 0
+    while not stop.is_set():
+        frame_id += 1
+        loops[0].call_soon_threadsafe(handler.video_broadcaster.publish, EncodedFrame(jpeg, frame_id))
+        time.sleep(1.0 / fps)
+    result_queue.put({"applied": applied, "sessions": handler.sessions.get_stats()})
+
+
+def run_client(cycles, result_queue):
+    import websockets
+
+    from controllers.control_protocol import BINARY_SUBPROTOCOL, encode_control_frame
+
+    control_url = f"ws://127.0.0.1:{CONTROL_PORT}/control"
+    reconnect_started = {}
+    catch_up_ms = {"resume": [], "half_open": [], "fresh": []}
+    stale_closed = []
+    cycle_id = [0]
+
+    def next_marker():
+        # Unique angle per measured input, read back by the server
+        cycle_id[0] += 1
+        return cycle_id[0] / 1000
+
+    async def drive(ws, seq, seconds=0.2):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            seq += 1
+            await ws.send(encode_control_frame(0.2, 0.0, seq))
+            await asyncio.sleep(0.02)
+        return seq
+
+    async def session_cycles(mode):
+        ws = await websockets.connect(control_url + "?session=new", subprotocols=[BINARY_SUBPROTOCOL])
+        token = json.loads(await ws.recv())["token"]
+        seq = await drive(ws, 0)
+        for _ in range(cycles):
+            old = ws
+            if mode == "resume":
+                old.transport.abort()
+            marker = next_marker()
+            started = time.time() * 1000
+            ws = await websockets.connect(f"{control_url}?session={token}", subprotocols=[BINARY_SUBPROTOCOL])
+            message = json.loads(await ws.recv())
+            catch_up_ms[mode].append(time.time() * 1000 - started)
+            seq = message["next_seq"]
+            reconnect_started[round(marker * 1000)] = (mode, started)
+            await ws.send(encode_control_frame(0.2, marker, seq))
+            # Give it time to be applied before newer inputs could coalesce it away
+            await asyncio.sleep(0.05)
+            seq = await drive(ws, seq)
+            if mode == "half_open":
+                try:
+                    await asyncio.wait_for(old.wait_closed(), timeout=1.0)
+                    stale_closed.append(old.close_code)
+                except asyncio.TimeoutError:
+                    stale_closed.append(None)
+        await ws.close()
+
+    async def fresh_cycles():
+        ws = await websockets.connect(control_url, subprotocols=[BINARY_SUBPROTOCOL])
+        await drive(ws, 0)
+        for _ in range(cycles):
+            ws.transport.abort()
+            marker = next_marker()
+            started = time.time() * 1000
+            ws = await websockets.connect(control_url, subprotocols=[BINARY_SUBPROTOCOL])
+            async with websockets.connect(f"ws://127.0.0.1:{MAIN_PORT}/state") as state_ws:
+                await state_ws.recv()
+            catch_up_ms["fresh"].append(time.time() * 1000 - started)
+            reconnect_started[round(marker * 1000)] = ("fresh", started)
+            await ws.send(encode_control_frame(0.2, marker, 1))
+            await asyncio.sleep(0.05)
+            await drive(ws, 1)
+        await ws.close()
+
+    async def first_frame(session):
+        started = time.perf_counter()
+        url = f"ws://127.0.0.1:{MAIN_PORT}/video" + ("?session=new" if session else "")
+        async with websockets.connect(url, max_size=None) as ws:
+            while True:
+                message = await ws.recv()
+                if isinstance(message, bytes):
+                    return (time.perf_counter() - started) * 1000
+
+    async def main():
+        await session_cycles("resume")
+        await session_cycles("half_open")
+        await fresh_cycles()
+        video = {"plain": [], "session": []}
+        for _ in range(min(cycles, 10)):
+            video["plain"].append(await first_frame(False))
+            video["session"].append(await first_frame(True))
+        return video
+
+    video = asyncio.run(main())
+    result_queue.put({"reconnect_started": reconnect_started, "catch_up_ms": catch_up_ms,
+                      "stale_close_codes": stale_closed, "video_first_frame_ms": video})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--fps", type=float, default=2.0, help="server video rate (low, so catch-up matters)")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    server_results, client_results = context.Queue(), context.Queue()
+    server = context.Process(target=run_server, args=(args.fps, ready, stop, server_results))
+    server.start()
+    ready.wait(timeout=30)
+    client = context.Process(target=run_client, args=(args.cycles, client_results))
+    client.start()
+    client_result = client_results.get(timeout=120 + args.cycles * 3)
+    client.join()
+    stop.set()
+    server_result = server_results.get(timeout=30)
+    server.join()
+
+    restored = {"resume": [], "half_open": [], "fresh": []}
+    for marker, (mode, started) in client_result["reconnect_started"].items():
+        applied = server_result["applied"].get(marker)
+        if applied is not None:
+            restored[mode].append(applied - started)
+
+    result = {
+        "cycles": args.cycles,
+        "control_restored_ms": {mode: percentiles(values) for mode, values in restored.items()},
+        "catch_up_ms": {mode: percentiles(values) for mode, values in client_result["catch_up_ms"].items()},
+        "stale_socket_closed_with": sorted(set(str(code) for code in client_result["stale_close_codes"])),
+        "video_first_frame_ms": {key: percentiles(values)
+                                 for key, values in client_result["video_first_frame_ms"].items()},
+        "sessions": server_result["sessions"],
+    }
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
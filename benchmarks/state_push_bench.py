@@ -0,0 +1,177 @@
+"""
+Mode-change latency to the UI: /state deltas vs the once-a-second /telemetry user_mode.
+
+A server process runs a real WebSocketHandler (autonomy allowed). A client process sends
+/control inputs at --control-hz (so the state also changes on every input), flips the
+requested source over /autonomy every --switch-interval-ms, and measures the time from
+sending the switch to seeing the new mode on /state and on /telemetry. Client and server
+share the host clock; all times are measured in the client.
+
+Usage:
+    python benchmarks/state_push_bench.py --switches 40 --control-hz 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 19380
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    last = len(values) - 1
+    return {"count": len(values), "p50": round(values[int(last * 0.5)], 2),
+            "p95": round(values[int(last * 0.95)], 2), "max": round(values[last], 2)}
+
+
+class _StubLinkSampler:
+    snapshot = {"ap_mac": "00:00:00:00:00:00", "signal_strength": -50}
+
+    def start(self):
+        pass
+
+
+def run_server(ready, stop, result_queue):
+    from controllers.websocket_handler import WebSocketHandler
+    from core.teleop_decision_manager import TeleopDecisionManager
+
+    logging.getLogger().setLevel(logging.WARNING)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    decision_manager = TeleopDecisionManager()
+    decision_manager.autonomy_enabled = True
+    handler = WebSocketHandler(loop, decision_manager, port=PORT, link_sampler=_StubLinkSampler())
+    time.sleep(0.5)
+    ready.set()
+    stop.wait()
+    result_queue.put({"state_version": decision_manager.state.snapshot.version,
+                      "mode_switches": handler.mode_switches})
+
+
+def run_client(switches, switch_interval_ms, control_hz, result_queue):
+    import websockets
+
+    from controllers.control_protocol import BINARY_SUBPROTOCOL, encode_control_frame
+
+    switched_at = {}
+    seen = {"state": {}, "telemetry": {}}
+    deltas = {"count": 0, "bytes": 0}
+    def observe(channel, mode):
+        pending = switched_at.get(mode)
+        if pending is not None and mode not in seen[channel]:
+            seen[channel][mode] = (time.perf_counter() - pending) * 1000
+
+    async def state(deadline):
+        mode = None
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/state") as ws:
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                data = json.loads(message)
+                changes = data["state"] if data["type"] == "snapshot" else data["changes"]
+                deltas["count"] += 1
+                deltas["bytes"] += len(message)
+                if "source" in changes and changes["source"] != mode:
+                    mode = changes["source"]
+                    observe("state", mode)
+
+    async def telemetry(deadline):
+        mode = None
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/telemetry", max_size=None) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    data = json.loads(await asyncio.wait_for(ws.recv(), timeout=0.5))
+                except asyncio.TimeoutError:
+                    continue
+                if data["user_mode"] != mode:
+                    mode = data["user_mode"]
+                    observe("telemetry", mode)
+
+    async def control(deadline):
+        seq = 0
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/control", subprotocols=[BINARY_SUBPROTOCOL]) as ws:
+            while time.monotonic() < deadline:
+                seq += 1
+                await ws.send(encode_control_frame(0.2, (seq % 20) / 20, seq))
+                await asyncio.sleep(1.0 / control_hz)
+
+    async def autonomy(deadline):
+        await asyncio.sleep(1.0)
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/autonomy") as ws:
+            for i in range(switches):
+                requested = i % 2 == 0
+                mode = "local_angle" if requested else "user"
+                # Forget the previous switch to this mode so only this one is timed
+                for channel in seen.values():
+                    channel.pop(mode, None)
+                switched_at[mode] = time.perf_counter()
+                switch_deadline = time.monotonic() + switch_interval_ms / 1000
+                while time.monotonic() < switch_deadline:
+                    # Repeated as the heartbeat, well inside the autonomy deadline
+                    await ws.send(json.dumps({"autonomy": requested}))
+                    await asyncio.sleep(0.05)
+                for channel in ("state", "telemetry"):
+                    if mode in seen[channel]:
+                        results[channel].append(seen[channel][mode])
+        await asyncio.sleep(0.1)
+
+    results = {"state": [], "telemetry": []}
+
+    async def main():
+        deadline = time.monotonic() + 1.5 + switches * switch_interval_ms / 1000
+        await asyncio.gather(state(deadline), telemetry(deadline), control(deadline), autonomy(deadline))
+
+    asyncio.run(main())
+    result_queue.put({"switches": switches,
+                      "state_ms": percentiles(results["state"]),
+                      "telemetry_ms": percentiles(results["telemetry"]),
+                      "state_messages": deltas["count"],
+                      "state_mean_bytes": round(deltas["bytes"] / max(1, deltas["count"]), 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--switches", type=int, default=40)
+    parser.add_argument("--switch-interval-ms", type=float, default=1500.0,
+                        help="longer than the telemetry interval, so every switch is seen on /telemetry")
+    parser.add_argument("--control-hz", type=float, default=50.0)
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    server_results, client_results = context.Queue(), context.Queue()
+    server = context.Process(target=run_server, args=(ready, stop, server_results))
+    server.start()
+    ready.wait(timeout=30)
+    client = context.Process(target=run_client, args=(args.switches, args.switch_interval_ms, args.control_hz,
+                                                      client_results))
+    client.start()
+    result = client_results.get(timeout=60 + args.switches * args.switch_interval_ms / 1000)
+    client.join()
+    stop.set()
+    result["server"] = server_results.get(timeout=30)
+    server.join()
+
+    document = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measures server-side CPU cost of the /video broadcaster as viewers are added.
+
+Each frame is encoded once and fanned out to N local websocket viewers that run in
+a separate process, so the CPU time measured here is only the server's share.
+
+Usage:
+    python benchmarks/video_broadcast_bench.py --viewers 1 2 4 8 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import websockets
+from websockets.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.video_broadcaster import EncodedFrame, VideoBroadcaster  # noqa: E402
+
+
+def _run_viewers(url, count, seconds, slow_viewers):
+    async def viewer(index):
+        received = 0
+        async with websockets.connect(url, max_size=None) as ws:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                except websockets.exceptions.ConnectionClosed:
+                    break
+                received += 1
+                if index < slow_viewers:
+                    await asyncio.sleep(0.2)
+        return received
+
+    async def main():
+        return await asyncio.gather(*(viewer(i) for i in range(count)))
+
+    asyncio.run(main())
+
+
+async def _bench(viewers, seconds, fps, frame_size, slow_viewers, port):
+    broadcaster = VideoBroadcaster()
+    server = await serve(broadcaster.serve, "127.0.0.1", port, compression=None)
+
+    process = multiprocessing.Process(target=_run_viewers,
+                                      args=(f"ws://127.0.0.1:{port}/video", viewers, seconds, slow_viewers))
+    process.start()
+
+    while len(broadcaster.subscribers) < viewers:
+        await asyncio.sleep(0.01)
+
+    frame = os.urandom(frame_size)
+    interval = 1.0 / fps
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    next_tick = wall_start
+    while time.monotonic() - wall_start < seconds - 0.5:
+        broadcaster.publish(EncodedFrame(frame))
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+    cpu_used = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    stats = broadcaster.get_stats()
+    server.close()
+    await server.wait_closed()
+    process.join()
+
+    return {
+        "viewers": viewers,
+        "slow_viewers": min(slow_viewers, viewers),
+        "frames_published": stats["frames_published"],
+        "cpu_percent": round(100.0 * cpu_used / wall, 2),
+        "frames_sent": sum(s["frames_sent"] for s in stats["subscribers"]),
+        "frames_dropped": sum(s["frames_dropped"] for s in stats["subscribers"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--frame-size", type=int, default=40_000, help="bytes per encoded frame")
+    parser.add_argument("--slow-viewers", type=int, default=0, help="viewers that read at 5 fps")
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    results = []
+    for count in args.viewers:
+        result = asyncio.run(_bench(count, args.seconds, args.fps, args.frame_size, args.slow_viewers, args.port))
+        results.append(result)
+        print(json.dumps(result))
+
+    base = results[0]["cpu_percent"]
+    for result in results[1:]:
+        extra = result["viewers"] - results[0]["viewers"]
+        per_viewer = (result["cpu_percent"] - base) / extra if extra else 0.0
+        print(json.dumps({"viewers": result["viewers"], "cpu_percent_per_added_viewer": round(per_viewer, 3)}))
+
+
+if __name__ == "__main__":
+    main()
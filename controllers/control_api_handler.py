@@ -1,59 +1,127 @@
-from flask import Flask, jsonify, request
-from threading import Thread
-from flask_cors import CORS
+import asyncio
+import logging
+import threading
+
+import aiohttp_cors
+from aiohttp import web
+
+from services.latency_metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 
 class ControlAPIHandler:
     """
-    A lightweight Flask-based HTTP API handler for interacting with
+    A lightweight aiohttp-based HTTP API handler for interacting with
     the car's control state.
 
+    Runs on the TeleopControlPart event loop, so handlers touch the decision
+    manager from the same thread as the websocket handlers.
+
     Provides endpoints for toggling and querying:
     - recording state (/recording)
     - autonomy mode (/autonomy)
+    - pipeline latency histograms (/metrics)
+    - recent runtime resource samples (/resources?since=<ms>)
+    - startup readiness and timing (/ready, 503 until ready)
     """
-    def __init__(self, teleop_control_part):
+    def __init__(self, teleop_control_part, host="0.0.0.0", port=8081):
         self.teleop_control_part = teleop_control_part
-        self.flask_app = Flask(__name__)
-        CORS(self.flask_app)
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.runner = None
+        self.listening = threading.Event()
         self.setup_routes()
 
     def setup_routes(self):
-        self.flask_app.add_url_rule('/ping', 'ping', self.ping, methods=['GET'])
-        self.flask_app.add_url_rule('/recording', 'get_recording', self.get_recording, methods=['GET'])
-        self.flask_app.add_url_rule('/recording', 'toggle_recording', self.toggle_recording, methods=['POST'])
-        self.flask_app.add_url_rule('/autonomy', 'get_autonomy', self.get_autonomy, methods=['GET'])
-        self.flask_app.add_url_rule('/autonomy', 'set_autonomy', self.set_autonomy, methods=['POST'])
+        self.app.router.add_get('/ping', self.ping)
+        self.app.router.add_get('/recording', self.get_recording)
+        self.app.router.add_post('/recording', self.toggle_recording)
+        self.app.router.add_get('/autonomy', self.get_autonomy)
+        self.app.router.add_post('/autonomy', self.set_autonomy)
+        self.app.router.add_get('/metrics', self.get_metrics)
+        self.app.router.add_get('/resources', self.get_resources)
+        self.app.router.add_get('/ready', self.get_ready)
+
+        cors = aiohttp_cors.setup(self.app, defaults={
+            "*": aiohttp_cors.ResourceOptions(allow_credentials=True, expose_headers="*", allow_headers="*")
+        })
+        for route in list(self.app.router.routes()):
+            cors.add(route)
 
     def start(self):
-        Thread(target=lambda: self.flask_app.run(host="0.0.0.0", port=8081, debug=False, use_reloader=False), daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self.start_server(), self.teleop_control_part.loop)
+
+    async def start_server(self):
+        try:
+            self.runner = web.AppRunner(self.app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, self.host, self.port).start()
+            logger.info(f"HTTP API started on http://{self.host}:{self.port}")
+            self.listening.set()
+        except Exception as e:
+            logger.error(f"HTTP API server error: {e}")
+
+    async def stop_server(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    @property
+    def decision_manager(self):
+        return self.teleop_control_part.teleop_decision_manager
+
+    async def get_ready(self, request):
+        startup = self.teleop_control_part.startup
+        return web.json_response(startup.get_stats(), status=200 if startup.ready else 503)
 
-    def ping(self):
-        print(">>> /ping HIT")
-        return jsonify({"status": "ok"})
+    async def ping(self, request):
+        logger.debug(">>> /ping HIT")
+        return web.json_response({"status": "ok"})
 
-    def toggle_recording(self):
-        self.teleop_control_part.teleop_decision_manager.recording_enabled = not self.teleop_control_part.teleop_decision_manager.recording_enabled
-        return jsonify({"recording": self.teleop_control_part.teleop_decision_manager.recording_enabled})
+    async def toggle_recording(self, request):
+        self.decision_manager.recording_enabled = not self.decision_manager.recording_enabled
+        return web.json_response({"recording": self.decision_manager.recording_enabled})
 
-    def get_recording(self):
+    async def get_recording(self, request):
         try:
-            print(">>> GET /recording")
-            return jsonify({"recording": self.teleop_control_part.teleop_decision_manager.recording_enabled})
+            response = {"recording": self.decision_manager.recording_enabled}
+            # Parts without the native recorder (e.g. benchmark stand-ins) answer as before
+            recorder = getattr(self.teleop_control_part, "session_recorder", None)
+            if recorder is not None:
+                response["recorder"] = recorder.get_stats()
+            return web.json_response(response)
         except Exception as e:
-            print(f"❌ ERROR in /recording: {e}")
-            return jsonify({"error": str(e)}), 500
+            logger.error(f"ERROR in /recording: {e}")
+            return web.json_response({"error": str(e)}, status=500)
 
-    def set_autonomy(self):
+    async def set_autonomy(self, request):
         try:
-            data = request.get_json()
+            data = await request.json()
             new_value = data.get("autonomy")
             if new_value is None:
-                return jsonify({"error": "Missing autonomy value"}), 400
-            self.teleop_control_part.teleop_decision_manager.autonomy_enabled = bool(new_value)
-            return jsonify({"autonomy": self.teleop_control_part.teleop_decision_manager.autonomy_enabled})
+                return web.json_response({"error": "Missing autonomy value"}, status=400)
+            self.decision_manager.autonomy_enabled = bool(new_value)
+            return web.json_response({"autonomy": self.decision_manager.autonomy_enabled})
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
+            return web.json_response({"error": str(e)}, status=500)
 
-    def get_autonomy(self):
-        return jsonify({"autonomy": self.teleop_control_part.teleop_decision_manager.autonomy_enabled})
\ No newline at end of file
+    async def get_autonomy(self, request):
+        return web.json_response({"autonomy": self.decision_manager.autonomy_enabled})
+
+    async def get_metrics(self, request):
+        return web.json_response({
+            "latency_ms": metrics.get_snapshot(),
+            "video": self.teleop_control_part.video_streamer.get_stats(),
+        })
+
+    async def get_resources(self, request):
+        sampler = self.teleop_control_part.runtime_sampler
+        if sampler is None:
+            return web.json_response({"error": "Runtime sampler disabled"}, status=404)
+        try:
+            since = request.query.get("since")
+            samples = sampler.get_samples(int(since) if since else None)
+        except ValueError:
+            return web.json_response({"error": "Invalid since value"}, status=400)
+        return web.json_response({"stats": sampler.get_stats(), "samples": samples})
@@ -0,0 +1,147 @@
+import json
+import struct
+import time
+
+# Offered as a websocket subprotocol; clients that do not ask for it keep using JSON text frames.
+BINARY_SUBPROTOCOL = "teleop.bin.v1"
+
+# version u8, flags u8, sequence u32, client send time ms f64, throttle f32, angle f32
+CONTROL_FRAME = struct.Struct("<BBIdff")
+CONTROL_FRAME_VERSION = 1
+
+
+class ControlInput:
+    __slots__ = ("throttle", "angle", "seq", "client_time_ms", "received_ns")
+
+    def __init__(self, throttle, angle, seq=None, client_time_ms=None, received_ns=None):
+        self.throttle = throttle
+        self.angle = angle
+        self.seq = seq
+        self.client_time_ms = client_time_ms
+        self.received_ns = time.monotonic_ns() if received_ns is None else received_ns
+
+
+def encode_control_frame(throttle, angle, seq, client_time_ms=None):
+    if client_time_ms is None:
+        client_time_ms = time.time() * 1000
+    return CONTROL_FRAME.pack(CONTROL_FRAME_VERSION, 0, seq & 0xFFFFFFFF, client_time_ms, throttle, angle)
+
+
+def decode_control_message(message):
+    """
+    Parses a /control message into a ControlInput.
+
+    Binary frames follow CONTROL_FRAME. Text frames are the original JSON
+    {"throttle": .., "angle": ..}, optionally with "seq" and "t" (client send time, ms).
+    Raises ValueError on malformed input.
+    """
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        if len(message) != CONTROL_FRAME.size:
+            raise ValueError(f"control frame must be {CONTROL_FRAME.size} bytes, got {len(message)}")
+        version, _, seq, client_time_ms, throttle, angle = CONTROL_FRAME.unpack(message)
+        if version != CONTROL_FRAME_VERSION:
+            raise ValueError(f"unsupported control frame version {version}")
+        return ControlInput(throttle, angle, seq, client_time_ms)
+
+    data = json.loads(message)
+    return ControlInput(data.get("throttle", 0.0), data.get("angle", 0.0), data.get("seq"), data.get("t"))
+
+
+class ControlChannel:
+    """
+    Per-connection ordering and statistics for /control inputs.
+
+    - Inputs with a sequence number not newer than the last accepted one are dropped as reordered.
+    - Inputs whose one-way delay exceeds the best observed delay by more than `max_age_ms`
+      are dropped as too old. Only relative delay is used, so client and car clocks need not agree.
+    - Gaps in the sequence are counted as lost packets.
+    """
+
+    def __init__(self, remote, max_age_ms=150, rate_window_s=1.0):
+        self.remote = remote
+        self.max_age_ms = max_age_ms
+        self.rate_window_s = rate_window_s
+
+        self.last_seq = None
+        self.min_offset_ms = None
+
+        # Newest accepted input not yet handed to the decision manager
+        self.pending_input = None
+
+        self.received = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.dropped_reordered = 0
+        self.dropped_old = 0
+        self.lost = 0
+        self.packet_rate = 0.0
+
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def _update_rate(self):
+        self._window_count += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.rate_window_s:
+            self.packet_rate = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+    def accept(self, control_input: ControlInput, now_ms=None) -> bool:
+        """`now_ms` is the car's wall-clock receive time; session replay passes the recorded one."""
+        self.received += 1
+        self._update_rate()
+
+        if control_input.seq is not None:
+            if self.last_seq is not None:
+                # Serial number arithmetic so the u32 counter may wrap
+                delta = (control_input.seq - self.last_seq) & 0xFFFFFFFF
+                if delta == 0 or delta >= 0x80000000:
+                    self.dropped_reordered += 1
+                    if delta and self.lost:
+                        # It arrived late rather than not at all
+                        self.lost -= 1
+                    return False
+                self.lost += delta - 1
+            self.last_seq = control_input.seq
+
+        if control_input.client_time_ms is not None:
+            now_ms = time.time() * 1000 if now_ms is None else now_ms
+            offset_ms = now_ms - control_input.client_time_ms
+            if self.min_offset_ms is None or offset_ms < self.min_offset_ms:
+                self.min_offset_ms = offset_ms
+            if offset_ms - self.min_offset_ms > self.max_age_ms:
+                self.dropped_old += 1
+                return False
+
+        return True
+
+    def offer(self, control_input: ControlInput) -> bool:
+        """Stores the input for the next apply; returns True if an apply must be scheduled."""
+        if self.pending_input is not None:
+            self.coalesced += 1
+            self.pending_input = control_input
+            return False
+        self.pending_input = control_input
+        return True
+
+    def take(self):
+        control_input, self.pending_input = self.pending_input, None
+        if control_input is not None:
+            self.applied += 1
+        return control_input
+
+    def get_stats(self):
+        expected = self.received + self.lost
+        return {
+            "remote": str(self.remote),
+            "received": self.received,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "dropped_reordered": self.dropped_reordered,
+            "dropped_old": self.dropped_old,
+            "lost": self.lost,
+            "loss_ratio": round(self.lost / expected, 4) if expected else 0.0,
+            "packet_rate": round(self.packet_rate, 1),
+        }
@@ -0,0 +1,100 @@
+import asyncio
+import secrets
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+def split_session_path(path):
+    """Returns (path, session token or None) for a request path like "/control?session=<token>"."""
+    parts = urlsplit(path)
+    tokens = parse_qs(parts.query).get("session")
+    return parts.path, tokens[0] if tokens else None
+
+
+class ClientSession:
+    """
+    One operator's connections across /control, /video, /telemetry and /autonomy.
+
+    Outlives its sockets for the registry's TTL, so a client that reconnects after a
+    roam keeps its control channel (sequence numbers and clock offset) instead of
+    starting over.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self.created = time.monotonic()
+        self.last_seen = self.created
+        # endpoint -> (websocket, loop) of the live connection
+        self.connections = {}
+        self.control_channel = None
+        self.resumes = 0
+
+    def is_idle(self):
+        return not self.connections
+
+
+class SessionRegistry:
+    """
+    Session tokens for websocket clients that ask for one with ?session=new (or resume
+    with ?session=<token>). Clients that do not ask are served exactly as before.
+
+    Shared by both server loops, so every method takes the lock. A session with no live
+    connection for `ttl_s` is forgotten on the next open().
+    """
+
+    def __init__(self, ttl_s=30.0):
+        self.ttl_s = ttl_s
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def _expire(self, now):
+        for token, session in list(self.sessions.items()):
+            if session.is_idle() and now - session.last_seen > self.ttl_s:
+                del self.sessions[token]
+                self.expired += 1
+
+    def attach(self, token, endpoint, websocket):
+        """
+        Attaches the connection to the session named by `token` (a new one for "new" or an
+        unknown/expired token). Returns (session, resumed, stale) where `stale` is the
+        (websocket, loop) this connection replaces on the same endpoint, e.g. a socket
+        that never saw the roam, or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self.sessions.get(token)
+            resumed = session is not None
+            if session is None:
+                session = ClientSession(secrets.token_urlsafe(12))
+                self.sessions[session.token] = session
+                self.created += 1
+            else:
+                session.resumes += 1
+                self.resumed += 1
+            stale = session.connections.get(endpoint)
+            session.connections[endpoint] = (websocket, asyncio.get_running_loop())
+            session.last_seen = now
+        return session, resumed, stale
+
+    def detach(self, session, endpoint, websocket):
+        with self._lock:
+            current = session.connections.get(endpoint)
+            if current is not None and current[0] is websocket:
+                del session.connections[endpoint]
+            session.last_seen = time.monotonic()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self.sessions),
+                "connected": sum(1 for s in self.sessions.values() if not s.is_idle()),
+                "created": self.created,
+                "resumed": self.resumed,
+                "expired": self.expired,
+                "ttl_s": self.ttl_s,
+            }
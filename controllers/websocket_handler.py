@@ -1,13 +1,20 @@
 import asyncio
 import json
 import logging
+import threading
+import time
 from enum import Enum
-import subprocess
-import re
 import websockets
 from websockets.server import serve
 
+from controllers.control_protocol import BINARY_SUBPROTOCOL, ControlChannel, decode_control_message
+from controllers.session_registry import SessionRegistry, split_session_path
+from core.heartbeat_watchdog import HeartbeatWatchdog
 from core.teleop_decision_manager import TeleopDecisionManager, ControlSource
+from services.latency_metrics import metrics
+from services.link_monitor import LinkStateSampler, get_wifi_details  # noqa: F401 (re-exported)
+from services.state_broadcaster import StateBroadcaster
+from services.video_broadcaster import VIDEO_FRAMED_SUBPROTOCOL, VIDEO_TILES_SUBPROTOCOL, VideoBroadcaster
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -19,86 +26,205 @@ class ConnectionState(Enum):
     CONNECTED = 2
 
 
-def get_wifi_details(interface="wlan0"):
+class WebSocketHandler:
     """
-    Retrieves the current connected BSSID and signal strength using `iw`.
-    Returns a dictionary with 'ap_mac' and 'signal_strength'.
+    WebSocket endpoints for the car: /control, /autonomy, /video, /telemetry and /state on `port`.
+
+    /state pushes the decision manager's versioned control state (source, autonomy and
+    recording flags, last input) as a snapshot and then a delta per change, so clients
+    do not need to poll GET /recording and GET /autonomy.
+
+    Clients may add ?session=new to /control, /video, /telemetry and /autonomy, and
+    reconnect with ?session=<token> after a drop. They first get a JSON catch-up message
+    {"type": "session", "token", "resumed", "version", "mode", "state"} (plus "next_seq"
+    on /control, whose sequence state and clock offset survive the reconnect), then the
+    newest keyframe on /video or a telemetry message at once on /telemetry. A socket the
+    resumed connection replaces is closed.
+
+    With a `control_loop` and `control_port`, /control and /autonomy are also served
+    by a second server on that loop (its own thread), so control-critical messages are
+    never queued behind video and telemetry sends on the main loop. Both servers accept
+    both paths; clients that use `control_port` get the isolation.
     """
-    details = {"ap_mac": None, "signal_strength": None}
-
-    try:
-        result = subprocess.run(
-            ["iw", "dev", interface, "link"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            text=True,
-            check=True
-        )
-        output = result.stdout
-
-        # Extract BSSID (AP MAC)
-        bssid_match = re.search(r"Connected to ([\da-fA-F:]{17})", output)
-        if bssid_match:
-            details["ap_mac"] = bssid_match.group(1)
-
-        # Extract signal strength (RSSI)
-        signal_match = re.search(r"signal: (-\d+)", output)
-        if signal_match:
-            details["signal_strength"] = float(signal_match.group(1))
-
-    except subprocess.CalledProcessError as e:
-        logger.error(f"`iw` command failed: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error while reading Wi-Fi info: {e}")
-
-    return details
-
-
-class WebSocketHandler:
     def __init__(self, loop: asyncio.AbstractEventLoop, teleop_decisin_manager: TeleopDecisionManager,
-                 host="0.0.0.0", port=8080):
+                 host="0.0.0.0", port=8080, control_max_age_ms=150, link_sampler: LinkStateSampler = None,
+                 telemetry_interval_s=1.0, autonomy_deadline_ms=200, control_loop=None, control_port=None,
+                 video_max_age_ms=None, session_ttl_s=30.0):
         self.host = host
         self.port = port
+        self.control_port = control_port
+        self.control_loop = control_loop if control_loop is not None else loop
+        self.control_max_age_ms = control_max_age_ms
+        self.autonomy_deadline_ms = autonomy_deadline_ms
+        self.telemetry_interval_s = telemetry_interval_s
+        self.telemetry_ticks_skipped = 0
 
         self.autonomy_connection_state = ConnectionState.DISCONNECTED
 
         self.teleop_decisin_manager = teleop_decisin_manager
         self.control_client = None
-        self.video_client = None
-        self.telemetry_client = None
+        self.control_channels = {}
+        self.video_broadcaster = VideoBroadcaster(max_age_ms=video_max_age_ms)
+        self.telemetry_clients = {}
         self.autonomy_client = None
+        self.state_broadcaster = StateBroadcaster(teleop_decisin_manager.state, loop)
+        self.sessions = SessionRegistry(ttl_s=session_ttl_s)
+
+        # Autonomy link heartbeat: fails over to AUTONOMOUS right at the deadline
+        self.autonomy_watchdog = HeartbeatWatchdog(self.control_loop, deadline_ms=autonomy_deadline_ms,
+                                                   on_expired=self._on_autonomy_expired,
+                                                   on_restored=self._on_autonomy_restored)
+        self.mode_switch_listeners = []
+        self.mode_switches = 0
+        self.message_listeners = []
+
+        # Shared Wi-Fi link state; sampled in the background, never on the event loop
+        self.link_sampler = link_sampler if link_sampler is not None else LinkStateSampler()
+        self.link_sampler.start()
+
+        # Extra sections merged into each telemetry message: name -> callable returning a dict
+        self.telemetry_sources = {}
+        self.add_telemetry_source("control", self.get_control_stats)
+        self.add_telemetry_source("latency", metrics.get_snapshot)
+        self.add_telemetry_source("autonomy", self.get_autonomy_stats)
+        self.add_telemetry_source("budgets", self.get_budget_stats)
+        self.add_telemetry_source("state", self.state_broadcaster.get_stats)
+        self.add_telemetry_source("sessions", self.sessions.get_stats)
+
+        # Set from the loops once the servers accept connections (see TeleopControlPart warm-up)
+        self.listening = threading.Event()
+        self.control_listening = threading.Event()
+        if control_port is None:
+            self.control_listening.set()
 
         self.loop = loop
         # Start dedicated WebRTC client in a thread-safe manner.
         asyncio.run_coroutine_threadsafe(self.start_server(), self.loop)
+        if control_port is not None:
+            asyncio.run_coroutine_threadsafe(self.start_control_server(), self.control_loop)
 
         self.counter = 0
 
+    @property
+    def wifi_details(self):
+        return self.link_sampler.snapshot
+
+    def add_message_listener(self, listener):
+        """
+        `listener(endpoint, event, message)` is called on the receiving loop for every /control
+        and /autonomy message (event "message") and connection ("open", or "resume" for a
+        /control session that keeps its channel; "close" on /autonomy). Used to journal
+        sessions for replay, so it must return quickly.
+        """
+        self.message_listeners.append(listener)
+
+    def _notify_message(self, endpoint, event, message=None):
+        for listener in self.message_listeners:
+            try:
+                listener(endpoint, event, message)
+            except Exception as e:
+                logger.error(f"Error in message listener: {e}")
+
+    def add_telemetry_source(self, name, provider):
+        self.telemetry_sources[name] = provider
+
     async def start_server(self):
         logger.info(f"Starting WebSocket server on ws://{self.host}:{self.port}")
         try:
-            server = await serve(self.router, self.host, self.port)
+            # JPEG frames do not compress; per-message deflate would re-compress every frame once per viewer
+            server = await serve(self.router, self.host, self.port, compression=None,
+                                 subprotocols=[BINARY_SUBPROTOCOL, VIDEO_FRAMED_SUBPROTOCOL,
+                                               VIDEO_TILES_SUBPROTOCOL])
             logger.info(f"WebSocket server started on ws://{self.host}:{self.port}")
+            self.listening.set()
+            telemetry_task = asyncio.ensure_future(self._telemetry_loop())
             await server.wait_closed()
+            telemetry_task.cancel()
         except Exception as e:
             logger.error(f"WebSocket server error: {e}")
 
+    async def start_control_server(self):
+        try:
+            server = await serve(self.control_router, self.host, self.control_port, compression=None,
+                                 subprotocols=[BINARY_SUBPROTOCOL])
+            logger.info(f"Control WebSocket server started on ws://{self.host}:{self.control_port}")
+            self.control_listening.set()
+            await server.wait_closed()
+        except Exception as e:
+            logger.error(f"Control WebSocket server error: {e}")
+
+    async def control_router(self, websocket, path):
+        path, session_token = split_session_path(path)
+        if path == "/control":
+            await self.control_handler(websocket, session_token)
+        elif path == "/autonomy":
+            await self.autonomy_handler(websocket, session_token)
+        else:
+            await websocket.close(code=4004, reason="Only /control and /autonomy on this port")
+
     async def router(self, websocket, path):
+        path, session_token = split_session_path(path)
         if path == "/control":
-            await self.control_handler(websocket)
+            await self.control_handler(websocket, session_token)
         elif path == "/video":
-            await self.video_handler(websocket)
+            await self.video_handler(websocket, session_token)
         elif path == "/telemetry":
-            await self.telemetry_handler(websocket)
+            await self.telemetry_handler(websocket, session_token)
         elif path == "/autonomy":
-            await self.autonomy_handler(websocket)
+            await self.autonomy_handler(websocket, session_token)
+        elif path == "/state":
+            await self.state_handler(websocket)
         else:
             await websocket.close(code=1003, reason="Unknown path")
 
-    async def control_handler(self, websocket):
+    def _attach_session(self, session_token, endpoint, websocket):
+        """Returns (session, resumed), or (None, False) for clients without ?session=."""
+        if session_token is None:
+            return None, False
+        session, resumed, stale = self.sessions.attach(session_token, endpoint, websocket)
+        if stale is not None and stale[0] is not websocket:
+            # The old socket may belong to the other server loop; close it there
+            stale_socket, stale_loop = stale
+            closing = stale_socket.close(code=4000, reason="Session resumed on a new connection")
+            if stale_loop is asyncio.get_running_loop():
+                asyncio.ensure_future(closing)
+            else:
+                asyncio.run_coroutine_threadsafe(closing, stale_loop)
+        if resumed:
+            logger.info(f"Session {session.token} resumed on /{endpoint}: {websocket.remote_address}")
+        return session, resumed
+
+    def _session_message(self, session, resumed, channel: ControlChannel = None):
+        state = self.teleop_decisin_manager.state.snapshot
+        message = {
+            "type": "session",
+            "token": session.token,
+            "resumed": resumed,
+            "version": state.version,
+            "mode": self.teleop_decisin_manager.select_active_source(state).value,
+            "state": state.to_dict(),
+        }
+        if channel is not None:
+            message["next_seq"] = (channel.last_seq + 1) & 0xFFFFFFFF if channel.last_seq is not None else None
+        return json.dumps(message)
+
+    async def control_handler(self, websocket, session_token=None):
+        session, resumed = self._attach_session(session_token, "control", websocket)
+        channel = session.control_channel if resumed else None
+        if channel is None:
+            channel = ControlChannel(websocket.remote_address, self.control_max_age_ms)
+            self._notify_message("control", "open")
+        else:
+            channel.remote = websocket.remote_address
+            self._notify_message("control", "resume")
         self.control_client = websocket
-        logger.info(f"Control client connected: {websocket.remote_address}")
+        self.control_channels[websocket] = channel
+        logger.info(f"Control client connected: {websocket.remote_address} "
+                    f"(protocol: {websocket.subprotocol or 'json'})")
         try:
+            if session is not None:
+                session.control_channel = channel
+                await websocket.send(self._session_message(session, resumed, channel))
             while True:
                 try:
                     message = await websocket.recv()
@@ -108,56 +234,106 @@ class WebSocketHandler:
                     logger.error(f"Error handling control connection: {e}")
                     break
         finally:
+            self.control_channels.pop(websocket, None)
+            if session is not None:
+                self.sessions.detach(session, "control", websocket)
             if self.control_client == websocket:
                 self.control_client = None
                 logger.info(f"Control client fully disconnected: {websocket.remote_address}")
 
-    async def autonomy_handler(self, websocket):
+    async def autonomy_handler(self, websocket, session_token=None):
+        session, resumed = self._attach_session(session_token, "autonomy", websocket)
         self.autonomy_client = websocket
         self.autonomy_connection_state = ConnectionState.CONNECTED
         logger.info(f"Autonomy client connected: {websocket.remote_address}")
+        self.autonomy_watchdog.arm()
+        self._notify_message("autonomy", "open")
 
         try:
-            while True:
+            if session is not None:
+                await websocket.send(self._session_message(session, resumed))
+            async for message in websocket:
+                # Every message is a heartbeat; the watchdog fails over if they stop
+                self.autonomy_watchdog.beat()
+                if self.message_listeners:
+                    self._notify_message("autonomy", "message", message)
                 try:
-                    message = await asyncio.wait_for(websocket.recv(), timeout=0.2)
-
-                    if self.autonomy_connection_state != ConnectionState.CONNECTED:
-                        self.autonomy_connection_state = ConnectionState.CONNECTED
-
                     data = json.loads(message)
-                    mode = data.get("autonomy", "")
-
-                    if mode:
-                        self.teleop_decisin_manager.set_control_source(ControlSource.AUTONOMOUS)
-                    else:
-                        self.teleop_decisin_manager.set_control_source(ControlSource.USER)
-
-                except asyncio.TimeoutError:
-                    if self.autonomy_connection_state != ConnectionState.DISCONNECTED:
-                        self.autonomy_connection_state = ConnectionState.DISCONNECTED
-
-                    if self.teleop_decisin_manager.current_source != ControlSource.AUTONOMOUS:
-                        self.teleop_decisin_manager.set_control_source(ControlSource.AUTONOMOUS)
+                except ValueError as e:
+                    logger.error(f"Invalid autonomy message: {e}")
+                    continue
 
-                except websockets.exceptions.ConnectionClosed:
-                    # The client actually closed the socket or network is gone
-                    logger.info(f"Autonomy client disconnected: {websocket.remote_address}")
-                    break
-                except Exception as e:
-                    logger.error(f"Error handling control connection: {e}")
-                    break
+                requested = ControlSource.AUTONOMOUS if data.get("autonomy", "") else ControlSource.USER
+                self._switch_control_source(requested, "requested")
+        except websockets.exceptions.ConnectionClosed:
+            # The client actually closed the socket or network is gone
+            logger.info(f"Autonomy client disconnected: {websocket.remote_address}")
+        except Exception as e:
+            logger.error(f"Error handling autonomy connection: {e}")
         finally:
+            if session is not None:
+                self.sessions.detach(session, "autonomy", websocket)
             if self.autonomy_client == websocket:
                 self.autonomy_client = None
                 self.autonomy_connection_state = ConnectionState.DISCONNECTED
+                self.autonomy_watchdog.stop()
+                self._notify_message("autonomy", "close")
                 logger.info(f"Autonomy client fully disconnected: {websocket.remote_address}")
 
-    async def video_handler(self, websocket):
-        self.video_client = websocket
-        logger.info(f"Video client connected: {websocket.remote_address}")
+    def _on_autonomy_expired(self, silence_ms):
+        self.autonomy_connection_state = ConnectionState.DISCONNECTED
+        self._switch_control_source(ControlSource.AUTONOMOUS, "heartbeat_timeout", silence_ms)
+
+    def _on_autonomy_restored(self, silence_ms):
+        self.autonomy_connection_state = ConnectionState.CONNECTED
+        logger.info(f"Autonomy heartbeat restored after {silence_ms:.0f} ms")
+
+    def add_mode_switch_listener(self, listener):
+        """`listener(mode, reason=..., elapsed_ms=...)` is called on the loop for every control source switch."""
+        self.mode_switch_listeners.append(listener)
+
+    def _switch_control_source(self, source: ControlSource, reason, elapsed_ms=None):
+        if self.teleop_decisin_manager.current_source == source:
+            return
+        self.teleop_decisin_manager.set_control_source(source)
+        self.mode_switches += 1
+        if elapsed_ms is not None:
+            metrics.record("autonomy.failover", elapsed_ms)
+        logger.info(f"Control source -> {source.value} ({reason})")
+        for listener in self.mode_switch_listeners:
+            try:
+                listener(source.value, reason=reason, elapsed_ms=elapsed_ms)
+            except Exception as e:
+                logger.error(f"Error in mode switch listener: {e}")
+
+    def get_budget_stats(self):
+        """Latency budget per traffic class and how often it was exceeded."""
+        subscribers = list(self.video_broadcaster.subscribers)
+        return {
+            "isolated_control": self.control_port is not None,
+            "control": {"budget_ms": self.control_max_age_ms,
+                        "violations": sum(c.dropped_old for c in list(self.control_channels.values()))},
+            "autonomy": {"budget_ms": self.autonomy_deadline_ms,
+                         "violations": self.autonomy_watchdog.expirations},
+            "video": {"budget_ms": self.video_broadcaster.max_age_ms,
+                      "violations": sum(s.frames_expired for s in subscribers)},
+            "telemetry": {"budget_ms": round(self.telemetry_interval_s * 1000),
+                          "violations": self.telemetry_ticks_skipped},
+        }
+
+    def get_autonomy_stats(self):
+        stats = self.autonomy_watchdog.get_stats()
+        stats["mode_switches"] = self.mode_switches
+        return stats
+
+    async def video_handler(self, websocket, session_token=None):
+        session, resumed = self._attach_session(session_token, "video", websocket)
+        logger.info(f"Video client connected: {websocket.remote_address} "
+                    f"({len(self.video_broadcaster.subscribers) + 1} viewers)")
         try:
-            await websocket.wait_closed()
+            if session is not None:
+                await websocket.send(self._session_message(session, resumed))
+            await self.video_broadcaster.serve(websocket, catch_up=session is not None)
         except asyncio.CancelledError:
             logger.info(f"Video handler cancelled for: {websocket.remote_address}")
         except websockets.exceptions.ConnectionClosed:
@@ -165,40 +341,108 @@ class WebSocketHandler:
         except Exception as e:
             logger.error(f"Error in video connection: {e}")
         finally:
-            if self.video_client == websocket:
-                self.video_client = None
-                logger.info(f"Video client fully disconnected: {websocket.remote_address}")
+            if session is not None:
+                self.sessions.detach(session, "video", websocket)
+            logger.info(f"Video client fully disconnected: {websocket.remote_address}")
 
-    async def telemetry_handler(self, websocket):
-        self.telemetry_client = websocket
+    async def telemetry_handler(self, websocket, session_token=None):
+        session, resumed = self._attach_session(session_token, "telemetry", websocket)
         logger.info(f"Telemetry client connected: {websocket.remote_address}")
         try:
-            while True:
-                wifi_details = get_wifi_details()
-                telemetry = {
-                    "ap_mac": wifi_details.get("ap_mac", ""),
-                    "signal_strength": wifi_details.get("signal_strength", 0),
-                    "user_mode": self.teleop_decisin_manager.select_active_source().value,
-                    "back_connection": self.control_client is not None
-                }
-
-                await websocket.send(json.dumps(telemetry))
-                await asyncio.sleep(1)
-        except websockets.exceptions.ConnectionClosed:
-            logger.info(f"Telemetry client disconnected: {websocket.remote_address}")
+            pending = None
+            if session is not None:
+                await websocket.send(self._session_message(session, resumed))
+                # Catch-up: the current telemetry now rather than at the next tick
+                pending = asyncio.ensure_future(self._send_telemetry(websocket, json.dumps(self.build_telemetry())))
+            # Value is the client's in-flight send, so a slow client skips ticks instead of queueing them
+            self.telemetry_clients[websocket] = pending
+            await websocket.wait_closed()
         except Exception as e:
             logger.error(f"Error in telemetry handler: {e}")
         finally:
-            if self.telemetry_client == websocket:
-                self.telemetry_client = None
-                logger.info(f"Telemetry client fully disconnected: {websocket.remote_address}")
+            if session is not None:
+                self.sessions.detach(session, "telemetry", websocket)
+            pending = self.telemetry_clients.pop(websocket, None)
+            if pending is not None and not pending.done():
+                pending.cancel()
+            logger.info(f"Telemetry client fully disconnected: {websocket.remote_address}")
+
+    async def state_handler(self, websocket):
+        logger.info(f"State client connected: {websocket.remote_address}")
+        try:
+            await self.state_broadcaster.serve(websocket)
+        except websockets.exceptions.ConnectionClosed:
+            logger.info(f"State client disconnected: {websocket.remote_address}")
+        except Exception as e:
+            logger.error(f"Error in state connection: {e}")
+        finally:
+            logger.info(f"State client fully disconnected: {websocket.remote_address}")
+
+    def build_telemetry(self):
+        wifi_details = self.wifi_details
+        telemetry = {
+            "ap_mac": wifi_details.get("ap_mac", ""),
+            "signal_strength": wifi_details.get("signal_strength", 0),
+            "user_mode": self.teleop_decisin_manager.select_active_source().value,
+            "back_connection": self.control_client is not None
+        }
+        for name, provider in self.telemetry_sources.items():
+            telemetry[name] = provider()
+        return telemetry
+
+    async def _telemetry_loop(self):
+        """Builds one telemetry message per tick and broadcasts it to every telemetry client."""
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.telemetry_interval_s
+            if self.telemetry_clients:
+                try:
+                    message = json.dumps(self.build_telemetry())
+                    for websocket, pending in list(self.telemetry_clients.items()):
+                        if pending is None or pending.done():
+                            self.telemetry_clients[websocket] = asyncio.ensure_future(
+                                self._send_telemetry(websocket, message))
+                        else:
+                            self.telemetry_ticks_skipped += 1
+                except Exception as e:
+                    logger.error(f"Error building telemetry: {e}")
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Fell behind; do not burst to catch up
+                next_tick, delay = time.monotonic(), 0.0
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _send_telemetry(websocket, message):
+        try:
+            await websocket.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            logger.info(f"Telemetry client disconnected: {websocket.remote_address}")
 
-    async def _on_control_message(self, websocket, message: str):
+    async def _on_control_message(self, websocket, message):
+        if self.message_listeners:
+            self._notify_message("control", "message", message)
         try:
-            data = json.loads(message)
-            throttle = data.get("throttle", 0.0)
-            angle = data.get("angle", 0.0)
-            self.teleop_decisin_manager.update_user_input(throttle, angle)
+            control_input = decode_control_message(message)
+            channel = self.control_channels[websocket]
+            if not channel.accept(control_input):
+                return
+
+            # Buffered messages are received without yielding, so a burst is applied once, newest first
+            if channel.offer(control_input):
+                asyncio.get_running_loop().call_soon(self._apply_control_input, channel)
         except Exception as e:
             logger.error(f"Unhandled error in control message: {e}")
             await websocket.send(json.dumps({"error": "Server error"}))
+
+    def _apply_control_input(self, channel: ControlChannel):
+        control_input = channel.take()
+        if control_input is not None:
+            metrics.record_since("input.receive_to_apply", control_input.received_ns)
+            self.teleop_decisin_manager.update_user_input(control_input.throttle, control_input.angle,
+                                                          received_ns=control_input.received_ns,
+                                                          seq=control_input.seq)
+
+    def get_control_stats(self):
+        # Copied first: channels are added and removed on the control loop's thread
+        return [channel.get_stats() for channel in list(self.control_channels.values())]
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELDS = ("source", "autonomy", "recording", "throttle", "angle", "input_seq", "throttle_cap")
+
+
+class ControlState:
+    """
+    One immutable, versioned snapshot of the car's control state.
+
+    - source: active ControlSource requested over /autonomy (or by heartbeat failover)
+    - autonomy, recording: the flags set over HTTP
+    - throttle, angle, input_seq: the last user input received on /control
+    - throttle_cap: limit on the drive command's throttle magnitude (None: no limit),
+      e.g. while the Wi-Fi link is handing over between APs
+
+    Never modified after construction; ControlStateStore replaces it as a whole.
+    """
+    __slots__ = ("version", "changed_ns") + STATE_FIELDS
+
+    def __init__(self, version=0, source=None, autonomy=False, recording=False, throttle=0.0, angle=0.0,
+                 input_seq=None, throttle_cap=None, changed_ns=None):
+        self.version = version
+        self.source = source
+        self.autonomy = autonomy
+        self.recording = recording
+        self.throttle = throttle
+        self.angle = angle
+        self.input_seq = input_seq
+        self.throttle_cap = throttle_cap
+        self.changed_ns = time.monotonic_ns() if changed_ns is None else changed_ns
+
+    def replace(self, changes):
+        values = {name: getattr(self, name) for name in STATE_FIELDS}
+        values.update(changes)
+        return ControlState(self.version + 1, **values)
+
+    def to_dict(self):
+        return {name: _json_value(getattr(self, name)) for name in STATE_FIELDS}
+
+    def diff(self, older):
+        """Fields that differ from `older` (None means everything), JSON-ready."""
+        return {name: _json_value(getattr(self, name)) for name in STATE_FIELDS
+                if older is None or getattr(self, name) != getattr(older, name)}
+
+
+def _json_value(value):
+    # ControlSource and other enums are sent by value
+    return getattr(value, "value", value)
+
+
+class ControlStateStore:
+    """
+    Versioned control state shared by the control loop, the HTTP/websocket loop and the drive loop.
+
+    - update(**changes) may be called from any thread; updates are serialized by a lock and
+      each one that actually changes a field publishes a new ControlState with version + 1.
+    - `snapshot` is a single attribute read, so a reader always sees one consistent version
+      without locking. The drive loop takes it once per iteration.
+    - Listeners are called as listener(state, changes) on the writer's thread after every
+      change, outside the lock; two writers may notify out of order, so listeners should
+      read `snapshot` rather than rely on the order of calls.
+    """
+
+    def __init__(self, initial: ControlState):
+        self._state = initial
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    @property
+    def snapshot(self) -> ControlState:
+        return self._state
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def update(self, **changes):
+        with self._lock:
+            current = self._state
+            changed = {name: value for name, value in changes.items() if getattr(current, name) != value}
+            if not changed:
+                return current
+            state = current.replace(changed)
+            self._state = state
+        for listener in self.listeners:
+            try:
+                listener(state, changed)
+            except Exception as e:
+                logger.error(f"Error in control state listener: {e}")
+        return state
@@ -0,0 +1,120 @@
+import asyncio
+
+from services.latency_metrics import RollingHistogram
+
+
+class HeartbeatWatchdog:
+    """
+    Deadline on a stream of heartbeats, driven by the event loop's own timer.
+
+    - beat() only stores the arrival time; there is no per-message timer to create or cancel.
+    - One timer is kept armed at (last beat + deadline). When it fires early because a
+      newer beat arrived, it re-arms itself for the new deadline; otherwise it calls
+      `on_expired(silence_ms)` exactly once, right at the deadline.
+    - The first beat after an expiry calls `on_restored(silence_ms)`.
+
+    Heartbeat intervals and the silence at expiry are kept in rolling histograms.
+    arm() and beat() move the watchdog (and its timer) to the calling coroutine's loop,
+    so heartbeats can arrive on either server loop; a beat() from outside any loop is
+    handed to the watchdog's loop. The other methods must be called on the loop's thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, deadline_ms=200, on_expired=None, on_restored=None):
+        self.loop = loop
+        self.deadline_s = deadline_ms / 1000.0
+        self.on_expired = on_expired
+        self.on_restored = on_restored
+
+        self.last_beat = None
+        self.expired = False
+        self._timer = None
+
+        self.intervals = RollingHistogram(size=512)
+        self.expiry_silence = RollingHistogram(size=128)
+        self.expiry_lateness = RollingHistogram(size=128)
+        self.expirations = 0
+
+    @property
+    def deadline_ms(self):
+        return self.deadline_s * 1000
+
+    def arm(self):
+        """Starts the deadline without counting a heartbeat, e.g. when the client connects."""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.stop()
+            self.loop = loop
+        self.last_beat = self.loop.time()
+        if self._timer is None:
+            self._timer = self.loop.call_at(self.last_beat + self.deadline_s, self._check)
+
+    def beat(self):
+        try:
+            self._follow_running_loop()
+        except RuntimeError:
+            # Not called from a coroutine: call_at is not thread-safe, so beat on the watchdog's loop
+            self.loop.call_soon_threadsafe(self.beat)
+            return
+        now = self.loop.time()
+        if self.last_beat is not None:
+            self.intervals.record((now - self.last_beat) * 1000)
+        silence_ms = (now - self.last_beat) * 1000 if self.last_beat is not None else 0.0
+        self.last_beat = now
+
+        if self.expired:
+            self.expired = False
+            if self.on_restored is not None:
+                self.on_restored(silence_ms)
+        if self._timer is None:
+            self._timer = self.loop.call_at(now + self.deadline_s, self._check)
+
+    def _follow_running_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is self.loop:
+            return
+        # Keeps the last beat and expiry (both loops share the monotonic clock); only the timer moves
+        if self._timer is not None:
+            self.loop.call_soon_threadsafe(self._timer.cancel)
+            self._timer = None
+        self.loop = loop
+
+    def _check(self):
+        if asyncio.get_running_loop() is not self.loop:
+            return  # left over from before arm() moved the watchdog to the other loop
+        self._timer = None
+        now = self.loop.time()
+        due = self.last_beat + self.deadline_s
+        if now < due:
+            # A beat arrived since the timer was armed
+            self._timer = self.loop.call_at(due, self._check)
+            return
+
+        silence_ms = (now - self.last_beat) * 1000
+        self.expired = True
+        self.expirations += 1
+        self.expiry_silence.record(silence_ms)
+        self.expiry_lateness.record((now - due) * 1000)
+        if self.on_expired is not None:
+            self.on_expired(silence_ms)
+
+    def stop(self):
+        """Disarms the timer; the next beat() starts a fresh deadline."""
+        if self._timer is not None:
+            # The timer may belong to the other server loop
+            self.loop.call_soon_threadsafe(self._timer.cancel)
+            self._timer = None
+        self.last_beat = None
+        self.expired = False
+
+    def get_stats(self):
+        return {
+            "deadline_ms": self.deadline_ms,
+            "expired": self.expired,
+            "expirations": self.expirations,
+            "since_last_beat_ms": round((self.loop.time() - self.last_beat) * 1000, 1)
+            if self.last_beat is not None else None,
+            "interval_ms": self.intervals.snapshot(),
+            "failover_silence_ms": self.expiry_silence.snapshot(),
+            "failover_lateness_ms": self.expiry_lateness.snapshot(),
+        }
+
@@ -0,0 +1,86 @@
+import time
+from collections import deque
+
+from services.latency_metrics import RollingHistogram
+
+
+def _clamp(value, low=-1.0, high=1.0):
+    return max(low, min(high, value))
+
+
+class InputConditioner:
+    """
+    Smooths user input across short gaps on a lossy link, using the monotonic clock.
+
+    For a gap since the last input of:
+    - up to `hold_ms`: throttle is held and steering is extrapolated from the recent
+      steering rate (for at most `prediction_ms`);
+    - `hold_ms` .. `timeout_ms`: steering stays where the extrapolation ended and
+      throttle ramps linearly to zero;
+    - beyond `timeout_ms`: both are zero (deadman).
+
+    Inter-arrival gaps are kept in a rolling histogram so the limits can be tuned from data.
+    """
+
+    def __init__(self, hold_ms=100, timeout_ms=400, prediction_ms=60, history=8):
+        self.hold_ms = hold_ms
+        self.timeout_ms = max(timeout_ms, hold_ms)
+        self.prediction_ms = prediction_ms
+        self.history = deque(maxlen=history)
+
+        self.gaps = RollingHistogram()
+        self.gaps_over_hold = 0
+        self.gaps_over_timeout = 0
+
+    def update(self, throttle, angle, now_ns=None):
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        if self.history:
+            gap_ms = (now_ns - self.history[-1][0]) / 1_000_000
+            self.gaps.record(gap_ms)
+            if gap_ms > self.timeout_ms:
+                self.gaps_over_timeout += 1
+            elif gap_ms > self.hold_ms:
+                self.gaps_over_hold += 1
+        self.history.append((now_ns, throttle, angle))
+
+    def gap_ms(self, now_ns=None):
+        if not self.history:
+            return None
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        return (now_ns - self.history[-1][0]) / 1_000_000
+
+    def has_timed_out(self, now_ns=None):
+        gap_ms = self.gap_ms(now_ns)
+        return gap_ms is None or gap_ms > self.timeout_ms
+
+    def _angle_rate(self):
+        """Steering change per ms over the last two inputs."""
+        if len(self.history) < 2:
+            return 0.0
+        (t0, _, a0), (t1, _, a1) = self.history[-2], self.history[-1]
+        dt_ms = (t1 - t0) / 1_000_000
+        if dt_ms < 5:
+            return 0.0
+        return (a1 - a0) / dt_ms
+
+    def output(self, now_ns=None):
+        """Returns the conditioned (throttle, angle) for the current instant."""
+        gap_ms = self.gap_ms(now_ns)
+        if gap_ms is None or gap_ms > self.timeout_ms:
+            return 0.0, 0.0
+
+        _, throttle, angle = self.history[-1]
+        angle = _clamp(angle + self._angle_rate() * min(gap_ms, self.prediction_ms, self.hold_ms))
+        if gap_ms <= self.hold_ms:
+            return throttle, angle
+
+        ramp = 1.0 - (gap_ms - self.hold_ms) / max(1e-6, self.timeout_ms - self.hold_ms)
+        return throttle * ramp, angle
+
+    def reset(self):
+        self.history.clear()
+
+    def get_stats(self):
+        return {"gap_ms": self.gaps.snapshot(), "gaps_over_hold": self.gaps_over_hold,
+                "gaps_over_timeout": self.gaps_over_timeout, "hold_ms": self.hold_ms,
+                "timeout_ms": self.timeout_ms}
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState(Enum):
+    STARTING = "starting"
+    WARMING_UP = "warming_up"
+    READY = "ready"
+    DEGRADED = "degraded"
+
+
+class StartupTracker:
+    """
+    Readiness state and per-phase timing of TeleopControlPart startup.
+
+    - phase(name) times a block. A failing optional phase (warm-up) is recorded and marks
+      startup DEGRADED instead of propagating, so one slow or broken component cannot
+      stop the car from becoming drivable; required phases re-raise after recording.
+    - wait_ready() blocks until READY or DEGRADED.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.state = StartupState.STARTING
+        self.phases = {}
+        self.errors = {}
+        self.ready_after_ms = None
+        self._done = threading.Event()
+
+    def record(self, name, ms):
+        self.phases[name] = round(ms, 1)
+
+    @contextmanager
+    def phase(self, name, optional=False):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            logger.error(f"Startup phase {name} failed: {e}")
+            self.errors[name] = str(e)
+            if not optional:
+                raise
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def set_state(self, state: StartupState):
+        self.state = state
+        if state in (StartupState.READY, StartupState.DEGRADED):
+            if self.errors:
+                self.state = StartupState.DEGRADED
+            self.ready_after_ms = round((time.perf_counter() - self.started) * 1000, 1)
+            logger.info(f"Startup {self.state.value} after {self.ready_after_ms} ms: {self.phases}")
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self.state == StartupState.READY
+
+    def wait_ready(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def get_stats(self):
+        return {
+            "state": self.state.value,
+            "ready": self.ready,
+            "ready_after_ms": self.ready_after_ms,
+            "phases_ms": dict(self.phases),
+            "errors": dict(self.errors),
+        }
@@ -1,16 +1,28 @@
-import asyncio
-import threading
+import time
 
-import aiohttp_cors
-import cv2
-from aiohttp import web
+_import_started = time.perf_counter()
 
-from controllers.control_api_handler import ControlAPIHandler
-from controllers.websocket_handler import WebSocketHandler, logger
-from core.teleop_decision_manager import TeleopDecisionManager
-from services.experiment_logger import ExperimentLogger
-from services.resource_monitor import ResourceMonitor
-from services.video_streamer import VideoStreamer
+import asyncio  # noqa: E402
+import threading  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+from controllers.websocket_handler import WebSocketHandler  # noqa: E402
+from core.startup_tracker import StartupState, StartupTracker  # noqa: E402
+from core.teleop_decision_manager import TeleopDecisionManager  # noqa: E402
+from services.experiment_logger import ExperimentLogger  # noqa: E402
+from services.frame_preprocessor import FramePreprocessor  # noqa: E402
+from services.latency_metrics import metrics  # noqa: E402
+from services.link_events import LinkEventMonitor, replay_iw_events  # noqa: E402
+from services.link_monitor import LinkStateSampler  # noqa: E402
+from services.resource_monitor import ResourceMonitor  # noqa: E402
+from services.runtime_sampler import RuntimeSampler  # noqa: E402
+from services.session_recorder import SessionRecorder  # noqa: E402
+from services.video_streamer import VideoStreamer  # noqa: E402
+from services.vision_worker import VisionWorker  # noqa: E402
+
+# The HTTP API (aiohttp, the slowest import) is imported by the warm-up thread instead
+_import_ms = (time.perf_counter() - _import_started) * 1000
 
 
 def run(cam_image_array=None):
@@ -29,71 +41,302 @@ class TeleopControlPart:
     - Runs WebSocket and HTTP servers in an asyncio event loop.
     - Interfaces with camera input and decision logic via CarControlManager.
     - Provides real-time video streaming, control toggling, and telemetry updates.
+    - Starts in two steps: the constructor builds what the drive loop needs, then a
+      warm-up thread starts the HTTP API, primes the encoder and detector and waits for
+      the sockets. Readiness and phase timings are in `startup` (/ready, telemetry).
     """
 
     def __init__(self, cfg):
         #warnings.filterwarnings("ignore", category=PicameraDeprecated)
 
         self.config = cfg
+        self.frame_shape = (getattr(cfg, "IMAGE_H", 480), getattr(cfg, "IMAGE_W", 640), getattr(cfg, "IMAGE_DEPTH", 3))
+        self.startup = StartupTracker()
+        self.startup.record("imports", _import_ms)
+
+        with self.startup.phase("event_loops"):
+            # Set up a dedicated asyncio loop for async tasks (video, telemetry, HTTP)
+            self.loop = asyncio.new_event_loop()
+            self._start_event_loop_in_thread(self.loop, "teleop-loop")
 
-        # Set up a dedicated asyncio loop for async tasks
-        self.loop = asyncio.new_event_loop()
-        self._start_event_loop_in_thread()
+            # Control-critical traffic (/control, /autonomy) gets its own loop, isolated from bulk sends
+            self.control_loop = asyncio.new_event_loop()
+            self._start_event_loop_in_thread(self.control_loop, "teleop-control")
 
-        self.teleop_decision_manager = TeleopDecisionManager()
+        self.vision_worker = None
+        marker_tracking = getattr(cfg, "TELEOP_MARKER_TRACKING", True)
+        with self.startup.phase("vision_worker_spawn"):
+            if getattr(cfg, "TELEOP_VISION_PROCESS", True):
+                self.vision_worker = VisionWorker(frame_shape=self.frame_shape, tracking=marker_tracking)
 
-        self.ws_handler = WebSocketHandler(self.loop, self.teleop_decision_manager)
-        self.http_handler = ControlAPIHandler(self)
-        self.http_handler.start()
+        with self.startup.phase("decision_manager"):
+            self.teleop_decision_manager = self._build_decision_manager(cfg, self.vision_worker)
 
+        self.link_sampler = LinkStateSampler(interface=getattr(cfg, "TELEOP_WIFI_INTERFACE", "wlan0"))
+        self.link_sampler.start()
 
-        self.video_streamer = VideoStreamer(self.ws_handler)
+        self.ws_handler = WebSocketHandler(self.loop, self.teleop_decision_manager,
+                                           control_max_age_ms=getattr(cfg, "TELEOP_CONTROL_MAX_AGE_MS", 150),
+                                           link_sampler=self.link_sampler,
+                                           telemetry_interval_s=1.0 / getattr(cfg, "TELEOP_TELEMETRY_HZ", 1.0),
+                                           autonomy_deadline_ms=getattr(cfg, "TELEOP_AUTONOMY_DEADLINE_MS", 200),
+                                           control_loop=self.control_loop,
+                                           control_port=getattr(cfg, "TELEOP_CONTROL_WS_PORT", 8082),
+                                           video_max_age_ms=getattr(cfg, "TELEOP_VIDEO_MAX_AGE_MS", 250),
+                                           session_ttl_s=getattr(cfg, "TELEOP_SESSION_TTL_S", 30.0),
+                                           port=getattr(cfg, "TELEOP_WS_PORT", 8080))
+        self.ws_handler.add_telemetry_source("startup", self.startup.get_stats)
+        self.http_handler = None
 
-        # Tracks the last submitted streaming task (to allow cancellation)
-        self._last_stream_task = None
+        with self.startup.phase("video_pipeline"):
+            self.frame_preprocessor = self._build_frame_preprocessor(self.frame_shape)
+            self.video_streamer = VideoStreamer(self.ws_handler, self.loop,
+                                                jpeg_quality=getattr(cfg, "TELEOP_JPEG_QUALITY", 80),
+                                                adaptive=getattr(cfg, "TELEOP_VIDEO_ADAPTIVE", True),
+                                                target_latency_ms=getattr(cfg, "TELEOP_VIDEO_TARGET_LATENCY_MS", 150),
+                                                mode=getattr(cfg, "TELEOP_VIDEO_MODE", "jpeg"),
+                                                handover_policy=getattr(cfg, "TELEOP_HANDOVER_VIDEO", "shrink"))
+        self.ws_handler.add_telemetry_source("video", self.video_streamer.get_stats)
+        self.ws_handler.add_telemetry_source("input", self.teleop_decision_manager.input_conditioner.get_stats)
+
+        # Per-thread CPU, memory, event-loop lag and GC pauses, cheap enough to leave on
+        self.runtime_sampler = None
+        sampler_hz = getattr(cfg, "TELEOP_RUNTIME_SAMPLER_HZ", 1.0)
+        if sampler_hz:
+            self.runtime_sampler = RuntimeSampler({"teleop-loop": self.loop, "teleop-control": self.control_loop},
+                                                  interval=1.0 / sampler_hz,
+                                                  ring_size=getattr(cfg, "TELEOP_RUNTIME_SAMPLES", 300))
+            self.runtime_sampler.start()
+            self.ws_handler.add_telemetry_source("runtime", self.runtime_sampler.get_stats)
+
+        # Optional: native recorder, used instead of DonkeyCar's synchronous tub writer
+        self.session_recorder = None
+        if getattr(cfg, "TELEOP_RECORDER", False):
+            self.session_recorder = SessionRecorder(
+                base_dir=getattr(cfg, "TELEOP_RECORDER_DIR", "/home/pi/minicar_back/sessions"),
+                frame_shape=self.frame_shape,
+                slots=getattr(cfg, "TELEOP_RECORDER_SLOTS", 32),
+                storage=getattr(cfg, "TELEOP_RECORDER_STORAGE", "jpeg"),
+                context_provider=self._recording_context)
+            self.ws_handler.add_telemetry_source("recorder", self.session_recorder.get_stats)
+            # Journal what drove the car next to the frames, so the session can be replayed
+            self.ws_handler.add_message_listener(self.session_recorder.record_message)
+            self.teleop_decision_manager.state.add_listener(self._journal_state)
 
         # Optional: system resource monitoring and experiment logging
-        #self.logger = ExperimentLogger()
-        #self.resource_monitor = ResourceMonitor(self.logger)
-        #self.resource_monitor.start()
+        self.logger = None
+        self.resource_monitor = None
+        self._log_sampler = None
+        if getattr(cfg, "TELEOP_EXPERIMENT_LOG", False):
+            self.logger = ExperimentLogger(base_dir=getattr(cfg, "TELEOP_LOG_DIR", "/home/pi/minicar_back/logs"),
+                                           link_sampler=self.link_sampler,
+                                           max_bytes=getattr(cfg, "TELEOP_LOG_MAX_MB", 50) * 1024 * 1024,
+                                           compress=getattr(cfg, "TELEOP_LOG_COMPRESS", False))
+            sampler = self.runtime_sampler
+            if sampler is None:
+                # Runtime sampling is off, but the log still needs its "sys" and AP switch entries
+                sampler = self._log_sampler = RuntimeSampler(interval=1.0, ring_size=1, per_thread=False)
+                sampler.start()
+            self.resource_monitor = ResourceMonitor(self.logger, sampler)
+            self.resource_monitor.start()
+            self.ws_handler.add_telemetry_source("log_writer", self.logger.writer.get_stats)
+            self.ws_handler.add_mode_switch_listener(self.logger.log_mode_switch)
+
+        # Wi-Fi disconnect/roam events from `iw event`: cap throttle and shrink video within milliseconds
+        self.link_events = None
+        self.handover_throttle_cap = getattr(cfg, "TELEOP_HANDOVER_THROTTLE_CAP", 0.1)
+        if getattr(cfg, "TELEOP_LINK_EVENTS", True):
+            replay_path = getattr(cfg, "TELEOP_LINK_EVENTS_REPLAY", None)
+            self.link_events = LinkEventMonitor(interface=getattr(cfg, "TELEOP_WIFI_INTERFACE", "wlan0"),
+                                                source=replay_iw_events(replay_path) if replay_path else None)
+            self.link_events.add_listener(self._on_link_event)
+            self.link_events.start()
+            self.ws_handler.add_telemetry_source("link_events", self.link_events.get_stats)
+
+        self.startup.record("constructor", (time.perf_counter() - self.startup.started) * 1000)
+        self._warmup_thread = threading.Thread(target=self._warm_up, name="teleop-warmup", daemon=True)
+        self._warmup_thread.start()
+
+    @classmethod
+    def for_replay(cls, cfg, clock):
+        """
+        A part with only the drive path, for SessionReplay: frame preprocessing and a decision
+        manager on `clock` with in-process detection. No loops, servers, threads, worker
+        processes or recorder, so run_threaded() depends on nothing but its inputs.
+        """
+        part = cls.__new__(cls)
+        part.config = cfg
+        part.frame_shape = (getattr(cfg, "IMAGE_H", 480), getattr(cfg, "IMAGE_W", 640), getattr(cfg, "IMAGE_DEPTH", 3))
+        part.vision_worker = None
+        part.video_streamer = None
+        part.session_recorder = None
+        part.teleop_decision_manager = cls._build_decision_manager(cfg, None, clock, virtual_clock=True)
+        part.frame_preprocessor = cls._build_frame_preprocessor(part.frame_shape)
+        return part
+
+    @staticmethod
+    def _build_decision_manager(cfg, marker_detector, clock=time.monotonic_ns, virtual_clock=False):
+        return TeleopDecisionManager(
+            marker_detector=marker_detector,
+            marker_staleness_ms=getattr(cfg, "TELEOP_MARKER_STALENESS_MS", 200),
+            marker_tracking=getattr(cfg, "TELEOP_MARKER_TRACKING", True),
+            timeout_ms=getattr(cfg, "TELEOP_INPUT_TIMEOUT_MS", 400),
+            input_hold_ms=getattr(cfg, "TELEOP_INPUT_HOLD_MS", 100),
+            clock=clock,
+            virtual_clock=virtual_clock)
+
+    @staticmethod
+    def _build_frame_preprocessor(frame_shape):
+        frame_preprocessor = FramePreprocessor(model_size=(160, 120))
+        # Allocates the preprocessing buffers now rather than on the first camera frame
+        frame_preprocessor.prepare(np.zeros(frame_shape, dtype=np.uint8))
+        return frame_preprocessor
+
+    def _recording_context(self):
+        # Start state and effective settings, so SessionReplay starts where the car was
+        decision_manager = self.teleop_decision_manager
+        return {
+            "state": decision_manager.state.snapshot.to_dict(),
+            "input_gap_ms": decision_manager.input_conditioner.gap_ms(),
+            "config": {
+                "IMAGE_H": self.frame_shape[0], "IMAGE_W": self.frame_shape[1], "IMAGE_DEPTH": self.frame_shape[2],
+                "TELEOP_INPUT_TIMEOUT_MS": decision_manager.timeout_ms,
+                "TELEOP_INPUT_HOLD_MS": decision_manager.input_conditioner.hold_ms,
+                "TELEOP_MARKER_TRACKING": decision_manager.marker_tracking,
+                "TELEOP_CONTROL_MAX_AGE_MS": self.ws_handler.control_max_age_ms,
+                "TELEOP_AUTONOMY_DEADLINE_MS": self.ws_handler.autonomy_deadline_ms,
+            },
+        }
+
+    def _journal_state(self, state, changes):
+        # Inputs and source switches are re-derived from the journaled messages on replay
+        changes = {name: value for name, value in changes.items() if name in ("autonomy", "recording", "throttle_cap")}
+        if changes:
+            self.session_recorder.record_message("state", "change", changes)
 
-    def _start_event_loop_in_thread(self) -> None:
-        thread = threading.Thread(target=self._start_event_loop, daemon=True)
+    def _warm_up(self):
+        self.startup.set_state(StartupState.WARMING_UP)
+        cfg = self.config
+
+        with self.startup.phase("http_api", optional=True):
+            from controllers.control_api_handler import ControlAPIHandler
+            self.http_handler = ControlAPIHandler(self, port=getattr(cfg, "TELEOP_HTTP_PORT", 8081))
+            self.http_handler.start()
+
+        with self.startup.phase("warmup_encoder", optional=True):
+            self.video_streamer.warm_up(self.frame_shape)
+
+        with self.startup.phase("warmup_detector", optional=True):
+            if self.vision_worker is not None:
+                deadline = time.monotonic() + getattr(cfg, "TELEOP_VISION_READY_TIMEOUT_S", 30.0)
+                while not self.vision_worker.ready:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("vision worker did not report ready")
+                    time.sleep(0.01)
+            else:
+                self.teleop_decision_manager.warm_up(self.frame_shape)
+
+        with self.startup.phase("sockets", optional=True):
+            servers = [("websocket", self.ws_handler.listening), ("control websocket", self.ws_handler.control_listening)]
+            if self.http_handler is not None:
+                servers.append(("http", self.http_handler.listening))
+            for name, listening in servers:
+                if not listening.wait(timeout=10.0):
+                    raise TimeoutError(f"{name} server is not listening")
+
+        self.startup.set_state(StartupState.READY)
+
+    def _on_link_event(self, event, duration_ms):
+        # Runs on the link event thread; duration_ms is None when a handover starts
+        if duration_ms is None:
+            self.teleop_decision_manager.set_throttle_cap(self.handover_throttle_cap)
+            self.video_streamer.set_link_handover(True)
+            metrics.record_since("link.event_to_cap", event.received_ns)
+            if self.logger is not None:
+                self.logger.log_handover("start", previous_bssid=self.link_events.bssid)
+            return
+
+        self.teleop_decision_manager.set_throttle_cap(None)
+        self.video_streamer.set_link_handover(False)
+        self.link_sampler.refresh_bssid()
+        metrics.record("link.handover", duration_ms)
+        if self.logger is not None:
+            last = self.link_events.last_handover
+            self.logger.log_handover("end", bssid=event.bssid, previous_bssid=last["from"], duration_ms=duration_ms)
+
+    def _start_event_loop_in_thread(self, loop, name) -> None:
+        thread = threading.Thread(target=self._start_event_loop, args=(loop,), name=name, daemon=True)
         thread.start()
 
-    def _start_event_loop(self) -> None:
-        asyncio.set_event_loop(self.loop)
-        self.loop.run_forever()
+    @staticmethod
+    def _start_event_loop(loop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
 
     def run_threaded(self, cam_image_array):
+        capture_ns = time.monotonic_ns()
+        # One consistent view of source/autonomy/recording for this whole iteration
+        state = self.teleop_decision_manager.state.snapshot
 
         resized_cam_image_array = None
+        frame = None
         if cam_image_array is not None:
-            self._run_async_task(self.video_streamer.send_camera_frame(cam_image_array))
-            resized_cam_image_array = cv2.resize(cam_image_array, (160, 120))
+            # Resize and grayscale are computed once into reused buffers and shared read-only
+            frame = self.frame_preprocessor.prepare(cam_image_array)
+            if self.video_streamer is not None:
+                self.video_streamer.submit_frame(frame.rgb, capture_ns)
+            if self.vision_worker is not None and state.autonomy:
+                self.vision_worker.submit_frame(frame.rgb)
+            resized_cam_image_array = frame.model
 
         # False at the end is about whether to record or no
-        angle, throttle, mode, recording = self.teleop_decision_manager.get_active_control(cam_image_array)
+        angle, throttle, mode, recording = self.teleop_decision_manager.get_active_control(cam_image_array, frame,
+                                                                                          state)
+        if self.session_recorder is not None:
+            self._record(frame, angle, throttle, mode, capture_ns, state)
+            # Recorded natively; DonkeyCar's tub writer would write the same frame in the drive loop
+            recording = False
+        metrics.record_since("drive.run_threaded", capture_ns)
         return angle, throttle, mode, recording, resized_cam_image_array
 
-    def _run_async_task(self, coroutine):
-        # Submit coroutine to async event loop; cancel the previous one if still pending
-        if not self.loop.is_running():
-            logger.error("Event loop is not running!")
+    def _record(self, frame, angle, throttle, mode, capture_ns, state):
+        # The operator's recording switch, not the tub flag: a session records on through source switches
+        self.session_recorder.set_active(state.recording)
+        if not state.recording or frame is None:
             return
-        try:
-            if self._last_stream_task and not self._last_stream_task.done():
-                self._last_stream_task.cancel()
-
-            self._last_stream_task = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
-
-        except Exception as e:
-            logger.error(f"Error running async task: {e}")
+        marker_ids = None
+        if self.vision_worker is not None and state.autonomy:
+            result = self.vision_worker.get_latest_result()
+            marker_ids = result.marker_ids if result is not None else None
+        self.session_recorder.record(frame.rgb, throttle, angle, mode, marker_ids, capture_ns)
 
     def update(self, mode=None):
         # Optional: DonkeyCar calls this once per loop if defined (not used here)
         pass
 
     def set_tub(self, tub):
-        # Optional: DonkeyCar calls this to provide access to Tub recorder (not used here)
-        pass
+        # Optional: DonkeyCar calls this to provide access to Tub recorder; the native recorder writes next to it
+        base_path = getattr(tub, "base_path", None) or getattr(tub, "path", None)
+        if self.session_recorder is not None and base_path:
+            self.session_recorder.set_base_dir(base_path)
+
+    def shutdown(self):
+        # DonkeyCar calls this once when the vehicle stops
+        self.video_streamer.stop()
+        self.link_sampler.stop()
+        if self.link_events is not None:
+            self.link_events.stop()
+        if self.vision_worker is not None:
+            self.vision_worker.stop()
+        if self.session_recorder is not None:
+            self.session_recorder.close()
+        if self.resource_monitor is not None:
+            self.resource_monitor.stop()
+        if self.runtime_sampler is not None:
+            self.runtime_sampler.stop()
+        if self._log_sampler is not None:
+            self._log_sampler.stop()
+        if self.logger is not None:
+            self.logger.close()
+        if self.http_handler is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.http_handler.stop_server(), self.loop).result(timeout=2.0)
@@ -1,14 +1,12 @@
 import time
 from enum import Enum
 
-import cv2
-from cv2 import aruco
+import numpy as np
 
+from core.control_state import ControlState, ControlStateStore
+from core.input_conditioner import InputConditioner
 from services.experiment_logger import ExperimentLogger
-
-
-def _current_time_ms():
-    return time.time_ns() // 1_000_000
+from services.latency_metrics import metrics
 
 
 class ControlSource(Enum):
@@ -17,40 +15,106 @@ class ControlSource(Enum):
 
 
 class TeleopDecisionManager:
-    def __init__(self, timeout_ms=400):
-        self.current_source = ControlSource.USER
+    """
+    Decides the drive command each loop iteration.
+
+    Source, autonomy and recording flags and the last user input live in a versioned
+    ControlStateStore (`state`); the attributes below are views onto it, so every writer
+    (HTTP, /autonomy, /control) publishes a new snapshot and the drive loop reads one
+    consistent snapshot per iteration.
+
+    Every timing decision (input hold, ramp-down and timeout) reads `clock`, a callable
+    returning monotonic ns; session replay passes a virtual clock to make them repeatable,
+    with `virtual_clock=True` so no real-time latency is measured against it.
+    """
+    def __init__(self, timeout_ms=400, marker_detector=None, marker_staleness_ms=200, marker_tracking=True,
+                 input_hold_ms=100, clock=time.monotonic_ns, virtual_clock=False):
+        self.clock = clock
+        self.virtual_clock = virtual_clock
+        self.state = ControlStateStore(ControlState(source=ControlSource.USER))
 
         self.throttle = 0.0
         self.angle = 0.0
 
         self.timeout_ms = timeout_ms
-        self.last_user_input_time_ms = _current_time_ms()
+        self.input_conditioner = InputConditioner(hold_ms=input_hold_ms, timeout_ms=timeout_ms)
 
-        self.autonomy_enabled = False
-        self.recording_enabled = False
+        # Monotonic receive/apply stamps of the newest input, until the drive loop picks it up
+        self._input_received_ns = None
+        self._input_applied_ns = None
 
         self.last_decided_control_source = None
 
-        self.aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_100)
-        self.aruco_params = aruco.DetectorParameters_create()
+        # Optional out-of-process detector (VisionWorker); when set, detection never runs in the drive loop
+        self.marker_detector = marker_detector
+        self.marker_staleness_ms = marker_staleness_ms
+        self.stale_marker_results = 0
+
+        # The in-process detector (cv2.aruco) is built on first use, so never when marker_detector is set
+        self.marker_tracking = marker_tracking
+        self.aruco_dict = None
+        self.aruco_params = None
+        self.tracking_detector = None
+
+    @property
+    def current_source(self):
+        return self.state.snapshot.source
+
+    @property
+    def autonomy_enabled(self):
+        return self.state.snapshot.autonomy
+
+    @autonomy_enabled.setter
+    def autonomy_enabled(self, value):
+        self.state.update(autonomy=bool(value))
 
-    def update_user_input(self, throttle, angle):
+    @property
+    def recording_enabled(self):
+        return self.state.snapshot.recording
+
+    @recording_enabled.setter
+    def recording_enabled(self, value):
+        self.state.update(recording=bool(value))
+
+    def update_user_input(self, throttle, angle, received_ns=None, seq=None):
         self.throttle = throttle
         self.angle = angle
-        self.last_user_input_time_ms = _current_time_ms()
+        self._input_applied_ns = self.clock()
+        self._input_received_ns = received_ns if received_ns is not None else self._input_applied_ns
+        self.input_conditioner.update(throttle, angle, self._input_applied_ns)
+        self.state.update(throttle=throttle, angle=angle, input_seq=seq)
+
+    def _record_input_pickup(self):
+        applied_ns, received_ns = self._input_applied_ns, self._input_received_ns
+        if applied_ns is None:
+            return
+        self._input_applied_ns = None
+        if self.virtual_clock:
+            return  # virtual time, nothing to measure
+        metrics.record_since("input.apply_to_pickup", applied_ns)
+        metrics.record_since("input.receive_to_pickup", received_ns)
 
     def reset_controls(self):
         self.throttle = 0.0
         self.angle = 0.0
 
     def has_timed_out(self):
-        return _current_time_ms() - self.last_user_input_time_ms > self.timeout_ms
+        return self.input_conditioner.has_timed_out(self.clock())
 
     def set_control_source(self, state: ControlSource):
-        if self.current_source != state:
-            self.current_source = state
+        self.state.update(source=state)
+
+    def set_throttle_cap(self, cap=None):
+        """Limits the throttle magnitude of every drive command until called with None."""
+        self.state.update(throttle_cap=cap)
 
-    def select_active_source(self):
+    @staticmethod
+    def _apply_throttle_cap(throttle, state: ControlState):
+        if state.throttle_cap is None:
+            return throttle
+        return max(-state.throttle_cap, min(state.throttle_cap, throttle))
+
+    def select_active_source(self, state: ControlState = None):
         """
         Selects the active control source based on system state.
 
@@ -59,39 +123,98 @@ class TeleopDecisionManager:
             * If the current source is already AUTONOMOUS, keep it.
             * Otherwise, default to USER control.
         """
+        state = state if state is not None else self.state.snapshot
 
-
-        if not self.autonomy_enabled:
+        if not state.autonomy:
             return ControlSource.USER
 
-        if self.current_source == ControlSource.AUTONOMOUS:
+        if state.source == ControlSource.AUTONOMOUS:
             return ControlSource.AUTONOMOUS
 
         return ControlSource.USER
 
-    def get_active_control(self, cam_image_array):
+    def get_active_control(self, cam_image_array, frame=None, state: ControlState = None):
         """
         Returns a tuple (angle, throttle, mode, isRecording) based on the current control logic.
-        - If USER control is active, it returns the user inputs (resetting them if they timed out).
+        - If USER control is active, it returns the conditioned user inputs: held or extrapolated
+          across short gaps, throttle ramped down on longer ones and reset after the timeout.
         - If AUTONOMOUS control is active, it returns default values for AI control.
+        - Either way the throttle is limited to the state's throttle_cap, if one is set.
+        `frame` is the optional PreprocessedFrame for cam_image_array, whose grayscale is reused.
+        `state` is the ControlState snapshot the caller already took for this iteration.
         """
-        decided_source = self.select_active_source()
+        state = state if state is not None else self.state.snapshot
+        decided_source = self.select_active_source(state)
 
         if decided_source == ControlSource.USER:
+            self._record_input_pickup()
             if self.has_timed_out():
                 self.reset_controls()
-            return self.angle, self.throttle, decided_source.value, self.recording_enabled
+                return self.angle, self.throttle, decided_source.value, state.recording
+            throttle, angle = self.input_conditioner.output(self.clock())
+            return angle, self._apply_throttle_cap(throttle, state), decided_source.value, state.recording
 
-        throttle = self.evaluate_aruco_signals(cam_image_array)
+        throttle = self.evaluate_aruco_signals(cam_image_array, frame)
 
-        return 0.0, throttle, decided_source.value, False
+        return 0.0, self._apply_throttle_cap(throttle, state), decided_source.value, False
 
-    def evaluate_aruco_signals(self, cam_image_array):
-        gray = cv2.cvtColor(cam_image_array, cv2.COLOR_RGB2GRAY)
-        corners, ids, _ = aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
+    def _build_in_process_detector(self):
+        if self.aruco_dict is not None:
+            return
+        from cv2 import aruco
+        from services.marker_detector import TrackingMarkerDetector
+
+        aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_100)
+        self.aruco_params = aruco.DetectorParameters_create()
+        if self.marker_tracking:
+            self.tracking_detector = TrackingMarkerDetector(aruco_dict, self.aruco_params)
+        # Set last: it marks the detector as built
+        self.aruco_dict = aruco_dict
+
+    def evaluate_aruco_signals(self, cam_image_array, frame=None):
+        if self.marker_detector is not None:
+            return self.evaluate_marker_result(self.marker_detector.get_latest_result())
+
+        import cv2
+        from cv2 import aruco
+
+        self._build_in_process_detector()
+        gray = frame.gray if frame is not None else cv2.cvtColor(cam_image_array, cv2.COLOR_RGB2GRAY)
+        if self.tracking_detector is not None:
+            ids = self.tracking_detector.detect(gray)
+        else:
+            corners, ids, _ = aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
 
         if ids is not None and len(ids) > 0:
             print(f"Found {len(ids)} ArUco markers.")
             return 0.0
 
         return 0.9
+
+    def warm_up(self, frame_shape):
+        """Runs the in-process detector once on a blank frame so the first real detection is not cold."""
+        if self.marker_detector is not None:
+            return
+        from cv2 import aruco
+
+        self._build_in_process_detector()
+        gray = np.zeros(frame_shape[:2], dtype=np.uint8)
+        if self.tracking_detector is not None:
+            self.tracking_detector.detect(gray)
+            self.tracking_detector.reset()
+        else:
+            aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
+
+    def evaluate_marker_result(self, result):
+        """
+        Turns the latest out-of-process detection into a throttle value.
+        A missing or stale result fails safe to zero throttle.
+        """
+        if result is None or result.age_ms() > self.marker_staleness_ms:
+            self.stale_marker_results += 1
+            return 0.0
+
+        if result.marker_ids:
+            return 0.0
+
+        return 0.9
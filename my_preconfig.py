@@ -37,3 +37,60 @@ IMAGE_H = 480
 CAMERA_TYPE = "PICAM"
 
 USE_CUSTOM_CONTROLLER = True
+
+# Teleop video stream
+TELEOP_JPEG_QUALITY = 80
+TELEOP_VIDEO_ADAPTIVE = True  # adapt resolution, quality and frame rate to the link
+TELEOP_VIDEO_TARGET_LATENCY_MS = 150
+TELEOP_VIDEO_MODE = "jpeg"  # "tiles": send only changed tiles to viewers on the teleop.tiles.v1 subprotocol
+TELEOP_VIDEO_MAX_AGE_MS = 250  # frames that waited longer than this for a slow viewer are dropped, not sent
+
+# ArUco detection in a separate process; stale results stop the car
+TELEOP_VISION_PROCESS = True
+TELEOP_VISION_READY_TIMEOUT_S = 30.0  # /ready waits this long for the vision worker warm-up, then reports degraded
+TELEOP_MARKER_STALENESS_MS = 200
+TELEOP_MARKER_TRACKING = True  # ROI tracking + downscaled search instead of full-frame detection every frame
+
+# /control inputs delayed more than this beyond the best observed delay are dropped
+TELEOP_CONTROL_MAX_AGE_MS = 150
+
+# Fail over to autonomous control when the /autonomy heartbeat is silent this long
+TELEOP_AUTONOMY_DEADLINE_MS = 200
+
+# Wi-Fi link sampling and telemetry broadcast rate
+TELEOP_WIFI_INTERFACE = "wlan0"
+TELEOP_TELEMETRY_HZ = 1.0
+
+# AP handover: react to `iw event` disconnect/roam events instead of waiting for the next BSSID poll
+TELEOP_LINK_EVENTS = True
+TELEOP_LINK_EVENTS_REPLAY = None  # path of a recorded `iw event -t` capture to replay instead (no Wi-Fi needed)
+TELEOP_HANDOVER_THROTTLE_CAP = 0.1  # |throttle| limit until the link is back
+TELEOP_HANDOVER_VIDEO = "shrink"  # "shrink" to the lowest profile, "pause", or None to leave video alone
+
+# Runtime sampler: per-thread CPU, memory, event-loop lag and GC pauses (0 disables;
+# the experiment log then still gets system CPU and memory at 1 Hz)
+TELEOP_RUNTIME_SAMPLER_HZ = 1.0
+TELEOP_RUNTIME_SAMPLES = 300  # samples kept in memory for GET /resources
+
+# Experiment log (resource usage, AP switches, mode switches)
+TELEOP_EXPERIMENT_LOG = False
+TELEOP_LOG_DIR = "/home/pi/minicar_back/logs"
+TELEOP_LOG_MAX_MB = 50  # rotate after this size, keeping 5 old files
+TELEOP_LOG_COMPRESS = False  # gzip batches (.jsonl.gz)
+
+# Native session recorder (replaces DonkeyCar's tub writer in the drive loop when enabled)
+# Sessions journal their /control, /autonomy and state inputs; replay with `python -m services.session_replay <dir>`
+TELEOP_RECORDER = False
+TELEOP_RECORDER_DIR = "/home/pi/minicar_back/sessions"
+TELEOP_RECORDER_STORAGE = "jpeg"  # "jpeg" or "raw"
+TELEOP_RECORDER_SLOTS = 32  # frames buffered in memory while the writer catches up
+
+# User input conditioning: hold/extrapolate for HOLD_MS, then ramp throttle to zero by TIMEOUT_MS
+TELEOP_INPUT_HOLD_MS = 100
+TELEOP_INPUT_TIMEOUT_MS = 400
+
+# Server ports (WebSocket: /control, /video, /telemetry, /autonomy, /state; HTTP: /ping, /recording, /autonomy, /metrics, /resources, /ready)
+TELEOP_WS_PORT = 8080
+TELEOP_HTTP_PORT = 8081
+TELEOP_CONTROL_WS_PORT = 8082  # /control and /autonomy on their own loop, isolated from video; None disables
+TELEOP_SESSION_TTL_S = 30.0  # how long a ?session= token stays resumable after its last socket closed
@@ -0,0 +1,246 @@
+"""
+Fleet relay: one endpoint for many cars and many operators.
+
+Operators connect to ws://<relay>:9000/<car id>/<endpoint>, where endpoint is one of the
+car's own WebSocketHandler routes:
+
+- /control, /autonomy, /state: piped one-to-one to a dedicated upstream connection,
+  message by message and with the operator's subprotocol and query string, so sequence
+  numbers, timestamps, heartbeat timing and ?session= resumption reach the car unchanged.
+- /video: the relay holds one upstream /video connection per car while anyone watches,
+  and fans each frame out to every viewer (JPEG or teleop.video.v1 framed), so the car
+  encodes and sends every frame once regardless of the number of viewers.
+- /telemetry: one upstream connection per car, fanned out; a viewer whose previous
+  message is still being sent skips the tick.
+
+The shared /video and /telemetry upstreams are the relay's, not the viewer's, so their
+?session= is answered by the relay: the viewer gets the newest frame or telemetry
+message at once instead of at the next one.
+
+Plain HTTP GET /cars lists the configured cars; GET /stats returns relay counters.
+
+Usage:
+    python relay/fleet_relay.py --car car1=ws://192.168.1.11:8080 --car car2=ws://192.168.1.12:8080
+"""
+import argparse
+import asyncio
+import http
+import json
+import logging
+import os
+import sys
+from urllib.parse import urlsplit
+
+import websockets
+from websockets.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers.control_protocol import BINARY_SUBPROTOCOL  # noqa: E402
+from controllers.session_registry import split_session_path  # noqa: E402
+from services.video_broadcaster import (FRAME_HEADER, VIDEO_FRAMED_SUBPROTOCOL, EncodedFrame,  # noqa: E402
+                                        VideoBroadcaster)
+
+logger = logging.getLogger(__name__)
+
+PIPED_ENDPOINTS = ("control", "autonomy", "state")
+
+
+async def _forward(source, target, counter, key):
+    async for message in source:
+        await target.send(message)
+        counter[key] += 1
+
+
+class CarLink:
+    """Upstream side of the relay for one car."""
+
+    def __init__(self, car_id, url, reconnect_s=1.0):
+        self.car_id = car_id
+        self.url = url.rstrip("/")
+        self.reconnect_s = reconnect_s
+
+        self.video_broadcaster = VideoBroadcaster()
+        self.telemetry_clients = {}
+        self.last_telemetry = None
+        self._video_task = None
+        self._telemetry_task = None
+
+        self.video_connected = False
+        self.telemetry_connected = False
+        self.counters = {"frames_received": 0, "telemetry_received": 0, "control_forwarded": 0,
+                         "control_returned": 0, "autonomy_forwarded": 0, "autonomy_returned": 0,
+                         "state_forwarded": 0, "state_returned": 0, "upstream_errors": 0}
+        self.pipes = {endpoint: 0 for endpoint in PIPED_ENDPOINTS}
+
+    async def _upstream(self, endpoint, handle, state_attr, **options):
+        """Keeps one upstream connection open, reconnecting until cancelled."""
+        while True:
+            try:
+                async with websockets.connect(f"{self.url}/{endpoint}", compression=None, max_size=None,
+                                              **options) as upstream:
+                    setattr(self, state_attr, True)
+                    logger.info(f"[{self.car_id}] upstream /{endpoint} connected")
+                    async for message in upstream:
+                        handle(upstream, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["upstream_errors"] += 1
+                logger.warning(f"[{self.car_id}] upstream /{endpoint} failed: {e}")
+            finally:
+                setattr(self, state_attr, False)
+            await asyncio.sleep(self.reconnect_s)
+
+    def _on_video(self, upstream, message):
+        self.counters["frames_received"] += 1
+        if upstream.subprotocol == VIDEO_FRAMED_SUBPROTOCOL:
+            frame_id, _ = FRAME_HEADER.unpack_from(message)
+            jpeg = message[FRAME_HEADER.size:]
+        else:
+            frame_id, jpeg = self.counters["frames_received"], message
+        # Re-stamped with the relay's clock: viewers' echoes come back to the relay, not the car
+        self.video_broadcaster.publish(EncodedFrame(jpeg, frame_id))
+
+    def _on_telemetry(self, upstream, message):
+        self.counters["telemetry_received"] += 1
+        self.last_telemetry = message
+        for websocket, pending in list(self.telemetry_clients.items()):
+            if pending is None or pending.done():
+                self.telemetry_clients[websocket] = asyncio.ensure_future(self._send_telemetry(websocket, message))
+
+    async def _send_telemetry(self, websocket, message):
+        try:
+            await websocket.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            self.telemetry_clients.pop(websocket, None)
+
+    async def serve_video(self, websocket, catch_up=False):
+        if self._video_task is None:
+            self._video_task = asyncio.ensure_future(
+                self._upstream("video", self._on_video, "video_connected", subprotocols=[VIDEO_FRAMED_SUBPROTOCOL]))
+        try:
+            await self.video_broadcaster.serve(websocket, catch_up=catch_up)
+        finally:
+            # The car only streams while someone watches; drop the upstream with the last viewer
+            if not self.video_broadcaster.has_subscribers() and self._video_task is not None:
+                self._video_task.cancel()
+                self._video_task = None
+
+    async def serve_telemetry(self, websocket, catch_up=False):
+        pending = None
+        if catch_up and self.last_telemetry is not None:
+            pending = asyncio.ensure_future(self._send_telemetry(websocket, self.last_telemetry))
+        self.telemetry_clients[websocket] = pending
+        if self._telemetry_task is None:
+            self._telemetry_task = asyncio.ensure_future(
+                self._upstream("telemetry", self._on_telemetry, "telemetry_connected"))
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.telemetry_clients.pop(websocket, None)
+            if not self.telemetry_clients and self._telemetry_task is not None:
+                self._telemetry_task.cancel()
+                self._telemetry_task = None
+
+    async def serve_pipe(self, websocket, endpoint, query=""):
+        subprotocols = [websocket.subprotocol] if websocket.subprotocol else None
+        url = f"{self.url}/{endpoint}" + (f"?{query}" if query else "")
+        async with websockets.connect(url, subprotocols=subprotocols, compression=None) as upstream:
+            self.pipes[endpoint] += 1
+            tasks = {asyncio.ensure_future(_forward(websocket, upstream, self.counters, f"{endpoint}_forwarded")),
+                     asyncio.ensure_future(_forward(upstream, websocket, self.counters, f"{endpoint}_returned"))}
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.pipes[endpoint] -= 1
+                for task in tasks:
+                    task.cancel()
+
+    def get_stats(self):
+        stats = {
+            "url": self.url,
+            "video_connected": self.video_connected,
+            "telemetry_connected": self.telemetry_connected,
+            "telemetry_clients": len(self.telemetry_clients),
+            "pipes": dict(self.pipes),
+            "video": self.video_broadcaster.get_stats(),
+        }
+        stats.update(self.counters)
+        return stats
+
+
+class FleetRelay:
+    """Routes /<car id>/<endpoint> websocket connections to the matching CarLink."""
+
+    def __init__(self, cars, host="0.0.0.0", port=9000):
+        self.cars = {car_id: CarLink(car_id, url) for car_id, url in cars.items()}
+        self.host = host
+        self.port = port
+
+    async def _process_request(self, path, request_headers):
+        if path == "/cars":
+            body = {car_id: link.url for car_id, link in self.cars.items()}
+        elif path == "/stats":
+            body = {car_id: link.get_stats() for car_id, link in self.cars.items()}
+        else:
+            return None
+        return http.HTTPStatus.OK, [("Content-Type", "application/json")], json.dumps(body).encode()
+
+    async def router(self, websocket, path):
+        query = urlsplit(path).query
+        path, session_token = split_session_path(path)
+        _, car_id, endpoint = (path.split("/", 2) + ["", ""])[:3]
+        link = self.cars.get(car_id)
+        if link is None:
+            await websocket.close(code=4004, reason="Unknown car")
+            return
+
+        try:
+            if endpoint == "video":
+                await link.serve_video(websocket, catch_up=session_token is not None)
+            elif endpoint == "telemetry":
+                await link.serve_telemetry(websocket, catch_up=session_token is not None)
+            elif endpoint in PIPED_ENDPOINTS:
+                await link.serve_pipe(websocket, endpoint, query)
+            else:
+                await websocket.close(code=4004, reason="Unknown endpoint")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"[{car_id}] error relaying /{endpoint}: {e}")
+
+    async def run(self):
+        async with serve(self.router, self.host, self.port, compression=None, max_size=None,
+                         subprotocols=[BINARY_SUBPROTOCOL, VIDEO_FRAMED_SUBPROTOCOL],
+                         process_request=self._process_request):
+            logger.info(f"Fleet relay on ws://{self.host}:{self.port} for {len(self.cars)} cars")
+            await asyncio.Future()
+
+
+def parse_cars(values):
+    cars = {}
+    for value in values:
+        car_id, sep, url = value.partition("=")
+        if not sep or not car_id or "/" in car_id:
+            raise argparse.ArgumentTypeError(f"Expected <car id>=ws://host:port, got {value!r}")
+        cars[car_id] = url
+    return cars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--car", action="append", default=[], help="<car id>=ws://host:port (repeatable)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    cars = parse_cars(args.car)
+    if not cars:
+        parser.error("at least one --car is required")
+    asyncio.run(FleetRelay(cars, args.host, args.port).run())
+
+
+if __name__ == "__main__":
+    main()
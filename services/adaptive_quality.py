@@ -0,0 +1,133 @@
+import time
+
+# (resolution scale, JPEG quality, max frame rate), best first
+QUALITY_LADDER = [
+    (1.0, 85, 30),
+    (1.0, 70, 30),
+    (0.75, 65, 20),
+    (0.5, 60, 15),
+    (0.5, 45, 10),
+    (0.25, 40, 5),
+]
+
+
+class AdaptiveQualityController:
+    """
+    Picks the video profile (resolution scale, JPEG quality, frame rate) from the
+    measured state of the /video link.
+
+    The estimated glass-to-glass latency is encode time + publish-to-send-complete
+    time of the slowest viewer + the time its queued frames represent. When the
+    estimate exceeds the target the controller steps down the QUALITY_LADDER; it
+    steps back up only after the link has stayed well under the target for a while.
+    A weak Wi-Fi signal caps the best profile that may be used, and set_floor() caps it
+    from outside (e.g. during an AP handover) until clear_floor().
+    """
+
+    def __init__(self, target_latency_ms=150, max_quality=85, step_down_interval_s=0.5,
+                 step_up_interval_s=2.0, weak_rssi_dbm=-72, very_weak_rssi_dbm=-80, enabled=True):
+        self.target_latency_ms = target_latency_ms
+        self.step_down_interval_s = step_down_interval_s
+        self.step_up_interval_s = step_up_interval_s
+        self.weak_rssi_dbm = weak_rssi_dbm
+        self.very_weak_rssi_dbm = very_weak_rssi_dbm
+        self.enabled = enabled
+
+        self.ladder = [(scale, min(quality, max_quality), fps) for scale, quality, fps in QUALITY_LADDER]
+        self.level = 0
+        self.estimated_latency_ms = 0.0
+        self.signal_strength = None
+        self.reason = "initial"
+        self.switches = 0
+        self.floor_level = None
+
+        self._last_change = time.monotonic()
+        self._good_since = None
+
+    @property
+    def scale(self):
+        return self.ladder[self.level][0]
+
+    @property
+    def quality(self):
+        return self.ladder[self.level][1]
+
+    @property
+    def max_fps(self):
+        return self.ladder[self.level][2]
+
+    def _min_level_for_signal(self):
+        if self.signal_strength is None:
+            return 0
+        if self.signal_strength <= self.very_weak_rssi_dbm:
+            return 3
+        if self.signal_strength <= self.weak_rssi_dbm:
+            return 2
+        return 0
+
+    def set_floor(self, level, reason):
+        """Drops to `level` at once (also when adaptation is disabled) and stays there until clear_floor()."""
+        self.floor_level = max(0, min(level, len(self.ladder) - 1))
+        if self.level < self.floor_level:
+            self._set_level(self.floor_level, reason, time.monotonic())
+
+    def clear_floor(self):
+        self.floor_level = None
+        if not self.enabled:
+            # Nothing would step back up otherwise
+            self._set_level(0, "floor cleared", time.monotonic())
+
+    def _set_level(self, level, reason, now):
+        level = max(0, min(level, len(self.ladder) - 1))
+        if level != self.level:
+            self.level = level
+            self.reason = reason
+            self.switches += 1
+            self._last_change = now
+            self._good_since = None
+
+    def update(self, encode_ms, send_latency_ms, queue_depth, signal_strength=None):
+        """Feeds one set of measurements and returns True if the profile changed."""
+        if not self.enabled:
+            return False
+
+        now = time.monotonic()
+        previous = self.level
+        if signal_strength is not None:
+            self.signal_strength = signal_strength
+
+        frame_interval_ms = 1000.0 / self.max_fps
+        self.estimated_latency_ms = encode_ms + send_latency_ms + queue_depth * frame_interval_ms
+
+        min_level = self._min_level_for_signal()
+        if self.floor_level is not None:
+            min_level = max(min_level, self.floor_level)
+        if self.level < min_level:
+            self._set_level(min_level, f"weak signal ({self.signal_strength} dBm)", now)
+        elif self.estimated_latency_ms > self.target_latency_ms:
+            if now - self._last_change >= self.step_down_interval_s:
+                self._set_level(self.level + 1, f"latency {self.estimated_latency_ms:.0f} ms over target", now)
+        elif self.estimated_latency_ms < 0.6 * self.target_latency_ms and self.level > min_level:
+            if self._good_since is None:
+                self._good_since = now
+            elif now - self._good_since >= self.step_up_interval_s:
+                self._set_level(self.level - 1, "link has headroom", now)
+        else:
+            self._good_since = None
+
+        return self.level != previous
+
+    def get_state(self):
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "scale": self.scale,
+            "quality": self.quality,
+            "max_fps": self.max_fps,
+            "estimated_latency_ms": round(self.estimated_latency_ms, 1),
+            "target_latency_ms": self.target_latency_ms,
+            "signal_strength": self.signal_strength,
+            "reason": self.reason,
+            "switches": self.switches,
+            "floor_level": self.floor_level,
+        }
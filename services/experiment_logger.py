@@ -1,26 +1,36 @@
 # Logger.py
 
-import json
 import os
 import subprocess
 import time
 
-import psutil
+from services.log_writer import BatchedLogWriter
 
 
 class ExperimentLogger:
     """
     Logs key runtime events such as control mode switches, Wi-Fi AP changes,
     and system resource usage to a JSONL file for later analysis.
+
+    Entries are queued and written in batches by a BatchedLogWriter, so callers
+    never wait on the SD card. Call close() on shutdown to flush the tail.
     """
-    def __init__(self, base_dir="/home/pi/minicar_back/logs", log_name="experiment_log.jsonl"):
+    def __init__(self, base_dir="/home/pi/minicar_back/logs", log_name="experiment_log.jsonl", link_sampler=None,
+                 **writer_options):
         os.makedirs(base_dir, exist_ok=True)
-        self.log_file = os.path.join(base_dir, log_name)
+        self.writer = BatchedLogWriter(os.path.join(base_dir, log_name), **writer_options)
+        self.log_file = self.writer.path
+        # Optional shared LinkStateSampler; avoids forking iwconfig for every BSSID lookup
+        self.link_sampler = link_sampler
 
     def _write(self, entry: dict):
-        with open(self.log_file, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
-            f.flush()
+        self.writer.write(entry)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
 
     def log_ap_switch(self, bssid: str):
         entry = {
@@ -30,7 +40,24 @@ class ExperimentLogger:
         }
         self._write(entry)
 
+    def log_handover(self, event: str, bssid: str = None, previous_bssid: str = None, duration_ms: float = None):
+        """`event` is "start" (link lost or associating) or "end" (connected or roamed)."""
+        entry = {
+            "type": "handover",
+            "event": event,
+            "timestamp": int(time.time() * 1000)
+        }
+        if bssid is not None:
+            entry["bssid"] = bssid
+        if previous_bssid is not None:
+            entry["previous_bssid"] = previous_bssid
+        if duration_ms is not None:
+            entry["duration_ms"] = round(duration_ms, 1)
+        self._write(entry)
+
     def log_resource_usage(self):
+        import psutil  # only needed here; RuntimeSampler reads /proc directly
+
         entry = {
             "type": "sys",
             "cpu": psutil.cpu_percent(interval=None),
@@ -39,16 +66,38 @@ class ExperimentLogger:
         }
         self._write(entry)
 
-    def log_mode_switch(self, mode: str):
+    def log_resource_sample(self, sample: dict):
+        """Same "sys" entry as log_resource_usage, from a RuntimeSampler sample plus per-thread CPU."""
+        if sample.get("system_cpu_percent") is None:
+            return
+        entry = {
+            "type": "sys",
+            "cpu": sample["system_cpu_percent"],
+            "mem_mb": sample["mem_used_mb"],
+            "process_cpu": sample["cpu_percent"],
+            "threads": sample["threads"],
+            "rss_mb": sample["rss_mb"],
+            "loop_lag_ms": sample["loop_lag_ms"],
+            "gc_pause_ms": sample["gc_pause_ms"],
+            "timestamp": sample["timestamp"]
+        }
+        self._write(entry)
+
+    def log_mode_switch(self, mode: str, reason: str = None, elapsed_ms: float = None):
         entry = {
             "type": "mode_auto_switch",
             "mode": mode,
             "timestamp": int(time.time() * 1000)
         }
+        if reason is not None:
+            entry["reason"] = reason
+        if elapsed_ms is not None:
+            entry["elapsed_ms"] = round(elapsed_ms, 2)
         self._write(entry)
 
-    @staticmethod
-    def get_current_bssid(interface="wlan0") -> str:
+    def get_current_bssid(self, interface="wlan0") -> str:
+        if self.link_sampler is not None:
+            return self.link_sampler.snapshot.get("ap_mac") or "unknown"
         try:
             output = subprocess.check_output(["iwconfig", interface]).decode()
             for line in output.splitlines():
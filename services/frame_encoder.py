@@ -0,0 +1,50 @@
+import logging
+
+import cv2
+import numpy as np
+
+try:
+    import simplejpeg
+except ImportError:  # optional, libjpeg-turbo backed encoder
+    simplejpeg = None
+
+logger = logging.getLogger(__name__)
+
+
+class FrameEncoder:
+    """
+    JPEG encoder for RGB camera frames.
+
+    Uses simplejpeg (libjpeg-turbo, takes RGB directly) when it is installed and
+    falls back to cv2.imencode otherwise. The RGB->BGR conversion buffer for the
+    OpenCV path is allocated once and reused for every frame of the same shape.
+    """
+
+    def __init__(self, quality=80):
+        self.quality = quality
+        self._bgr_buffer = None
+        self._encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+
+        if simplejpeg is None:
+            logger.info("simplejpeg not available, using OpenCV JPEG encoder")
+
+    def set_quality(self, quality):
+        self.quality = int(quality)
+        self._encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+
+    def encode(self, rgb_array) -> bytes:
+        if rgb_array.dtype != np.uint8:
+            rgb_array = rgb_array.astype(np.uint8)
+
+        if simplejpeg is not None:
+            return simplejpeg.encode_jpeg(np.ascontiguousarray(rgb_array), quality=self.quality,
+                                          colorspace='RGB', colorsubsampling='420', fastdct=True)
+
+        if self._bgr_buffer is None or self._bgr_buffer.shape != rgb_array.shape:
+            self._bgr_buffer = np.empty_like(rgb_array)
+        cv2.cvtColor(rgb_array, cv2.COLOR_RGB2BGR, dst=self._bgr_buffer)
+
+        ok, encoded = cv2.imencode('.jpg', self._bgr_buffer, self._encode_params)
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        return encoded.tobytes()
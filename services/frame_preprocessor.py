@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+
+
+class _BufferRing:
+    """A few preallocated arrays of one shape, handed out round-robin."""
+
+    def __init__(self, shape, count):
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(count)]
+        self.index = 0
+
+    def next(self):
+        buffer = self.buffers[self.index]
+        self.index = (self.index + 1) % len(self.buffers)
+        return buffer
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class PreprocessedFrame:
+    """
+    One camera frame and the derived images consumers need.
+
+    The model-size image is computed up front; grayscale is computed on first access
+    and then shared. All arrays are read-only views into preallocated buffers.
+    """
+
+    __slots__ = ("rgb", "model", "_gray", "_gray_buffer")
+
+    def __init__(self, rgb, model, gray_buffer):
+        self.rgb = rgb
+        self.model = model
+        self._gray = None
+        self._gray_buffer = gray_buffer
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY, dst=self._gray_buffer)
+            self._gray = _read_only(self._gray_buffer)
+        return self._gray
+
+
+class FramePreprocessor:
+    """
+    Per-frame preprocessing shared by the drive loop outputs, the detector and the streamer.
+
+    Output buffers are allocated once per frame shape and reused from a small ring, so
+    a frame handed to DonkeyCar (or still being read by another part) is not overwritten
+    until `ring_size` further frames have been prepared.
+    """
+
+    def __init__(self, model_size=(160, 120), ring_size=3):
+        self.model_size = model_size
+        self.ring_size = ring_size
+        self._shape = None
+        self._model_ring = None
+        self._gray_ring = None
+
+    def _allocate(self, shape):
+        self._shape = shape
+        width, height = self.model_size
+        self._model_ring = _BufferRing((height, width) + shape[2:], self.ring_size)
+        self._gray_ring = _BufferRing(shape[:2], self.ring_size)
+
+    def prepare(self, cam_image_array) -> PreprocessedFrame:
+        if cam_image_array.dtype != np.uint8:
+            cam_image_array = cam_image_array.astype(np.uint8)
+        if cam_image_array.shape != self._shape:
+            self._allocate(cam_image_array.shape)
+
+        model = self._model_ring.next()
+        cv2.resize(cam_image_array, self.model_size, dst=model)
+        return PreprocessedFrame(_read_only(cam_image_array), _read_only(model), self._gray_ring.next())
@@ -0,0 +1,66 @@
+import threading
+import time
+from array import array
+
+
+class RollingHistogram:
+    """
+    Keeps the last `size` samples in a preallocated ring; recording is O(1) and
+    percentiles are only computed when a snapshot is requested.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.samples = array('d', bytes(8 * size))
+        self.count = 0
+        self.total_count = 0
+
+    def record(self, value):
+        self.samples[self.total_count % self.size] = value
+        self.total_count += 1
+        if self.count < self.size:
+            self.count += 1
+
+    def snapshot(self):
+        if self.count == 0:
+            return {"count": 0}
+        values = sorted(self.samples[:self.count])
+        last = self.count - 1
+        return {
+            "count": self.total_count,
+            "p50": round(values[int(last * 0.50)], 3),
+            "p95": round(values[int(last * 0.95)], 3),
+            "p99": round(values[int(last * 0.99)], 3),
+            "max": round(values[last], 3),
+        }
+
+
+class LatencyMetrics:
+    """
+    Named rolling histograms (milliseconds) for each stage of the teleop pipeline.
+
+    Frames: capture -> encoded -> sent, plus the client-echoed round trip.
+    Inputs: websocket receive -> update_user_input -> drive loop pickup.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, value_ms):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram(self.size))
+        histogram.record(value_ms)
+
+    def record_since(self, name, start_ns):
+        self.record(name, (time.monotonic_ns() - start_ns) / 1_000_000)
+
+    def get_snapshot(self):
+        return {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())}
+
+
+# Process-wide registry shared by the streamer, the websocket handlers and the decision manager
+metrics = LatencyMetrics()
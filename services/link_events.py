@@ -0,0 +1,197 @@
+import logging
+import re
+import subprocess
+import threading
+import time
+
+from services.latency_metrics import RollingHistogram
+
+logger = logging.getLogger(__name__)
+
+# `iw event -t` line: "<unix time>: <interface> (phy #N): <event text>"
+_EVENT_LINE = re.compile(r"^(?:(?P<ts>\d+\.\d+):\s*)?(?P<interface>[\w.-]+) \(phy #\d+\): (?P<text>.*)$")
+_BSSID = re.compile(r"([\da-fA-F]{2}(?::[\da-fA-F]{2}){5})")
+
+
+class LinkEvent:
+    """
+    One parsed `iw event` line.
+
+    kind is one of:
+    - "disconnected": link lost (disconnected, deauth, disassoc)
+    - "associating": authentication/association to a (new) AP in progress
+    - "connected": associated to `bssid`
+    - "roamed": firmware roam to `bssid` reported after the fact, with no down event
+    """
+    __slots__ = ("kind", "interface", "bssid", "timestamp", "received_ns", "text")
+
+    def __init__(self, kind, interface, bssid=None, timestamp=None, received_ns=None, text=""):
+        self.kind = kind
+        self.interface = interface
+        self.bssid = bssid
+        self.timestamp = timestamp
+        self.received_ns = time.monotonic_ns() if received_ns is None else received_ns
+        self.text = text
+
+
+def parse_iw_event(line):
+    """Returns a LinkEvent for link state lines of `iw event -t`, None for everything else."""
+    match = _EVENT_LINE.match(line.strip())
+    if match is None:
+        return None
+    text = match.group("text")
+    if text.startswith(("disconnected", "deauth", "disassoc")):
+        kind = "disconnected"
+    elif text.startswith("connected to"):
+        kind = "connected"
+    elif text.startswith("roamed"):
+        kind = "roamed"
+    elif text.startswith(("auth", "assoc")):
+        kind = "associating"
+    else:
+        return None
+    bssid = _BSSID.search(text) if kind in ("connected", "roamed") else None
+    timestamp = float(match.group("ts")) if match.group("ts") else None
+    return LinkEvent(kind, match.group("interface"), bssid.group(1).lower() if bssid else None, timestamp, text=text)
+
+
+def replay_iw_events(path, speed=1.0):
+    """
+    Yields the lines of a recorded `iw event -t` capture with their original spacing
+    (divided by `speed`), so handovers can be reproduced without Wi-Fi hardware.
+    Lines starting with "#" are comments.
+    """
+    started = time.monotonic()
+    first_ts = None
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            match = _EVENT_LINE.match(line.strip())
+            if match is not None and match.group("ts"):
+                ts = float(match.group("ts"))
+                first_ts = ts if first_ts is None else first_ts
+                delay = started + (ts - first_ts) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield line
+
+
+class LinkEventMonitor:
+    """
+    Reacts to Wi-Fi link events as they happen instead of polling the BSSID.
+
+    - Reads a line stream of `iw event -t` (the default: a long-running `iw` process,
+      restarted if it exits) or any iterable of such lines, e.g. replay_iw_events().
+    - A disconnect or an association in progress starts a handover: listeners are
+      called with (event, None) at once, on the monitor thread.
+    - The next "connected" ends it: listeners get (event, duration_ms). Durations come
+      from the iw timestamps when present, else from the receive times. A firmware
+      "roamed" event is reported the same way with a duration of 0.
+    """
+
+    def __init__(self, interface="wlan0", source=None, restart_s=5.0):
+        self.interface = interface
+        self.source = source
+        self.restart_s = restart_s
+        self.listeners = []
+
+        self.in_handover = False
+        self.bssid = None
+        self._handover_start = None
+        self.handovers = 0
+        self.durations = RollingHistogram(size=128)
+        self.last_handover = None
+        self.events = 0
+
+        self.running = False
+        self._process = None
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="link-events", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._process is not None:
+            self._process.terminate()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        if self.source is not None:
+            self._consume(self.source)
+            return
+        while self.running:
+            try:
+                self._process = subprocess.Popen(["iw", "event", "-t"], stdout=subprocess.PIPE,
+                                                 stderr=subprocess.DEVNULL, text=True, bufsize=1)
+                self._consume(self._process.stdout)
+                self._process.wait()
+            except OSError as e:
+                logger.warning(f"`iw event` not available: {e}")
+            if self.running:
+                logger.warning(f"`iw event` exited, restarting in {self.restart_s} s")
+                time.sleep(self.restart_s)
+
+    def _consume(self, lines):
+        for line in lines:
+            if not self.running:
+                return
+            event = parse_iw_event(line)
+            if event is not None and event.interface == self.interface:
+                self.handle(event)
+
+    def handle(self, event: LinkEvent):
+        self.events += 1
+        if event.kind in ("disconnected", "associating"):
+            if self.in_handover:
+                return
+            self.in_handover = True
+            self._handover_start = event
+            logger.info(f"Link handover started: {event.text}")
+            self._notify(event, None)
+            return
+
+        if event.kind == "connected" and not self.in_handover:
+            # Initial association, or a reconnect whose down event was missed
+            self.bssid = event.bssid
+            return
+
+        # connected after a handover, or a firmware roam
+        start = self._handover_start if self.in_handover else event
+        if start.timestamp is not None and event.timestamp is not None:
+            duration_ms = (event.timestamp - start.timestamp) * 1000
+        else:
+            duration_ms = (event.received_ns - start.received_ns) / 1_000_000
+        self.last_handover = {"from": self.bssid, "to": event.bssid, "kind": event.kind,
+                              "duration_ms": round(duration_ms, 1)}
+        self.in_handover = False
+        self._handover_start = None
+        self.bssid = event.bssid
+        self.handovers += 1
+        self.durations.record(duration_ms)
+        logger.info(f"Link handover finished: {self.last_handover}")
+        self._notify(event, duration_ms)
+
+    def _notify(self, event, duration_ms):
+        for listener in self.listeners:
+            try:
+                listener(event, duration_ms)
+            except Exception as e:
+                logger.error(f"Error in link event listener: {e}")
+
+    def get_stats(self):
+        return {
+            "in_handover": self.in_handover,
+            "bssid": self.bssid,
+            "events": self.events,
+            "handovers": self.handovers,
+            "last_handover": self.last_handover,
+            "duration_ms": self.durations.snapshot(),
+        }
@@ -0,0 +1,125 @@
+import logging
+import re
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def get_wifi_details(interface="wlan0"):
+    """
+    Retrieves the current connected BSSID and signal strength using `iw`.
+    Returns a dictionary with 'ap_mac' and 'signal_strength'.
+    """
+    details = {"ap_mac": None, "signal_strength": None}
+
+    try:
+        result = subprocess.run(
+            ["iw", "dev", interface, "link"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True
+        )
+        output = result.stdout
+
+        # Extract BSSID (AP MAC)
+        bssid_match = re.search(r"Connected to ([\da-fA-F:]{17})", output)
+        if bssid_match:
+            details["ap_mac"] = bssid_match.group(1)
+
+        # Extract signal strength (RSSI)
+        signal_match = re.search(r"signal: (-\d+)", output)
+        if signal_match:
+            details["signal_strength"] = float(signal_match.group(1))
+
+    except subprocess.CalledProcessError as e:
+        logger.error(f"`iw` command failed: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error while reading Wi-Fi info: {e}")
+
+    return details
+
+
+def read_proc_wireless(interface="wlan0", path="/proc/net/wireless"):
+    """
+    Reads link quality and signal level for the interface from /proc/net/wireless.
+    Returns (link_quality, signal_dbm), or (None, None) if the interface is not listed.
+    """
+    with open(path) as f:
+        for line in f:
+            name, sep, rest = line.partition(":")
+            if sep and name.strip() == interface:
+                fields = rest.split()
+                return float(fields[1].rstrip(".")), float(fields[2].rstrip("."))
+    return None, None
+
+
+class LinkStateSampler:
+    """
+    Single background sampler of the Wi-Fi link shared by telemetry, the video
+    quality controller, the resource monitor and the experiment logger.
+
+    - Signal level is read from /proc/net/wireless every `interval` seconds (no fork).
+    - The BSSID needs `iw`, so it is refreshed only every `bssid_refresh_s` seconds.
+    - Readers get the latest snapshot dict without blocking; it is replaced, never mutated.
+    """
+
+    def __init__(self, interface="wlan0", interval=0.5, bssid_refresh_s=5.0):
+        self.interface = interface
+        self.interval = interval
+        self.bssid_refresh_s = bssid_refresh_s
+
+        self.snapshot = {"ap_mac": None, "signal_strength": None, "link_quality": None, "timestamp": None}
+        self.samples = 0
+        self.running = False
+        self._thread = None
+        self._last_bssid_refresh = 0.0
+        self._proc_available = True
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, name="link-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2 + 1)
+
+    def refresh_bssid(self):
+        """Forces a BSSID refresh on the next sample (e.g. after a roam event)."""
+        self._last_bssid_refresh = 0.0
+
+    def _sample(self):
+        snapshot = dict(self.snapshot)
+        now = time.monotonic()
+
+        if self._proc_available:
+            try:
+                snapshot["link_quality"], snapshot["signal_strength"] = read_proc_wireless(self.interface)
+            except OSError as e:
+                logger.warning(f"/proc/net/wireless not readable, falling back to iw: {e}")
+                self._proc_available = False
+
+        if not self._proc_available or now - self._last_bssid_refresh >= self.bssid_refresh_s:
+            details = get_wifi_details(self.interface)
+            snapshot["ap_mac"] = details["ap_mac"]
+            if not self._proc_available:
+                snapshot["signal_strength"] = details["signal_strength"]
+            self._last_bssid_refresh = now
+
+        snapshot["timestamp"] = int(time.time() * 1000)
+        self.snapshot = snapshot
+        self.samples += 1
+
+    def _loop(self):
+        while self.running:
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"Error sampling Wi-Fi link: {e}")
+            time.sleep(self.interval)
@@ -0,0 +1,693 @@
+"""
+Streaming analysis of ExperimentLogger logs (experiment_log.jsonl and its rotations).
+
+- LogIndex: a sidecar time index per log file (<file>.idx.json). The file is split
+  into seekable blocks (line boundaries; gzip member boundaries for .gz) and each
+  block keeps, per entry type, its count and first/last timestamp, and where the
+  entries are for types that are rare in it. Queries only read the blocks (or lines)
+  that can match; a grown log is indexed from its last block on.
+- LogAnalyzer: the rotated set of one log (.5 ... .1, then the live file) as one
+  stream, with indexed queries and conversion to columns.
+- ColumnarLog: one .npy column per entry type and field, written in chunks and read
+  memory-mapped, for vectorized aggregation such as CPU percentiles around each AP switch.
+
+Everything streams; memory does not grow with the size of the logs.
+
+    python -m services.log_analyzer logs/experiment_log.jsonl summary
+    python -m services.log_analyzer logs/experiment_log.jsonl query --type ap_switch
+    python -m services.log_analyzer logs/experiment_log.jsonl columns --out logs/columns
+    python -m services.log_analyzer logs/experiment_log.jsonl around --anchor ap_switch --field cpu
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+BLOCK_BYTES = 256 * 1024
+# Types with at most this many entries in a block have their offsets indexed too
+SPARSE_ENTRIES = 16
+_READ_BYTES = 64 * 1024
+_HEAD_BYTES = 4096
+_ROTATED = re.compile(r"\.(\d+)$")
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+# Decompressed bytes of one gzip member held back until it is known to be intact
+_HOLD_BYTES = 1024 * 1024
+
+
+def log_files(path):
+    """The log at `path` and its rotations that exist, oldest first."""
+    directory = os.path.dirname(path) or "."
+    name = os.path.basename(path)
+    rotated = []
+    for candidate in os.listdir(directory):
+        if candidate.startswith(name + "."):
+            match = _ROTATED.search(candidate)
+            if match and candidate == f"{name}.{match.group(1)}":
+                rotated.append((int(match.group(1)), os.path.join(directory, candidate)))
+    files = [file for _, file in sorted(rotated, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def is_gzip(path):
+    return ".gz" in os.path.basename(path)
+
+
+def read_lines(path, start=0, end=None):
+    """
+    Yields (resume offset, line bytes) from `start` until a line whose resume offset is
+    at or past `end`. The resume offset is where reading must start to get the line:
+    the line itself in a plain file, the gzip member it began in for .gz files (whose
+    members may be cut short by a power loss; everything before the cut is read).
+    """
+    with open(path, "rb") as f:
+        if is_gzip(path):
+            yield from _gzip_lines(f, start, end)
+        else:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if end is not None and offset >= end:
+                    return
+                yield offset, line
+                offset += len(line)
+
+
+def _gzip_lines(f, start, end):
+    member_at = resume = start
+    while True:
+        f.seek(member_at)
+        position = member_at
+        decompressor = zlib.decompressobj(31)
+        carry = member_carry = b""
+        # Lines of the current member are held until it ends intact (batches are small)
+        held, held_bytes, member_yielded = [], 0, False
+        damaged = None
+        while damaged is None:
+            raw = f.read(_READ_BYTES)
+            if not raw:
+                break
+            pending, pending_at = raw, position
+            position += len(raw)
+            while pending:
+                try:
+                    data = decompressor.decompress(pending)
+                except zlib.error as e:
+                    damaged = str(e)
+                    break
+                lines = (carry + data).split(b"\n")
+                carry = lines.pop()
+                held.extend(lines)
+                held_bytes += len(data)
+                if decompressor.eof or held_bytes > _HOLD_BYTES:
+                    member_yielded = member_yielded or not decompressor.eof
+                    for line in held:
+                        yield resume, line + b"\n"
+                    held, held_bytes = [], 0
+                if not decompressor.eof:
+                    break
+                # Member finished: the rest belongs to the next one
+                pending_at += len(pending) - len(decompressor.unused_data)
+                pending = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+                member_at = pending_at
+                member_yielded = False
+                member_carry = carry
+                if not carry:
+                    resume = member_at
+                    if end is not None and resume >= end:
+                        return
+        if damaged is None and member_at == position:
+            return
+
+        # The member at member_at is cut short (power loss) or damaged. The writer may have
+        # appended batches after it since, which its decompressor swallowed as garbage, so
+        # only what decodes from the member's own bytes is kept.
+        following = _find_member(f, member_at + 1)
+        if not member_yielded:
+            held = _salvage(f, member_at, following, member_carry)
+        elif carry:
+            held.append(carry)
+        for line in held:
+            yield resume, line if line.endswith(b"\n") else line + b"\n"
+        if following is None:
+            return
+        logger.warning(f"{f.name}: damaged gzip member at byte {member_at} ({damaged or 'cut short'})")
+        member_at = resume = following
+        if end is not None and resume >= end:
+            return
+
+
+def _salvage(f, start, end, prefix):
+    """Lines decodable from the gzip bytes [start, end) (end None: to the end of the file)."""
+    f.seek(start)
+    decompressor = zlib.decompressobj(31)
+    data = [prefix]
+    remaining = end - start if end is not None else None
+    while remaining is None or remaining > 0:
+        raw = f.read(4096 if remaining is None else min(4096, remaining))
+        if not raw:
+            break
+        if remaining is not None:
+            remaining -= len(raw)
+        try:
+            data.append(decompressor.decompress(raw))
+        except zlib.error:
+            break
+    lines = b"".join(data).split(b"\n")
+    partial = lines.pop()
+    # A line cut off mid-way is still returned, to be counted as invalid
+    return lines + ([partial] if partial else [])
+
+
+def _find_member(f, offset):
+    """Offset of the next gzip member header at or after `offset`, or None."""
+    f.seek(offset)
+    tail = b""
+    while True:
+        raw = f.read(_READ_BYTES)
+        if not raw:
+            return None
+        found = (tail + raw).find(_GZIP_MAGIC)
+        if found >= 0:
+            return offset - len(tail) + found
+        tail = raw[-(len(_GZIP_MAGIC) - 1):]
+        offset += len(raw)
+
+
+def parse_line(line):
+    """Returns the entry dict, or None for blank lines; raises ValueError for anything else."""
+    if not line.strip():
+        return None
+    entry = json.loads(line)
+    if not isinstance(entry, dict):
+        raise ValueError("log entry is not an object")
+    return entry
+
+
+def flatten(entry, prefix=""):
+    """Yields (field, value) for numeric, boolean and string fields; nested objects become "a.b"."""
+    for key, value in entry.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        elif isinstance(value, (bool, int, float, str)):
+            yield name, value
+
+
+def _kind(value):
+    return "str" if isinstance(value, str) else "num"
+
+
+class LogIndex:
+    """
+    Sidecar index of one log file: blocks of the file with per-type counts and time
+    ranges (and the entries' offsets for types rare in the block), plus every type's
+    fields and their kind ("num" or "str").
+
+    Stored as <file>.idx.json together with the file's indexed size and a checksum of
+    its head, so a log that grew is indexed from its last block and a rotated or
+    replaced one is indexed again.
+    """
+
+    def __init__(self, path, block_bytes=BLOCK_BYTES):
+        self.path = path
+        self.index_path = path + ".idx.json"
+        self.block_bytes = block_bytes
+        self.size = 0
+        self.head_crc = None
+        self.blocks = []
+        self.fields = {}
+        self.invalid = 0
+
+    @classmethod
+    def load_or_build(cls, path, block_bytes=BLOCK_BYTES, save=True):
+        index = cls(path, block_bytes)
+        size = os.path.getsize(path)
+        head_crc = index._head_crc()
+        stored = index._load()
+        if stored is not None and stored["head_crc"] == head_crc and stored["size"] <= size:
+            index._restore(stored)
+            if stored["size"] == size:
+                return index
+            # Appended since: the last block may have been incomplete, so it is scanned again
+            last = index.blocks.pop() if index.blocks else None
+            index.invalid -= last["invalid"] if last else 0
+            index.scan(last["offset"] if last else 0)
+        else:
+            index.scan(0)
+        if save:
+            index.save()
+        return index
+
+    def _head_crc(self):
+        with open(self.path, "rb") as f:
+            return zlib.crc32(f.read(_HEAD_BYTES))
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stored.get("version") != INDEX_VERSION or stored.get("block_bytes") != self.block_bytes:
+            return None
+        return stored
+
+    def _restore(self, stored):
+        self.size = stored["size"]
+        self.head_crc = stored["head_crc"]
+        self.blocks = stored["blocks"]
+        self.fields = stored["fields"]
+        self.invalid = stored["invalid"]
+
+    def save(self):
+        temporary = self.index_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": INDEX_VERSION, "block_bytes": self.block_bytes, "size": self.size,
+                       "head_crc": self.head_crc, "invalid": self.invalid, "fields": self.fields,
+                       "blocks": self.blocks}, f)
+        os.replace(temporary, self.index_path)
+
+    def scan(self, start):
+        """Indexes the file from `start` (a block boundary) to its current end."""
+        size = os.path.getsize(self.path)
+        self.head_crc = self._head_crc()
+        block = None
+        for offset, line in read_lines(self.path, start):
+            if block is None or (offset > block["offset"] and offset - block["offset"] >= self.block_bytes):
+                block = self._new_block(offset)
+            try:
+                entry = parse_line(line)
+            except ValueError:
+                block["invalid"] += 1
+                self.invalid += 1
+                continue
+            if entry is None:
+                continue
+            self._add(block, entry, offset)
+        self.size = size
+        for current, following in zip(self.blocks, self.blocks[1:]):
+            current["length"] = following["offset"] - current["offset"]
+        if self.blocks:
+            self.blocks[-1]["length"] = size - self.blocks[-1]["offset"]
+
+    def _new_block(self, offset):
+        block = {"offset": offset, "length": 0, "entries": 0, "invalid": 0, "types": {}}
+        self.blocks.append(block)
+        return block
+
+    def _add(self, block, entry, offset):
+        entry_type = str(entry.get("type"))
+        timestamp = entry.get("timestamp")
+        block["entries"] += 1
+        stats = block["types"].get(entry_type)
+        if stats is None:
+            stats = block["types"][entry_type] = [0, None, None, []]
+        stats[0] += 1
+        if isinstance(timestamp, (int, float)):
+            stats[1] = timestamp if stats[1] is None else min(stats[1], timestamp)
+            stats[2] = timestamp if stats[2] is None else max(stats[2], timestamp)
+        # Rare types (AP switches among resource samples) keep where each entry is
+        offsets = stats[3]
+        if offsets is not None:
+            if len(offsets) >= SPARSE_ENTRIES:
+                stats[3] = None
+            elif not offsets or offsets[-1] != offset:
+                offsets.append(offset)
+
+        fields = self.fields.setdefault(entry_type, {})
+        for name, value in flatten(entry):
+            if name == "type":
+                continue
+            kind = fields.get(name)
+            if kind is None:
+                fields[name] = _kind(value)
+            elif kind != _kind(value):
+                fields[name] = "str"
+
+    def types(self):
+        """{type: {"count", "first", "last"}} over the whole file."""
+        totals = {}
+        for block in self.blocks:
+            for entry_type, (count, first, last, _) in block["types"].items():
+                total = totals.setdefault(entry_type, {"count": 0, "first": None, "last": None})
+                total["count"] += count
+                if first is not None:
+                    total["first"] = first if total["first"] is None else min(total["first"], first)
+                    total["last"] = last if total["last"] is None else max(total["last"], last)
+        return totals
+
+    def blocks_for(self, types=None, start_ms=None, end_ms=None):
+        """
+        Yields (block, offsets) for the blocks that may hold entries of `types` (None: any)
+        timestamped within [start_ms, end_ms]. `offsets` are the resume offsets of the
+        matching entries when only rare types match, else None: read the whole block.
+        """
+        for block in self.blocks:
+            offsets = set() if types is not None else None
+            matched = False
+            for entry_type, (_, first, last, type_offsets) in block["types"].items():
+                if types is not None and entry_type not in types:
+                    continue
+                if first is None:
+                    # Entries without a timestamp only match unbounded queries
+                    if start_ms is not None or end_ms is not None:
+                        continue
+                elif (start_ms is not None and last < start_ms) or (end_ms is not None and first > end_ms):
+                    continue
+                matched = True
+                if type_offsets is None or offsets is None:
+                    offsets = None
+                else:
+                    offsets.update(type_offsets)
+            if matched:
+                yield block, sorted(offsets) if offsets is not None else None
+
+
+def _matches(entry, types, start_ms, end_ms):
+    if types is not None and str(entry.get("type")) not in types:
+        return False
+    if start_ms is None and end_ms is None:
+        return True
+    timestamp = entry.get("timestamp")
+    if not isinstance(timestamp, (int, float)):
+        return False
+    return (start_ms is None or timestamp >= start_ms) and (end_ms is None or timestamp <= end_ms)
+
+
+class LogAnalyzer:
+    """
+    One experiment log with its rotations (.N, oldest first), indexed on first use.
+
+    entries() reads only the indexed blocks that can match; scan() is the unindexed
+    full pass, kept for comparison and for logs that cannot be indexed.
+    """
+
+    def __init__(self, path, block_bytes=BLOCK_BYTES, save_index=True):
+        self.path = path
+        self.files = log_files(path)
+        self.block_bytes = block_bytes
+        self.save_index = save_index
+        self._indexes = {}
+        self.invalid = 0
+
+    def index(self, file):
+        index = self._indexes.get(file)
+        if index is None:
+            index = self._indexes[file] = LogIndex.load_or_build(file, self.block_bytes, self.save_index)
+        return index
+
+    def build_indexes(self):
+        return [self.index(file) for file in self.files]
+
+    def summary(self):
+        files = []
+        for file in self.files:
+            index = self.index(file)
+            files.append({"file": os.path.basename(file), "bytes": index.size, "blocks": len(index.blocks),
+                          "invalid_lines": index.invalid, "types": index.types()})
+        return files
+
+    def entries(self, types=None, start_ms=None, end_ms=None):
+        """Yields the entries of `types` (None: all) within [start_ms, end_ms], in file order."""
+        types = set(types) if types is not None else None
+        for file in self.files:
+            index = self.index(file)
+            for block, offsets in index.blocks_for(types, start_ms, end_ms):
+                ranges = [(offset, offset + 1) for offset in offsets] if offsets is not None else \
+                    [(block["offset"], block["offset"] + block["length"])]
+                for start, end in ranges:
+                    for _, line in read_lines(file, start, end):
+                        entry = self._parse(line)
+                        if entry is not None and _matches(entry, types, start_ms, end_ms):
+                            yield entry
+
+    def scan(self, types=None, start_ms=None, end_ms=None):
+        """Same as entries(), reading every line of every file."""
+        types = set(types) if types is not None else None
+        for file in self.files:
+            for _, line in read_lines(file):
+                entry = self._parse(line)
+                if entry is not None and _matches(entry, types, start_ms, end_ms):
+                    yield entry
+
+    def _parse(self, line):
+        try:
+            return parse_line(line)
+        except ValueError:
+            self.invalid += 1
+            return None
+
+    def to_columns(self, out_dir, types=None, chunk_rows=4096):
+        """
+        Writes every entry type (or `types`) as columns under out_dir/<type>/<field>.npy
+        plus out_dir/schema.json, and returns a ColumnarLog on them. "timestamp" is int64
+        (-1 if missing), other numbers float64 (NaN if missing), strings int32 codes
+        into the schema's "values" (-1 if missing). Covers the logs as indexed when
+        the call started, so a live log may be appended to meanwhile.
+        """
+        indexes = self.build_indexes()
+        rows, fields = {}, {}
+        for index in indexes:
+            for entry_type, total in index.types().items():
+                if types is None or entry_type in types:
+                    rows[entry_type] = rows.get(entry_type, 0) + total["count"]
+            for entry_type, type_fields in index.fields.items():
+                merged = fields.setdefault(entry_type, {})
+                for name, kind in type_fields.items():
+                    merged[name] = kind if merged.get(name, kind) == kind else "str"
+
+        os.makedirs(out_dir, exist_ok=True)
+        tables = {entry_type: _TableWriter(out_dir, entry_type, rows[entry_type], fields.get(entry_type, {}),
+                                           chunk_rows) for entry_type in rows}
+        try:
+            for file, index in zip(self.files, indexes):
+                for _, line in read_lines(file, 0, index.size):
+                    entry = self._parse(line)
+                    if entry is None:
+                        continue
+                    table = tables.get(str(entry.get("type")))
+                    if table is not None and table.written < table.rows:
+                        table.append(entry)
+        finally:
+            schema = {entry_type: table.close() for entry_type, table in tables.items()}
+        with open(os.path.join(out_dir, "schema.json"), "w") as f:
+            json.dump({"source": [os.path.basename(file) for file in self.files], "types": schema}, f, indent=1)
+        return ColumnarLog(out_dir)
+
+
+class _ColumnWriter:
+    """One .npy column, written `chunk_rows` values at a time."""
+
+    def __init__(self, path, dtype, rows, missing, chunk_rows):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.missing = missing
+        self.buffer = np.full(chunk_rows, missing, dtype=self.dtype)
+        self.filled = 0
+        self.file = open(path, "wb")
+        np.lib.format.write_array_header_1_0(self.file, {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                                                         "fortran_order": False, "shape": (rows,)})
+
+    def set(self, row, value):
+        self.buffer[row] = value
+
+    def flush(self, rows):
+        self.file.write(self.buffer[:rows].tobytes())
+        self.buffer.fill(self.missing)
+
+    def close(self):
+        self.file.close()
+
+
+class _TableWriter:
+    def __init__(self, out_dir, entry_type, rows, fields, chunk_rows):
+        self.directory = os.path.join(out_dir, _safe_name(entry_type))
+        os.makedirs(self.directory, exist_ok=True)
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+        self.written = 0
+        self._row = 0
+        self.sorted = True
+        self._last_timestamp = None
+        self.kinds = dict(fields)
+        self.kinds["timestamp"] = "time"
+        self.kinds.pop("type", None)
+        self.values = {name: {} for name, kind in self.kinds.items() if kind == "str"}
+        self.columns = {}
+        for name, kind in self.kinds.items():
+            dtype, missing = {"time": ("<i8", -1), "num": ("<f8", np.nan), "str": ("<i4", -1)}[kind]
+            self.columns[name] = _ColumnWriter(os.path.join(self.directory, _safe_name(name) + ".npy"), dtype,
+                                               rows, missing, chunk_rows)
+
+    def append(self, entry):
+        for name, value in flatten(entry):
+            column = self.columns.get(name)
+            if column is None:
+                continue
+            kind = self.kinds[name]
+            if kind == "str":
+                values = self.values[name]
+                value = values.setdefault(str(value), len(values))
+            elif kind == "time":
+                value = int(value) if isinstance(value, (int, float)) else -1
+                if self._last_timestamp is not None and value < self._last_timestamp:
+                    self.sorted = False
+                self._last_timestamp = value
+            elif isinstance(value, str):
+                continue
+            column.set(self._row, value)
+        self._row += 1
+        self.written += 1
+        if self._row == self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        for column in self.columns.values():
+            column.flush(self._row)
+        self._row = 0
+
+    def close(self):
+        # Rows the index counted but the stream no longer had (e.g. a rewritten file) stay missing
+        while self.written < self.rows:
+            self._row += 1
+            self.written += 1
+            if self._row == self.chunk_rows:
+                self._flush()
+        self._flush()
+        for column in self.columns.values():
+            column.close()
+        schema = {"rows": self.rows, "sorted": self.sorted, "columns": {}}
+        for name, kind in self.kinds.items():
+            column = {"kind": kind, "file": os.path.relpath(self.columns[name].path, os.path.dirname(self.directory))}
+            if kind == "str":
+                column["values"] = list(self.values[name])
+            schema["columns"][name] = column
+        return schema
+
+
+def _safe_name(name):
+    return re.sub(r"[^\w.-]", "_", name)
+
+
+class ColumnarLog:
+    """Columns written by LogAnalyzer.to_columns(), memory-mapped."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "schema.json")) as f:
+            self.schema = json.load(f)
+        self.types = self.schema["types"]
+        self._order = {}
+
+    def rows(self, entry_type):
+        return self.types[entry_type]["rows"] if entry_type in self.types else 0
+
+    def column(self, entry_type, field):
+        """The column as an array (memory-mapped); string columns are codes into labels()."""
+        column = self.types[entry_type]["columns"][field]
+        return np.load(os.path.join(self.directory, column["file"]), mmap_mode="r")
+
+    def labels(self, entry_type, field):
+        return self.types[entry_type]["columns"][field]["values"]
+
+    def strings(self, entry_type, field):
+        """A string column decoded (None where missing); loads the column."""
+        labels = np.array(self.labels(entry_type, field) + [None], dtype=object)
+        return labels[np.asarray(self.column(entry_type, field))]
+
+    def _time_order(self, entry_type):
+        """Row order by timestamp (None if the rows already are), computed once per type."""
+        if entry_type not in self._order:
+            order = None
+            if not self.types[entry_type]["sorted"]:
+                order = np.argsort(self.column(entry_type, "timestamp"), kind="stable")
+            self._order[entry_type] = order
+        return self._order[entry_type]
+
+    def window_stats(self, anchor_type, target_type, field, before_ms=10_000, after_ms=10_000,
+                     percentiles=(50, 95), anchor_filter=None):
+        """
+        For each `anchor_type` entry (optionally only rows where `anchor_filter(anchor
+        row index)` is true), percentiles of `target_type`'s `field` in the `before_ms`
+        before it and the `after_ms` after it, e.g. CPU around every AP switch.
+        """
+        anchors = np.asarray(self.column(anchor_type, "timestamp"))
+        if anchor_filter is not None:
+            anchors = anchors[[i for i in range(len(anchors)) if anchor_filter(i)]]
+        timestamps = self.column(target_type, "timestamp")
+        values = self.column(target_type, field)
+        order = self._time_order(target_type)
+        if order is not None:
+            timestamps, values = timestamps[order], values[order]
+
+        starts = np.searchsorted(timestamps, anchors - before_ms, side="left")
+        middles = np.searchsorted(timestamps, anchors, side="left")
+        ends = np.searchsorted(timestamps, anchors + after_ms, side="right")
+        results = []
+        for anchor, start, middle, end in zip(anchors, starts, middles, ends):
+            result = {"timestamp": int(anchor)}
+            for window, (low, high) in (("before", (start, middle)), ("after", (middle, end))):
+                window_values = np.asarray(values[low:high], dtype=np.float64)
+                window_values = window_values[~np.isnan(window_values)]
+                stats = {"count": int(len(window_values))}
+                if len(window_values):
+                    for p, value in zip(percentiles, np.percentile(window_values, percentiles)):
+                        stats[f"p{p:g}"] = round(float(value), 2)
+                result[window] = stats
+            results.append(result)
+        return results
+
+
+def _time_ms(value):
+    return None if value is None else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("log", help="the live log file; its rotations are found next to it")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("summary", help="index the logs; counts and time ranges per type and file")
+    query = commands.add_parser("query", help="print matching entries as JSONL")
+    query.add_argument("--type", action="append", dest="types", help="entry type (repeatable; default: all)")
+    query.add_argument("--start-ms", type=float)
+    query.add_argument("--end-ms", type=float)
+    columns = commands.add_parser("columns", help="convert to columns (.npy per field)")
+    columns.add_argument("--out", required=True)
+    around = commands.add_parser("around", help="percentiles of a field before and after each anchor entry")
+    around.add_argument("--columns", help="columns written earlier (default: convert to <log>.columns)")
+    around.add_argument("--anchor", default="ap_switch")
+    around.add_argument("--target", default="sys")
+    around.add_argument("--field", default="cpu")
+    around.add_argument("--before-ms", type=float, default=10_000)
+    around.add_argument("--after-ms", type=float, default=10_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    analyzer = LogAnalyzer(args.log)
+    if args.command == "summary":
+        print(json.dumps(analyzer.summary(), indent=2))
+    elif args.command == "query":
+        for entry in analyzer.entries(args.types, _time_ms(args.start_ms), _time_ms(args.end_ms)):
+            sys.stdout.write(json.dumps(entry) + "\n")
+    elif args.command == "columns":
+        columnar = analyzer.to_columns(args.out)
+        print(json.dumps({entry_type: columnar.rows(entry_type) for entry_type in columnar.types}, indent=2))
+    elif args.command == "around":
+        columnar = ColumnarLog(args.columns) if args.columns else analyzer.to_columns(args.log + ".columns")
+        print(json.dumps(columnar.window_stats(args.anchor, args.target, args.field, args.before_ms, args.after_ms),
+                         indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedLogWriter:
+    """
+    Asynchronous JSONL writer for ExperimentLogger.
+
+    - write() only appends to an in-memory queue and never touches the disk.
+    - A background thread writes queued entries in one batch when `batch_size`
+      entries are waiting or `flush_interval_s` has passed, whichever is first.
+    - The queue holds at most `max_pending` entries; entries beyond that are
+      counted in `dropped` instead of growing memory while the card is stalled.
+    - When the file exceeds `max_bytes` it is rotated to .1, .2, ... keeping
+      `backup_count` old files.
+    - compress=True writes gzip members (".gz"); each batch is one member, so a
+      file cut off by a power loss is still readable up to the last batch.
+    """
+
+    def __init__(self, path, batch_size=64, flush_interval_s=2.0, max_pending=10_000,
+                 max_bytes=50 * 1024 * 1024, backup_count=5, compress=False):
+        self.path = path + ".gz" if compress and not path.endswith(".gz") else path
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_requested = False
+        self.running = True
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.last_batch_ms = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, entry: dict):
+        with self._cond:
+            if len(self._queue) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._queue.append(entry)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued so far is on disk."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify()
+            deadline = time.monotonic() + timeout
+            while (self._queue or self._flush_requested) and self.running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+    def close(self):
+        if not self.running:
+            return
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=10.0)
+
+    def _take_batch(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval_s
+            while self.running and not self._flush_requested and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = list(self._queue)
+            self._queue.clear()
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error writing log batch of {len(batch)} entries: {e}")
+            with self._cond:
+                self._flush_requested = False
+                self._cond.notify_all()
+                if not self.running and not self._queue:
+                    return
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        data = "".join(json.dumps(entry) + "\n" for entry in batch).encode()
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+
+        self._rotate_if_needed(len(data))
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - start) * 1000
+
+    def _rotate_if_needed(self, incoming):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+    def get_stats(self):
+        return {
+            "pending": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+        }
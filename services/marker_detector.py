@@ -0,0 +1,109 @@
+import cv2
+import numpy as np
+from cv2 import aruco
+
+
+class _Track:
+    def __init__(self, marker_id, bbox):
+        self.marker_id = marker_id
+        self.bbox = bbox
+        self.misses = 0
+
+
+class TrackingMarkerDetector:
+    """
+    ArUco detector that avoids full-resolution full-frame scans on most frames.
+
+    - Markers seen earlier are re-detected only inside a padded region of interest
+      around their last bounding box.
+    - New markers are searched for on a downscaled copy of the frame, and confirmed
+      at full resolution only inside the region where they were found.
+    - Every `full_scan_interval` frames the whole frame is scanned at full
+      resolution to catch markers that are too small for the downscaled pass.
+    """
+
+    def __init__(self, aruco_dict=None, aruco_params=None, downscale=0.5, roi_margin=0.5,
+                 rescan_interval=5, full_scan_interval=30, max_misses=2):
+        self.aruco_dict = aruco_dict if aruco_dict is not None else aruco.Dictionary_get(aruco.DICT_4X4_100)
+        self.aruco_params = aruco_params if aruco_params is not None else aruco.DetectorParameters_create()
+        self.downscale = downscale
+        self.roi_margin = roi_margin
+        self.rescan_interval = rescan_interval
+        self.full_scan_interval = full_scan_interval
+        self.max_misses = max_misses
+
+        self.tracks = {}
+        self.frame_count = 0
+        self._small = None
+
+    def _detect(self, gray, offset=(0, 0), scale=1.0):
+        corners, ids, _ = aruco.detectMarkers(gray, self.aruco_dict, parameters=self.aruco_params)
+        found = {}
+        if ids is None:
+            return found
+        for marker_id, marker_corners in zip(ids.flatten(), corners):
+            points = marker_corners.reshape(-1, 2) / scale + offset
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+            found[int(marker_id)] = (x0, y0, x1, y1)
+        return found
+
+    def _roi(self, bbox, shape):
+        x0, y0, x1, y1 = bbox
+        pad_x = (x1 - x0) * self.roi_margin + 8
+        pad_y = (y1 - y0) * self.roi_margin + 8
+        height, width = shape[:2]
+        return (max(0, int(x0 - pad_x)), max(0, int(y0 - pad_y)),
+                min(width, int(x1 + pad_x) + 1), min(height, int(y1 + pad_y) + 1))
+
+    def _detect_in_roi(self, gray, bbox):
+        x0, y0, x1, y1 = self._roi(bbox, gray.shape)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return {}
+        return self._detect(gray[y0:y1, x0:x1], offset=(x0, y0))
+
+    def _detect_downscaled(self, gray):
+        height, width = gray.shape[:2]
+        size = (max(1, int(width * self.downscale)), max(1, int(height * self.downscale)))
+        if self._small is None or self._small.shape != (size[1], size[0]):
+            self._small = np.empty((size[1], size[0]), dtype=np.uint8)
+        cv2.resize(gray, size, dst=self._small, interpolation=cv2.INTER_AREA)
+
+        found = {}
+        for marker_id, bbox in self._detect(self._small, scale=self.downscale).items():
+            # Confirm at full resolution for accurate corners
+            found.update(self._detect_in_roi(gray, bbox))
+        return found
+
+    def detect(self, gray):
+        """Returns the sorted list of marker ids visible in the grayscale frame."""
+        self.frame_count += 1
+        found = {}
+
+        if self.frame_count % self.full_scan_interval == 0:
+            found = self._detect(gray)
+        else:
+            for track in list(self.tracks.values()):
+                found.update(self._detect_in_roi(gray, track.bbox))
+            if not self.tracks or self.frame_count % self.rescan_interval == 0:
+                found.update(self._detect_downscaled(gray))
+
+        for marker_id, bbox in found.items():
+            track = self.tracks.get(marker_id)
+            if track is None:
+                self.tracks[marker_id] = _Track(marker_id, bbox)
+            else:
+                track.bbox = bbox
+                track.misses = 0
+
+        for marker_id in list(self.tracks):
+            if marker_id not in found:
+                self.tracks[marker_id].misses += 1
+                if self.tracks[marker_id].misses > self.max_misses:
+                    del self.tracks[marker_id]
+
+        return sorted(found)
+
+    def reset(self):
+        self.tracks.clear()
+        self.frame_count = 0
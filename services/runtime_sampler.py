@@ -0,0 +1,217 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from services.latency_metrics import RollingHistogram
+
+logger = logging.getLogger(__name__)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def read_thread_ticks(proc_path="/proc"):
+    """Returns {tid: user + system clock ticks} for every thread of this process."""
+    ticks = {}
+    task_dir = os.path.join(proc_path, "self", "task")
+    for tid in os.listdir(task_dir):
+        try:
+            # The command name may contain spaces or parentheses; fields start after the last ")"
+            fields = _read(os.path.join(task_dir, tid, "stat")).rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # thread exited between listdir and open
+        ticks[int(tid)] = int(fields[11]) + int(fields[12])
+    return ticks
+
+
+def read_meminfo(proc_path="/proc"):
+    """Returns the /proc/meminfo fields the sampler uses, in kB."""
+    wanted = {"MemTotal", "MemAvailable"}
+    values = {}
+    for line in _read(os.path.join(proc_path, "meminfo")).splitlines():
+        key, _, rest = line.partition(":")
+        if key in wanted:
+            values[key] = int(rest.split()[0])
+    return values
+
+
+def read_system_ticks(proc_path="/proc"):
+    """Returns (busy, total) clock ticks summed over all CPUs, from the first line of /proc/stat."""
+    fields = [int(v) for v in _read(os.path.join(proc_path, "stat")).split("\n", 1)[0].split()[1:]]
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return sum(fields) - idle, sum(fields)
+
+
+class RuntimeSampler:
+    """
+    One low-overhead sampler for process resource usage, read straight from /proc.
+
+    - CPU per named thread from /proc/self/task/*/stat (Python thread names, or the
+      kernel comm name for native threads), process RSS and system memory.
+    - Event-loop lag: a probe is scheduled on every named asyncio loop each sample and
+      the delay until it runs is recorded per loop.
+    - GC pauses, timed with gc.callbacks.
+
+    Samples are kept in a fixed-size ring; the newest one is exposed for /telemetry and
+    listeners (e.g. ResourceMonitor) are called with every sample from the sampler thread.
+    With `per_thread=False` the per-thread walk is skipped: samples carry system CPU and
+    memory only ("threads" empty, "cpu_percent" None).
+    """
+
+    def __init__(self, loops=None, interval=1.0, ring_size=300, proc_path="/proc", per_thread=True):
+        self.loops = dict(loops or {})
+        self.interval = interval
+        self.per_thread = per_thread
+        self.proc_path = proc_path
+        self.samples = deque(maxlen=ring_size)
+        self.listeners = []
+
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+        self._comm_names = {}
+        self._last_ticks = {}
+        self._last_system = None
+        self._last_time = None
+
+        self.loop_lag = {name: RollingHistogram(size=256) for name in self.loops}
+        self.last_loop_lag_ms = {}
+
+        self.gc_pauses = RollingHistogram(size=256)
+        self.gc_collections = [0, 0, 0]
+        self._gc_started = None
+        self._gc_pause_ms_since_sample = 0.0
+        self._gc_count_since_sample = 0
+
+        self.last_sample_ms = 0.0
+        self.running = False
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self):
+        self.running = True
+        gc.callbacks.append(self._on_gc)
+        self._thread = threading.Thread(target=self._sample_loop, name="runtime-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            pause_ms = (time.perf_counter() - self._gc_started) * 1000
+            self._gc_started = None
+            self.gc_pauses.record(pause_ms)
+            self.gc_collections[info["generation"]] += 1
+            self._gc_pause_ms_since_sample += pause_ms
+            self._gc_count_since_sample += 1
+
+    def _probe_loops(self):
+        for name, loop in self.loops.items():
+            if loop.is_running():
+                loop.call_soon_threadsafe(self._probe_arrived, name, time.monotonic_ns())
+
+    def _probe_arrived(self, name, sent_ns):
+        lag_ms = (time.monotonic_ns() - sent_ns) / 1_000_000
+        self.last_loop_lag_ms[name] = round(lag_ms, 2)
+        self.loop_lag[name].record(lag_ms)
+
+    def _thread_name(self, tid, python_names):
+        name = python_names.get(tid)
+        if name is not None:
+            return name
+        if tid not in self._comm_names:
+            try:
+                self._comm_names[tid] = _read(os.path.join(self.proc_path, "self", "task", str(tid), "comm")).strip()
+            except OSError:
+                return f"tid-{tid}"
+        return self._comm_names[tid]
+
+    def sample(self):
+        """Takes one sample; CPU figures are relative to the previous call."""
+        start = time.perf_counter()
+        now = time.monotonic()
+        ticks = read_thread_ticks(self.proc_path) if self.per_thread else {}
+        system = read_system_ticks(self.proc_path)
+        meminfo = read_meminfo(self.proc_path)
+        rss_pages = int(_read(os.path.join(self.proc_path, "self", "statm")).split()[1])
+
+        threads = {}
+        cpu_percent = None
+        system_cpu_percent = None
+        if self._last_time is not None:
+            python_names = {t.native_id: t.name for t in threading.enumerate()}
+            scale = 100.0 / (self._clock_ticks * (now - self._last_time))
+            for tid, value in ticks.items():
+                delta = value - self._last_ticks.get(tid, value)
+                name = self._thread_name(tid, python_names)
+                threads[name] = round(threads.get(name, 0.0) + delta * scale, 1)
+            cpu_percent = round(sum(threads.values()), 1) if self.per_thread else None
+            busy, total = system[0] - self._last_system[0], system[1] - self._last_system[1]
+            system_cpu_percent = round(100.0 * busy / total, 1) if total > 0 else 0.0
+        # Forget names of exited threads so reused tids are looked up again
+        self._comm_names = {tid: name for tid, name in self._comm_names.items() if tid in ticks}
+        self._last_ticks, self._last_system, self._last_time = ticks, system, now
+
+        self._probe_loops()
+
+        sample = {
+            "timestamp": int(time.time() * 1000),
+            "cpu_percent": cpu_percent,
+            "system_cpu_percent": system_cpu_percent,
+            "threads": threads,
+            "rss_mb": round(rss_pages * self._page_kb / 1024, 1),
+            "mem_used_mb": round((meminfo.get("MemTotal", 0) - meminfo.get("MemAvailable", 0)) / 1024, 1),
+            "mem_available_mb": round(meminfo.get("MemAvailable", 0) / 1024, 1),
+            "loop_lag_ms": dict(self.last_loop_lag_ms),
+            "gc_collections": self._gc_count_since_sample,
+            "gc_pause_ms": round(self._gc_pause_ms_since_sample, 2),
+        }
+        self._gc_count_since_sample = 0
+        self._gc_pause_ms_since_sample = 0.0
+
+        self.last_sample_ms = (time.perf_counter() - start) * 1000
+        self.samples.append(sample)
+        return sample
+
+    def _sample_loop(self):
+        next_tick = time.monotonic()
+        while self.running:
+            try:
+                sample = self.sample()
+                for listener in self.listeners:
+                    listener(sample)
+            except Exception as e:
+                logger.error(f"Error sampling runtime resources: {e}")
+            next_tick += self.interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def get_latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def get_samples(self, since_ms=None):
+        if since_ms is None:
+            return list(self.samples)
+        return [sample for sample in self.samples if sample["timestamp"] > since_ms]
+
+    def get_stats(self):
+        """Newest sample plus lag and GC histograms; used as the "runtime" telemetry source."""
+        return {
+            "sample": self.get_latest(),
+            "loop_lag_ms": {name: histogram.snapshot() for name, histogram in self.loop_lag.items()},
+            "gc_pause_ms": self.gc_pauses.snapshot(),
+            "gc_collections": list(self.gc_collections),
+            "sample_cost_ms": round(self.last_sample_ms, 3),
+        }
@@ -0,0 +1,388 @@
+"""
+Native session recorder.
+
+A session is a directory with:
+
+    session.json      frame shape, storage ("jpeg" or "raw"), chunk size, index layout
+    index.bin         one INDEX_RECORD per frame; frame n starts at byte n * INDEX_RECORD.size
+    chunk_00000.bin   concatenated frame payloads (JPEG images or raw RGB bytes)
+    messages.jsonl    journal of what drove the car, for replay (see record_message)
+
+INDEX_RECORD <QQdffBBhIQI: frame number, capture time (monotonic ns), wall time (s),
+throttle, angle, control source (0 = user, 1 = local_angle), marker count, first marker
+id (-1 if none), chunk number, byte offset in the chunk, payload length.
+
+messages.jsonl has one JSON object per line: {"t": monotonic ns, "wall_ms", "endpoint",
+"event"}, plus "text" or "b64" (binary) for websocket messages and "data" for anything
+else. The first line is the "session"/"start" entry with the context_provider's data.
+"""
+import base64
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from services.frame_encoder import FrameEncoder
+
+logger = logging.getLogger(__name__)
+
+INDEX_RECORD = struct.Struct("<QQdffBBhIQI")
+CONTROL_SOURCES = {"user": 0, "local_angle": 1}
+
+# Per-slot metadata kept next to the frames in the ring
+_SLOT_DTYPE = np.dtype([("capture_ns", "<u8"), ("wall_time", "<f8"), ("throttle", "<f4"), ("angle", "<f4"),
+                        ("source", "u1"), ("marker_count", "u1"), ("marker_id", "<i2")])
+
+
+class SessionRecorder:
+    """
+    Records camera frames, control outputs, control source and marker results without
+    blocking the drive loop.
+
+    - record() copies the frame and its metadata into the next slot of a memory-mapped
+      ring and returns; when the writer is `slots` frames behind the frame is dropped.
+    - A writer thread drains the ring, JPEG-encodes (or copies) each frame into chunk
+      files of `chunk_frames` frames and appends a fixed-size index record.
+    - start()/stop() only flip flags; the writer opens and closes sessions itself.
+    - record_message() journals the inputs of a session (websocket messages, state
+      changes) the same way, so it can be replayed. `context_provider`, if given, is
+      called on start() and its dict is the journal's first entry.
+    """
+
+    def __init__(self, base_dir, frame_shape=(480, 640, 3), slots=64, storage="jpeg", jpeg_quality=90,
+                 chunk_frames=300, context_provider=None):
+        if storage not in ("jpeg", "raw"):
+            raise ValueError(f"Unknown recorder storage: {storage}")
+        self.base_dir = base_dir
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.storage = storage
+        self.chunk_frames = chunk_frames
+        self.encoder = FrameEncoder(quality=jpeg_quality) if storage == "jpeg" else None
+        self.context_provider = context_provider
+
+        frame_bytes = int(np.prod(self.frame_shape))
+        self._ring = mmap.mmap(-1, slots * (frame_bytes + _SLOT_DTYPE.itemsize))
+        self._frames = np.frombuffer(self._ring, dtype=np.uint8, count=slots * frame_bytes).reshape(
+            (slots,) + self.frame_shape)
+        self._meta = np.frombuffer(self._ring, dtype=_SLOT_DTYPE, count=slots, offset=slots * frame_bytes)
+
+        # Written only by the drive loop (head) and the writer thread (tail)
+        self._head = 0
+        self._tail = 0
+        self._wakeup = threading.Event()
+        self.active = False
+        self.running = True
+
+        self.session_dir = None
+        self._index_file = None
+        self._chunk_file = None
+        self._chunk_number = 0
+        self._chunk_offset = 0
+        self._session_frames = 0
+
+        # Journal entries from any thread; deque appends and pops are atomic
+        self._messages = deque()
+        self._start_head = 0
+        self._messages_file = None
+
+        # Counters
+        self.frames_recorded = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.messages_written = 0
+        self.bytes_written = 0
+        self.sessions = 0
+        self.last_write_ms = 0.0
+        self._rate_window = (time.monotonic(), 0, 0)
+        self.frames_per_second = 0.0
+        self.megabytes_per_second = 0.0
+
+        self._thread = threading.Thread(target=self._writer_loop, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    def set_base_dir(self, base_dir):
+        """Takes effect with the next session."""
+        self.base_dir = base_dir
+
+    def start(self):
+        if not self.active:
+            context = None
+            if self.context_provider is not None:
+                try:
+                    context = self.context_provider()
+                except Exception as e:
+                    logger.error(f"Error getting recording context: {e}")
+            self._messages.append((time.monotonic_ns(), time.time() * 1000, "session", "start", context))
+            self._start_head = self._head
+            self.active = True
+            self._wakeup.set()
+
+    def stop(self):
+        if self.active:
+            self.active = False
+            if self._head == self._start_head:
+                self._discard_journal()
+            self._wakeup.set()
+
+    def _discard_journal(self):
+        # No frame was recorded since start(), so no session opens for this journal; it is the
+        # newest part of the queue, back to its start entry, and must not leak into the next session
+        while self._messages:
+            _, _, endpoint, event, _ = self._messages.pop()
+            if endpoint == "session" and event == "start":
+                break
+
+    def set_active(self, active):
+        if active:
+            self.start()
+        else:
+            self.stop()
+
+    @property
+    def backlog(self):
+        return self._head - self._tail
+
+    def record(self, rgb, throttle, angle, source, marker_ids=None, capture_ns=None):
+        """Called from the drive loop; copies the frame into the ring and returns."""
+        if not self.active or rgb is None:
+            return False
+        if rgb.shape != self.frame_shape:
+            self.frames_dropped += 1
+            return False
+        if self._head - self._tail >= self.slots:
+            self.frames_dropped += 1
+            return False
+
+        slot = self._head % self.slots
+        np.copyto(self._frames[slot], rgb)
+        meta = self._meta[slot]
+        meta["capture_ns"] = time.monotonic_ns() if capture_ns is None else capture_ns
+        meta["wall_time"] = time.time()
+        meta["throttle"] = throttle
+        meta["angle"] = angle
+        meta["source"] = CONTROL_SOURCES.get(source, 255)
+        meta["marker_count"] = min(len(marker_ids), 255) if marker_ids else 0
+        meta["marker_id"] = marker_ids[0] if marker_ids else -1
+
+        self._head += 1
+        self.frames_recorded += 1
+        self._wakeup.set()
+        return True
+
+    def record_message(self, endpoint, event, message=None, received_ns=None, wall_ms=None):
+        """Journals one input while recording; called on the loop or thread that received it."""
+        if not self.active:
+            return
+        self._messages.append((time.monotonic_ns() if received_ns is None else received_ns,
+                               time.time() * 1000 if wall_ms is None else wall_ms, endpoint, event, message))
+
+    def _write_messages(self):
+        while self._messages:
+            received_ns, wall_ms, endpoint, event, message = self._messages.popleft()
+            entry = {"t": received_ns, "wall_ms": round(wall_ms, 3), "endpoint": endpoint, "event": event}
+            if isinstance(message, str):
+                entry["text"] = message
+            elif isinstance(message, (bytes, bytearray, memoryview)):
+                entry["b64"] = base64.b64encode(bytes(message)).decode("ascii")
+            elif message is not None:
+                entry["data"] = message
+            self._messages_file.write(json.dumps(entry) + "\n")
+            self.messages_written += 1
+
+    def _open_session(self):
+        # Sessions can start within the same millisecond; never reuse an existing directory
+        name = datetime.now().strftime("session_%Y%m%d_%H%M%S_%f")[:-3]
+        attempt = 0
+        while True:
+            self.session_dir = os.path.join(self.base_dir, name if not attempt else f"{name}_{attempt}")
+            try:
+                os.makedirs(self.session_dir)
+                break
+            except FileExistsError:
+                attempt += 1
+        with open(os.path.join(self.session_dir, "session.json"), "x") as f:
+            json.dump({"frame_shape": self.frame_shape, "storage": self.storage,
+                       "chunk_frames": self.chunk_frames, "index_record": INDEX_RECORD.format,
+                       "control_sources": CONTROL_SOURCES, "started": time.time()}, f)
+        self._index_file = open(os.path.join(self.session_dir, "index.bin"), "xb")
+        self._messages_file = open(os.path.join(self.session_dir, "messages.jsonl"), "x")
+        self._chunk_number = -1
+        self._chunk_file = None
+        self._session_frames = 0
+        self.sessions += 1
+        logger.info(f"Recording session started: {self.session_dir}")
+
+    def _close_session(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+            self._chunk_file = None
+        if self._messages_file is not None:
+            self._write_messages()
+            self._messages_file.close()
+            self._messages_file = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+            logger.info(f"Recording session closed: {self.session_dir} ({self._session_frames} frames)")
+
+    def _next_chunk(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+            self._index_file.flush()
+            self._messages_file.flush()
+        self._chunk_number += 1
+        self._chunk_offset = 0
+        self._chunk_file = open(os.path.join(self.session_dir, f"chunk_{self._chunk_number:05d}.bin"), "xb")
+
+    def _write_slot(self, slot):
+        if self._session_frames % self.chunk_frames == 0:
+            self._next_chunk()
+
+        frame = self._frames[slot]
+        payload = self.encoder.encode(frame) if self.encoder is not None else frame.data
+        length = len(payload) if self.encoder is not None else frame.nbytes
+        self._chunk_file.write(payload)
+
+        meta = self._meta[slot]
+        self._index_file.write(INDEX_RECORD.pack(
+            self._session_frames, int(meta["capture_ns"]), float(meta["wall_time"]), float(meta["throttle"]),
+            float(meta["angle"]), int(meta["source"]), int(meta["marker_count"]), int(meta["marker_id"]),
+            self._chunk_number, self._chunk_offset, length))
+
+        self._chunk_offset += length
+        self._session_frames += 1
+        self.frames_written += 1
+        self.bytes_written += length + INDEX_RECORD.size
+
+    def _drain(self):
+        if self._messages_file is not None:
+            self._write_messages()
+        while self._tail < self._head:
+            start = time.perf_counter()
+            self._write_slot(self._tail % self.slots)
+            self.last_write_ms = (time.perf_counter() - start) * 1000
+            self._tail += 1
+
+    def _update_rates(self):
+        now = time.monotonic()
+        since, frames, written = self._rate_window
+        elapsed = now - since
+        if elapsed >= 1.0:
+            self.frames_per_second = (self.frames_written - frames) / elapsed
+            self.megabytes_per_second = (self.bytes_written - written) / elapsed / 1e6
+            self._rate_window = (now, self.frames_written, self.bytes_written)
+
+    def _writer_loop(self):
+        while self.running:
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            try:
+                if self._tail < self._head and self._index_file is None:
+                    self._open_session()
+                self._drain()
+                if not self.active and self._index_file is not None:
+                    self._close_session()
+            except Exception as e:
+                logger.error(f"Error writing recording: {e}")
+                # Skip what is queued rather than retrying a failing disk from the drive loop's ring
+                self._tail = self._head
+                self._close_session()
+            self._update_rates()
+
+        self._drain()
+        self._close_session()
+
+    def get_stats(self):
+        return {
+            "active": self.active,
+            "session": self.session_dir,
+            "storage": self.storage,
+            "frames_recorded": self.frames_recorded,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "messages_written": self.messages_written,
+            "backlog": self.backlog,
+            "ring_slots": self.slots,
+            "last_write_ms": round(self.last_write_ms, 2),
+            "frames_per_second": round(self.frames_per_second, 1),
+            "megabytes_per_second": round(self.megabytes_per_second, 2),
+        }
+
+    def close(self):
+        self.active = False
+        self.running = False
+        self._wakeup.set()
+        self._thread.join(timeout=5.0)
+
+
+class SessionReader:
+    """Random access to a recorded session: reader[n] returns (record dict, RGB frame)."""
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        with open(os.path.join(session_dir, "session.json")) as f:
+            self.meta = json.load(f)
+        self.frame_shape = tuple(self.meta["frame_shape"])
+        self._index = np.memmap(os.path.join(session_dir, "index.bin"), dtype=np.uint8, mode="r")
+        self._sources = {code: name for name, code in self.meta["control_sources"].items()}
+
+    def __len__(self):
+        return len(self._index) // INDEX_RECORD.size
+
+    def record(self, n):
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        (frame, capture_ns, wall_time, throttle, angle, source, marker_count, marker_id, chunk, offset,
+         length) = INDEX_RECORD.unpack_from(self._index, n * INDEX_RECORD.size)
+        return {"frame": frame, "capture_ns": capture_ns, "wall_time": wall_time, "throttle": throttle,
+                "angle": angle, "source": self._sources.get(source), "marker_count": marker_count,
+                "marker_id": marker_id if marker_id >= 0 else None, "chunk": chunk, "offset": offset,
+                "length": length}
+
+    def __getitem__(self, n):
+        record = self.record(n)
+        with open(os.path.join(self.session_dir, f"chunk_{record['chunk']:05d}.bin"), "rb") as f:
+            f.seek(record["offset"])
+            payload = f.read(record["length"])
+        return record, self.decode(payload)
+
+    def decode(self, payload):
+        """Stored frame payload -> RGB frame."""
+        if self.meta["storage"] == "raw":
+            return np.frombuffer(payload, dtype=np.uint8).reshape(self.frame_shape)
+        bgr = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def payloads(self, start=0):
+        """Yields (record dict, undecoded payload) in order, reading each chunk file sequentially."""
+        chunk_number, chunk_file = None, None
+        try:
+            for n in range(start, len(self)):
+                record = self.record(n)
+                if record["chunk"] != chunk_number:
+                    if chunk_file is not None:
+                        chunk_file.close()
+                    chunk_number = record["chunk"]
+                    chunk_file = open(os.path.join(self.session_dir, f"chunk_{chunk_number:05d}.bin"), "rb")
+                chunk_file.seek(record["offset"])
+                yield record, chunk_file.read(record["length"])
+        finally:
+            if chunk_file is not None:
+                chunk_file.close()
+
+    def messages(self):
+        """The session's message journal (see SessionRecorder.record_message); empty for older sessions."""
+        path = os.path.join(self.session_dir, "messages.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
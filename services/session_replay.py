@@ -0,0 +1,363 @@
+"""
+Deterministic replay of sessions recorded by SessionRecorder.
+
+Pushes the recorded camera frames through TeleopControlPart.run_threaded() and the
+decision manager, with the journaled /control, /autonomy and state entries
+(messages.jsonl) injected at their original offsets, and keeps the drive outputs for
+diffing. A long session becomes a regression test:
+
+    python -m services.session_replay <session_dir> --output baseline.jsonl
+    python -m services.session_replay <session_dir> --compare baseline.jsonl
+"""
+import argparse
+import base64
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import types
+from collections import deque
+
+from controllers.control_protocol import ControlChannel, decode_control_message
+from core.teleop_control_part import TeleopControlPart
+from core.teleop_decision_manager import ControlSource
+from services.session_recorder import SessionReader
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FIELDS = ("angle", "throttle", "mode", "recording")
+
+
+class ReplayClock:
+    """Virtual monotonic clock (ns) for the decision manager; reads whatever time the replay reached."""
+
+    def __init__(self, now_ns=0):
+        self.now_ns = now_ns
+
+    def __call__(self):
+        return self.now_ns
+
+
+class FrameStream:
+    """
+    Reads a session's frames in order on a background thread, up to `read_ahead` frames
+    ahead of the consumer. Iterating yields (record dict, payload), where the payload is
+    the decoded RGB frame with decode=True and the stored bytes otherwise.
+    """
+
+    _END = object()
+
+    def __init__(self, reader: SessionReader, read_ahead=32, decode=False):
+        self.reader = reader
+        self.decode = decode
+        self.queue = queue.Queue(maxsize=max(2, read_ahead))
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="replay-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for record, payload in self.reader.payloads():
+                if not self.running:
+                    return
+                self.queue.put((record, self.reader.decode(payload) if self.decode else payload))
+        except Exception as e:
+            logger.error(f"Error reading session frames: {e}")
+        finally:
+            self.queue.put(self._END)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self._END:
+                return
+            yield item
+
+    def close(self):
+        self.running = False
+        # Frees the reader if it is blocked on a full queue
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._thread.join(timeout=1.0)
+
+
+class SessionReplay:
+    """
+    Replays one recorded session through the drive path.
+
+    - Time is virtual: the decision manager's clock is set to the recorded time of each
+      message and frame, so input hold, ramp-down and timeout, the /control max age and
+      the autonomy heartbeat deadline act as they did on the car at any replay speed.
+    - Journal entries are applied before the first frame captured after them, in order.
+      Inputs are applied one by one; the live loop may have coalesced a burst of them.
+    - `speed=None` runs as fast as possible; otherwise frames are paced at their recorded
+      spacing divided by `speed`.
+    - decode="auto" decodes a frame only when the drive path looks at its pixels (the
+      autonomous source); decode="all" decodes every frame on the read-ahead thread.
+    - `outputs` has one entry per frame: the replayed (angle, throttle, mode, recording)
+      and the recorded ones under "recorded", for diff_outputs().
+
+    Marker detection runs in-process, so a session recorded with the vision worker
+    process can differ from its recording where a worker result was late or stale;
+    replays of the same session always agree with each other. On the car an input is
+    applied a moment after it is received (the journaled time), so steering extrapolated
+    between inputs can differ from the recording by a few 1e-4; diff with a tolerance.
+    """
+
+    def __init__(self, session_dir, speed=None, decode="auto", read_ahead=32, config=None):
+        if decode not in ("auto", "all"):
+            raise ValueError(f"Unknown decode mode: {decode}")
+        self.reader = SessionReader(session_dir)
+        self.speed = speed
+        self.decode = decode
+        self.read_ahead = read_ahead
+        self.config_overrides = config or {}
+
+        self.clock = ReplayClock()
+        self.part = None
+        self.channel = None
+        self.outputs = []
+
+        self._autonomy_beat_ns = None
+        self._autonomy_expired = False
+        self._autonomy_deadline_ns = 0
+        self._control_max_age_ms = 150
+
+        # Counters
+        self.frames = 0
+        self.frames_decoded = 0
+        self.messages_applied = 0
+        self.messages_invalid = 0
+        self.inputs_dropped = 0
+        self.failovers = 0
+        self.wall_s = 0.0
+        self.session_s = 0.0
+
+    @property
+    def decision_manager(self):
+        return self.part.teleop_decision_manager
+
+    def run(self):
+        """Replays the whole session; returns `outputs`."""
+        journal = sorted(self.reader.messages(), key=lambda entry: entry["t"])
+        context = next((entry for entry in journal if entry["endpoint"] == "session"), None)
+        if context is not None:
+            journal.remove(context)
+        settings = dict((context or {}).get("data") or {})
+        config = dict(settings.get("config") or {})
+        config.update(self.config_overrides)
+        cfg = types.SimpleNamespace(**config)
+
+        self.part = TeleopControlPart.for_replay(cfg, self.clock)
+        self._autonomy_deadline_ns = int(getattr(cfg, "TELEOP_AUTONOMY_DEADLINE_MS", 200) * 1_000_000)
+        self._control_max_age_ms = getattr(cfg, "TELEOP_CONTROL_MAX_AGE_MS", 150)
+
+        pending = deque(journal)
+        stream = FrameStream(self.reader, self.read_ahead, decode=self.decode == "all")
+        started = time.perf_counter()
+        first_ns = None
+        try:
+            for record, payload in stream:
+                capture_ns = record["capture_ns"]
+                if first_ns is None:
+                    first_ns = capture_ns
+                    self.clock.now_ns = capture_ns
+                    if context is not None:
+                        self._apply_context(settings, context["t"])
+                while pending and pending[0]["t"] <= capture_ns:
+                    self._apply(pending.popleft())
+                self._advance(capture_ns)
+
+                if self.speed:
+                    delay = started + (capture_ns - first_ns) / 1e9 / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._step(record, payload, capture_ns - first_ns)
+        finally:
+            stream.close()
+        self.wall_s = time.perf_counter() - started
+        self.session_s = (self.clock.now_ns - first_ns) / 1e9 if first_ns is not None else 0.0
+        return self.outputs
+
+    def _step(self, record, payload, offset_ns):
+        if self.decode == "all":
+            rgb = payload
+        elif self.decision_manager.select_active_source() == ControlSource.AUTONOMOUS:
+            rgb = self.reader.decode(payload)
+        else:
+            # The user path never looks at pixels
+            rgb = None
+        if rgb is not None:
+            self.frames_decoded += 1
+
+        angle, throttle, mode, recording, _ = self.part.run_threaded(rgb)
+        self.frames += 1
+        self.outputs.append({
+            "frame": record["frame"], "t_ms": round(offset_ns / 1e6, 3),
+            "angle": float(angle), "throttle": float(throttle), "mode": mode, "recording": bool(recording),
+            "recorded": {"angle": round(record["angle"], 6), "throttle": round(record["throttle"], 6),
+                         "mode": record["source"]},
+        })
+
+    def _apply_context(self, settings, started_ns):
+        state = settings.get("state") or {}
+        decision_manager = self.decision_manager
+        decision_manager.state.update(source=ControlSource(state.get("source") or ControlSource.USER.value),
+                                      autonomy=bool(state.get("autonomy")), recording=bool(state.get("recording")),
+                                      throttle_cap=state.get("throttle_cap"))
+        gap_ms = settings.get("input_gap_ms")
+        if gap_ms is not None and gap_ms <= decision_manager.timeout_ms:
+            # The input the car was holding when recording started
+            now_ns = self.clock.now_ns
+            self.clock.now_ns = started_ns - int(gap_ms * 1_000_000)
+            decision_manager.update_user_input(state.get("throttle", 0.0), state.get("angle", 0.0),
+                                               seq=state.get("input_seq"))
+            self.clock.now_ns = now_ns
+
+    def _advance(self, now_ns):
+        """Moves virtual time to `now_ns`, failing over first if the autonomy heartbeat lapsed before."""
+        beat = self._autonomy_beat_ns
+        if beat is not None and not self._autonomy_expired and now_ns >= beat + self._autonomy_deadline_ns:
+            self.clock.now_ns = beat + self._autonomy_deadline_ns
+            self._autonomy_expired = True
+            self.failovers += 1
+            self.decision_manager.set_control_source(ControlSource.AUTONOMOUS)
+        self.clock.now_ns = max(self.clock.now_ns, now_ns)
+
+    def _apply(self, entry):
+        self._advance(entry["t"])
+        endpoint, event = entry["endpoint"], entry["event"]
+        self.messages_applied += 1
+
+        if endpoint == "state":
+            self.decision_manager.state.update(**entry["data"])
+        elif endpoint == "control":
+            if event == "open" or self.channel is None:
+                self.channel = ControlChannel("replay", self._control_max_age_ms)
+            if event == "message":
+                self._apply_control(entry)
+        elif endpoint == "autonomy":
+            if event == "open":
+                self._autonomy_beat_ns = entry["t"]
+                self._autonomy_expired = False
+            elif event == "close":
+                self._autonomy_beat_ns = None
+                self._autonomy_expired = False
+            elif event == "message":
+                self._apply_autonomy(entry)
+
+    def _apply_control(self, entry):
+        message = base64.b64decode(entry["b64"]) if "b64" in entry else entry.get("text", "")
+        try:
+            control_input = decode_control_message(message)
+        except ValueError:
+            self.messages_invalid += 1
+            return
+        control_input.received_ns = entry["t"]
+        if not self.channel.accept(control_input, now_ms=entry["wall_ms"]):
+            self.inputs_dropped += 1
+            return
+        self.decision_manager.update_user_input(control_input.throttle, control_input.angle,
+                                                received_ns=entry["t"], seq=control_input.seq)
+
+    def _apply_autonomy(self, entry):
+        # Every message is a heartbeat, as on the car
+        self._autonomy_beat_ns = entry["t"]
+        self._autonomy_expired = False
+        try:
+            data = json.loads(entry.get("text", ""))
+        except ValueError:
+            self.messages_invalid += 1
+            return
+        requested = ControlSource.AUTONOMOUS if data.get("autonomy", "") else ControlSource.USER
+        self.decision_manager.set_control_source(requested)
+
+    def get_stats(self):
+        return {
+            "session": self.reader.session_dir,
+            "frames": self.frames,
+            "frames_decoded": self.frames_decoded,
+            "messages_applied": self.messages_applied,
+            "messages_invalid": self.messages_invalid,
+            "inputs_dropped": self.inputs_dropped,
+            "failovers": self.failovers,
+            "session_s": round(self.session_s, 2),
+            "wall_s": round(self.wall_s, 3),
+            "speedup": round(self.session_s / self.wall_s, 1) if self.wall_s else None,
+        }
+
+
+def write_outputs(outputs, path):
+    with open(path, "w") as f:
+        for output in outputs:
+            f.write(json.dumps(output) + "\n")
+
+
+def load_outputs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def diff_outputs(outputs, reference=None, tolerance=1e-4, fields=OUTPUT_FIELDS):
+    """
+    Frames where `outputs` differ from `reference` (another replay's outputs) by more than
+    `tolerance`, or from what was recorded when `reference` is None (angle, throttle and
+    mode only). Returns a list of {"frame", "field", "replayed", "expected"}.
+    """
+    if reference is None:
+        pairs = [(output, output["recorded"]) for output in outputs]
+        fields = [field for field in fields if field != "recording"]
+    else:
+        if len(reference) != len(outputs):
+            logger.warning(f"Comparing {len(outputs)} frames against {len(reference)}")
+        pairs = zip(outputs, reference)
+
+    differences = []
+    for output, expected in pairs:
+        for field in fields:
+            replayed, wanted = output[field], expected[field]
+            if isinstance(replayed, float) and isinstance(wanted, (int, float)):
+                same = abs(replayed - wanted) <= tolerance
+            else:
+                same = replayed == wanted
+            if not same:
+                differences.append({"frame": output["frame"], "field": field, "replayed": replayed,
+                                    "expected": wanted})
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("session_dir")
+    parser.add_argument("--speed", type=float, default=None, help="1.0 for original timing (default: as fast as possible)")
+    parser.add_argument("--decode", choices=("auto", "all"), default="auto")
+    parser.add_argument("--read-ahead", type=int, default=32)
+    parser.add_argument("--output", help="write the per-frame outputs here (JSONL)")
+    parser.add_argument("--compare", help="outputs of an earlier replay; exit 1 if this one differs")
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    replay = SessionReplay(args.session_dir, speed=args.speed, decode=args.decode, read_ahead=args.read_ahead)
+    outputs = replay.run()
+    if args.output:
+        write_outputs(outputs, args.output)
+
+    result = replay.get_stats()
+    result["differences_from_recording"] = len(diff_outputs(outputs))
+    differences = []
+    if args.compare:
+        differences = diff_outputs(outputs, load_outputs(args.compare), args.tolerance)
+        result["differences_from_compare"] = len(differences)
+        result["first_differences"] = differences[:10]
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
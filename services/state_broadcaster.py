@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+
+from core.control_state import ControlStateStore
+from services.latency_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StateSubscriber:
+    """
+    A single /state client.
+
+    Remembers the last snapshot it was sent and, when woken, sends the difference to the
+    current one. Changes made while a send is in flight are coalesced into the next delta,
+    so a slow client receives fewer, larger deltas and never holds up other clients.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.changed = asyncio.Event()
+        self.last_sent = None
+        self.messages_sent = 0
+        self.versions_coalesced = 0
+
+    async def send_snapshot(self, state):
+        await self.websocket.send(json.dumps({"type": "snapshot", "version": state.version,
+                                              "state": state.to_dict()}))
+        self.last_sent = state
+        self.messages_sent += 1
+
+    async def run(self, store: ControlStateStore):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            state, last = store.snapshot, self.last_sent
+            if state.version == last.version:
+                continue
+            await self.websocket.send(json.dumps({"type": "delta", "version": state.version, "base": last.version,
+                                                  "changes": state.diff(last)}))
+            metrics.record_since("state.push", state.changed_ns)
+            self.versions_coalesced += state.version - last.version - 1
+            self.last_sent = state
+            self.messages_sent += 1
+
+
+class StateBroadcaster:
+    """
+    Pushes ControlStateStore changes to /state websocket clients.
+
+    A client first receives {"type": "snapshot", "version", "state"}, then one
+    {"type": "delta", "version", "base", "changes"} per change, where `changes` holds only
+    the fields that differ from version `base` (the previous message). The store may be
+    written from any thread; the wake-up is handed to `loop`, where all sends happen.
+    """
+
+    def __init__(self, store: ControlStateStore, loop: asyncio.AbstractEventLoop):
+        self.store = store
+        self.loop = loop
+        self.subscribers = set()
+        self._wake_scheduled = False
+        store.add_listener(self._on_change)
+
+    def _on_change(self, state, changes):
+        if self.subscribers and not self._wake_scheduled:
+            self._wake_scheduled = True
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        # Reset before waking: a change stored after this point schedules another wake-up
+        self._wake_scheduled = False
+        for subscriber in list(self.subscribers):
+            subscriber.changed.set()
+
+    async def serve(self, websocket):
+        subscriber = StateSubscriber(websocket)
+        self.subscribers.add(subscriber)
+        try:
+            await subscriber.send_snapshot(self.store.snapshot)
+            sender = asyncio.ensure_future(subscriber.run(self.store))
+            closed = asyncio.ensure_future(websocket.wait_closed())
+            done, _ = await asyncio.wait({sender, closed}, return_when=asyncio.FIRST_COMPLETED)
+            sender.cancel()
+            closed.cancel()
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def get_stats(self):
+        subscribers = list(self.subscribers)
+        return {
+            "version": self.store.snapshot.version,
+            "subscribers": len(subscribers),
+            "messages_sent": sum(s.messages_sent for s in subscribers),
+            "versions_coalesced": sum(s.versions_coalesced for s in subscribers),
+        }
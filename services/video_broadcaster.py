@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import struct
+import threading
+import time
+
+from services.latency_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Viewers that negotiate this subprotocol receive FRAME_HEADER + JPEG per message and may
+# echo {"echo": frame_id, "t": capture_ms} back once the frame is on screen.
+VIDEO_FRAMED_SUBPROTOCOL = "teleop.video.v1"
+
+# frame id u32, capture time f64 (server monotonic clock, ms)
+FRAME_HEADER = struct.Struct("<Id")
+
+# Viewers that negotiate this subprotocol receive tile delta messages (see services.tile_encoder)
+VIDEO_TILES_SUBPROTOCOL = "teleop.tiles.v1"
+
+
+class EncodedFrame:
+    """
+    One frame as published to viewers. `jpeg` is None for tile-delta frames, which only
+    tile viewers can use; `tiles` is None when the stream is not in tile mode.
+    """
+    __slots__ = ("jpeg", "frame_id", "capture_ns", "tiles", "_framed")
+
+    def __init__(self, jpeg, frame_id=0, capture_ns=None, tiles=None):
+        self.jpeg = jpeg
+        self.frame_id = frame_id
+        self.capture_ns = time.monotonic_ns() if capture_ns is None else capture_ns
+        self.tiles = tiles
+        self._framed = None
+
+    @property
+    def framed(self):
+        # Built once per frame and shared by every framed subscriber
+        if self._framed is None:
+            self._framed = FRAME_HEADER.pack(self.frame_id & 0xFFFFFFFF, self.capture_ns / 1_000_000) + self.jpeg
+        return self._framed
+
+
+class VideoSubscriber:
+    """
+    A single /video viewer.
+
+    Holds at most `max_queue` encoded frames. When the queue is full the oldest
+    frame is discarded, so a slow client always receives the newest picture and
+    never applies backpressure to other viewers or to the encoder. A frame that
+    waited longer than `max_age_ms` before its send could start is dropped too.
+    """
+
+    def __init__(self, websocket, max_queue=1, ewma_alpha=0.2, max_age_ms=None):
+        self.websocket = websocket
+        self.framed = websocket.subprotocol == VIDEO_FRAMED_SUBPROTOCOL
+        self.tiled = websocket.subprotocol == VIDEO_TILES_SUBPROTOCOL
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_expired = 0
+        self.max_age_ms = max_age_ms
+        # Set when a queued frame was not sent; tile viewers then need a keyframe
+        self.missed_frame = False
+
+        # Time from publish() until send() returned, smoothed
+        self.ewma_alpha = ewma_alpha
+        self.send_latency_ms = 0.0
+
+    def payload(self, frame: EncodedFrame):
+        if self.tiled and frame.tiles is not None:
+            return frame.tiles
+        if frame.jpeg is None:
+            return None
+        return frame.framed if self.framed else frame.jpeg
+
+    def offer(self, frame: EncodedFrame, published_at: float) -> bool:
+        """Queues the frame; returns False if an unsent frame had to be dropped."""
+        payload = self.payload(frame)
+        if payload is None:
+            return True
+        dropped = False
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.frames_dropped += 1
+                dropped = True
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait((payload, frame.capture_ns, published_at))
+        missed, self.missed_frame = self.missed_frame, False
+        return not (dropped or missed)
+
+    async def run(self):
+        while True:
+            payload, capture_ns, published_at = await self.queue.get()
+            if self.max_age_ms is not None and (time.monotonic() - published_at) * 1000 > self.max_age_ms:
+                self.frames_expired += 1
+                self.missed_frame = True
+                continue
+            await self.websocket.send(payload)
+            self.frames_sent += 1
+
+            latency_ms = (time.monotonic() - published_at) * 1000
+            self.send_latency_ms += self.ewma_alpha * (latency_ms - self.send_latency_ms)
+            metrics.record_since("frame.capture_to_sent", capture_ns)
+
+    async def receive_echoes(self):
+        """Consumes client messages until the socket closes; frame echoes yield the round-trip time."""
+        async for message in self.websocket:
+            try:
+                data = json.loads(message)
+                if "t" in data:
+                    metrics.record("frame.round_trip", time.monotonic_ns() / 1_000_000 - float(data["t"]))
+            except (ValueError, TypeError):
+                logger.debug(f"Ignoring video client message: {message!r:.80}")
+
+    def get_stats(self):
+        return {
+            "remote": str(self.websocket.remote_address),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_expired": self.frames_expired,
+            "queue_depth": self.queue.qsize(),
+            "send_latency_ms": round(self.send_latency_ms, 1),
+        }
+
+
+class VideoBroadcaster:
+    """
+    Fans out each encoded frame to every connected /video subscriber.
+
+    Frames are encoded once upstream (see VideoStreamer) and the same EncodedFrame
+    is handed to every subscriber queue. Must only be used from the event loop thread,
+    except take_keyframe_request(), has_full_frame_subscribers() and get_link_metrics(),
+    which the encoder thread calls. The newest full frame is kept, so a resuming viewer gets a picture at once.
+    """
+
+    def __init__(self, max_queue=1, max_age_ms=None):
+        self.max_queue = max_queue
+        self.max_age_ms = max_age_ms
+        self.subscribers = set()
+        self.frames_published = 0
+        # Set when a tile viewer joins or misses a delta; the streamer answers with a keyframe
+        self.keyframe_requested = False
+        self._keyframe_lock = threading.Lock()
+        # Kept by the loop as viewers come and go, so the encoder thread never iterates `subscribers`
+        self.full_frame_subscribers = 0
+        # (send latency ms, queue depth) of the slowest subscriber, replaced as a whole by the loop
+        self.link_metrics = (0.0, 0)
+        self.last_keyframe = None
+
+    def has_subscribers(self):
+        return len(self.subscribers) > 0
+
+    def publish(self, frame: EncodedFrame):
+        self.frames_published += 1
+        published_at = time.monotonic()
+        # Measured before this frame is queued, as the streamer's quality controller expects
+        self._update_link_metrics()
+        if frame.jpeg is not None:
+            self.last_keyframe = frame
+        for subscriber in self.subscribers:
+            if not subscriber.offer(frame, published_at) and subscriber.tiled:
+                self.request_keyframe()
+
+    def has_full_frame_subscribers(self):
+        return self.full_frame_subscribers > 0
+
+    def request_keyframe(self):
+        with self._keyframe_lock:
+            self.keyframe_requested = True
+
+    def take_keyframe_request(self):
+        with self._keyframe_lock:
+            requested, self.keyframe_requested = self.keyframe_requested, False
+        return requested
+
+    def get_link_metrics(self):
+        """Returns (send latency ms, queue depth) of the slowest subscriber, as of the last publish."""
+        return self.link_metrics
+
+    def _update_link_metrics(self):
+        if not self.subscribers:
+            self.link_metrics = (0.0, 0)
+            return
+        self.link_metrics = (max(s.send_latency_ms for s in self.subscribers),
+                             max(s.queue.qsize() for s in self.subscribers))
+
+    async def serve(self, websocket, catch_up=False):
+        """
+        Registers the websocket as a subscriber and streams frames until it disconnects.
+        With `catch_up`, JPEG viewers are sent the newest full frame first; tile viewers
+        always get a fresh keyframe on join.
+        """
+        subscriber = VideoSubscriber(websocket, self.max_queue, max_age_ms=self.max_age_ms)
+        if catch_up and self.last_keyframe is not None and not subscriber.tiled:
+            # Stamped now: the catch-up frame is expected to be older than max_age_ms
+            subscriber.offer(self.last_keyframe, time.monotonic())
+        self.subscribers.add(subscriber)
+        if subscriber.tiled:
+            self.request_keyframe()
+        else:
+            self.full_frame_subscribers += 1
+
+        # The sender only notices a closed socket on its next send, so also wait for the close itself
+        send_task = asyncio.ensure_future(subscriber.run())
+        closed_task = asyncio.ensure_future(subscriber.receive_echoes())
+        try:
+            done, _ = await asyncio.wait({send_task, closed_task}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            self.subscribers.discard(subscriber)
+            if not subscriber.tiled:
+                self.full_frame_subscribers -= 1
+            self._update_link_metrics()
+            for task in (send_task, closed_task):
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self):
+        return {
+            "frames_published": self.frames_published,
+            "subscribers": [s.get_stats() for s in self.subscribers],
+        }
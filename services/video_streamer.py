@@ -1,33 +1,201 @@
+import asyncio
 import logging
-from io import BytesIO
+import threading
+import time
 
+import cv2
 import numpy as np
-from PIL import Image
 
 from controllers.websocket_handler import WebSocketHandler, ConnectionState
+from services.adaptive_quality import AdaptiveQualityController
+from services.frame_encoder import FrameEncoder
+from services.latency_metrics import metrics
+from services.tile_encoder import TileDeltaEncoder
+from services.video_broadcaster import EncodedFrame
 
 logger = logging.getLogger(__name__)
 
 
 class VideoStreamer:
     """
-    Handles conversion and transmission of camera frames to a connected WebSocket video client.
+    Handles conversion and transmission of camera frames to the connected WebSocket video clients.
     This is typically used for live FPV preview in a custom UI over /video endpoint.
+
+    - Frames are handed over from the drive loop with submit_frame() and never block it.
+    - JPEG encoding runs on a dedicated encoder thread that only holds the latest frame;
+      a frame that is replaced before the encoder picks it up is dropped, not cancelled.
+    - The asyncio loop only receives finished JPEG bytes, which are encoded once and
+      fanned out to every viewer by the WebSocketHandler's VideoBroadcaster.
+    - Resolution, JPEG quality and frame rate follow the AdaptiveQualityController.
+    - In "tiles" mode only changed tiles are encoded for viewers on the tiles subprotocol
+      (see services.tile_encoder); while any plain JPEG viewer is connected every frame
+      is sent as a keyframe so those viewers keep the full frame rate.
+    - During a Wi-Fi handover (set_link_handover) the stream drops to the lowest profile
+      ("shrink") or stops submitting frames ("pause"), so frames do not pile up behind the
+      dead link and the first picture after it is fresh.
     """
 
-    def __init__(self, ws_handler: WebSocketHandler):
+    def __init__(self, ws_handler: WebSocketHandler, loop: asyncio.AbstractEventLoop, jpeg_quality=80,
+                 adaptive=True, target_latency_ms=150, mode="jpeg", handover_policy="shrink"):
         self.ws_handler = ws_handler
+        self.loop = loop
+        self.jpeg_quality = jpeg_quality
+        self.handover_policy = handover_policy
+        self.paused = False
+        self.quality_controller = AdaptiveQualityController(target_latency_ms=target_latency_ms,
+                                                            max_quality=jpeg_quality, enabled=adaptive)
+        self.encoder = FrameEncoder(quality=self.quality_controller.quality if adaptive else jpeg_quality)
+        self.tile_encoder = TileDeltaEncoder(self.encoder) if mode == "tiles" else None
+        self._scaled_buffer = None
+        self._next_submit_time = 0.0
+
+        self._pending_frame = None
+        self._pending_capture_ns = 0
+        self._frame_id = 0
+        self._frame_ready = threading.Condition()
+        self.running = True
+
+        # Counters
+        self.frames_submitted = 0
+        self.frames_encoded = 0
+        self.frames_dropped_stale = 0
+        self.frames_skipped_rate = 0
+        self.frames_paused = 0
+        self.last_encode_ms = 0.0
+        self.total_encode_ms = 0.0
+
+        self._encoder_thread = threading.Thread(target=self._encode_loop, name="video-encoder", daemon=True)
+        self._encoder_thread.start()
+
+    def has_viewer(self):
+        return self.ws_handler.video_broadcaster.has_subscribers() and \
+            self.ws_handler.autonomy_connection_state != ConnectionState.DISCONNECTED
+
+    def submit_frame(self, cam_image_array, capture_ns=None):
+        """Called from the drive loop. Replaces any frame still waiting for the encoder."""
+        if cam_image_array is None or not self.has_viewer():
+            return
+
+        if self.paused:
+            self.frames_paused += 1
+            return
 
-    async def send_camera_frame(self, cam_image_array):
-        if self.ws_handler.video_client is None or self.ws_handler.autonomy_connection_state == ConnectionState.DISCONNECTED:
+        if not self._rate_allows(time.monotonic()):
+            self.frames_skipped_rate += 1
             return
-        try:
-            cam_image_array = np.uint8(cam_image_array)
-            img = Image.fromarray(cam_image_array)
-            stream = BytesIO()
-            img.save(stream, format='JPEG')
-            jpeg_data = stream.getvalue()
-            await self.ws_handler.video_client.send(jpeg_data)
-
-        except Exception as e:
-            logger.error(f"Error sending camera frame: {e}")
\ No newline at end of file
+
+        with self._frame_ready:
+            self.frames_submitted += 1
+            if self._pending_frame is not None:
+                self.frames_dropped_stale += 1
+            self._pending_frame = cam_image_array
+            self._pending_capture_ns = time.monotonic_ns() if capture_ns is None else capture_ns
+            self._frame_ready.notify()
+
+    def _rate_allows(self, now):
+        # Frames are due on a fixed schedule; a quarter interval of slack absorbs drive loop jitter
+        interval = 1.0 / self.quality_controller.max_fps
+        if now < self._next_submit_time - 0.25 * interval:
+            return False
+        base = self._next_submit_time if now - self._next_submit_time < interval else now
+        self._next_submit_time = base + interval
+        return True
+
+    def _encode_loop(self):
+        while self.running:
+            with self._frame_ready:
+                while self._pending_frame is None and self.running:
+                    self._frame_ready.wait()
+                frame = self._pending_frame
+                capture_ns = self._pending_capture_ns
+                self._pending_frame = None
+
+            if frame is None:
+                continue
+
+            try:
+                start = time.perf_counter()
+                encoded_frame = self._encode(self._scale(frame), capture_ns)
+                self.last_encode_ms = (time.perf_counter() - start) * 1000
+                self.total_encode_ms += self.last_encode_ms
+                self.frames_encoded += 1
+                metrics.record("frame.encode", self.last_encode_ms)
+
+                if encoded_frame is not None:
+                    metrics.record_since("frame.capture_to_encoded", capture_ns)
+                    self.loop.call_soon_threadsafe(self.ws_handler.video_broadcaster.publish, encoded_frame)
+                self._adapt()
+            except Exception as e:
+                logger.error(f"Error encoding camera frame: {e}")
+
+    def _encode(self, frame, capture_ns):
+        """Returns the EncodedFrame to publish, or None when no tile changed."""
+        self._frame_id += 1
+        if self.tile_encoder is None:
+            return EncodedFrame(self.encoder.encode(frame), self._frame_id, capture_ns)
+
+        broadcaster = self.ws_handler.video_broadcaster
+        force_keyframe = broadcaster.take_keyframe_request() or broadcaster.has_full_frame_subscribers()
+        jpeg_data, tiles = self.tile_encoder.encode(frame, self._frame_id, force_keyframe=force_keyframe)
+        if tiles is None:
+            return None
+        return EncodedFrame(jpeg_data, self._frame_id, capture_ns, tiles=tiles)
+
+    def warm_up(self, frame_shape):
+        """Encodes blank frames once at startup, before viewers connect, so the first real frame is not encoded cold."""
+        blank = np.zeros(frame_shape, dtype=np.uint8)
+        self.encoder.encode(self._scale(blank))
+        if self.tile_encoder is not None:
+            tile = np.zeros((self.tile_encoder.tile_h, self.tile_encoder.tile_w) + tuple(frame_shape[2:]), dtype=np.uint8)
+            self.tile_encoder.tile_encoder.encode(tile)
+
+    def _scale(self, frame):
+        scale = self.quality_controller.scale
+        if scale >= 1.0:
+            return frame
+
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        shape = (size[1], size[0]) + frame.shape[2:]
+        if self._scaled_buffer is None or self._scaled_buffer.shape != shape:
+            self._scaled_buffer = np.empty(shape, dtype=np.uint8)
+        cv2.resize(frame, size, dst=self._scaled_buffer, interpolation=cv2.INTER_AREA)
+        return self._scaled_buffer
+
+    def set_link_handover(self, active):
+        """Called from the link event thread when a handover starts (True) or ends (False)."""
+        if self.handover_policy == "pause":
+            self.paused = active
+        elif self.handover_policy == "shrink":
+            if active:
+                self.quality_controller.set_floor(len(self.quality_controller.ladder) - 1, "link handover")
+            else:
+                self.quality_controller.clear_floor()
+            enabled = self.quality_controller.enabled
+            self.encoder.set_quality(self.quality_controller.quality if enabled or active else self.jpeg_quality)
+
+    def _adapt(self):
+        send_latency_ms, queue_depth = self.ws_handler.video_broadcaster.get_link_metrics()
+        signal_strength = self.ws_handler.wifi_details.get("signal_strength")
+        if self.quality_controller.update(self.last_encode_ms, send_latency_ms, queue_depth, signal_strength):
+            self.encoder.set_quality(self.quality_controller.quality)
+            logger.info(f"Video profile changed: {self.quality_controller.get_state()}")
+
+    def get_stats(self):
+        return {
+            "frames_submitted": self.frames_submitted,
+            "frames_encoded": self.frames_encoded,
+            "frames_dropped_stale": self.frames_dropped_stale,
+            "frames_skipped_rate": self.frames_skipped_rate,
+            "frames_paused": self.frames_paused,
+            "last_encode_ms": round(self.last_encode_ms, 2),
+            "avg_encode_ms": round(self.total_encode_ms / self.frames_encoded, 2) if self.frames_encoded else 0.0,
+            "profile": self.quality_controller.get_state(),
+            "tiles": self.tile_encoder.get_stats() if self.tile_encoder else None,
+        }
+
+    def stop(self):
+        self.running = False
+        with self._frame_ready:
+            self._frame_ready.notify_all()
+        self._encoder_thread.join(timeout=1.0)
@@ -0,0 +1,244 @@
+import logging
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+from cv2 import aruco
+
+from services.marker_detector import TrackingMarkerDetector
+
+logger = logging.getLogger(__name__)
+
+MAX_MARKERS = 16
+
+# Ring header: [latest slot, latest frame id, stop flag, worker ready], then per slot [seq, frame id, timestamp ns]
+_RING_HEADER = 4
+_SLOT_META = 3
+
+# Result block: [seq, frame id, capture timestamp ns, detection done ns, marker count, marker ids...]
+_RESULT_FIELDS = 5 + MAX_MARKERS
+
+
+class MarkerResult:
+    def __init__(self, frame_id, timestamp_ns, detected_ns, marker_ids):
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.detected_ns = detected_ns
+        self.marker_ids = marker_ids
+
+    def age_ms(self, now_ns=None):
+        now_ns = time.monotonic_ns() if now_ns is None else now_ns
+        return (now_ns - self.timestamp_ns) / 1_000_000
+
+
+def detect_marker_ids(gray, aruco_dict, aruco_params):
+    _, ids, _ = aruco.detectMarkers(gray, aruco_dict, parameters=aruco_params)
+    if ids is None:
+        return []
+    return [int(i) for i in ids.flatten()]
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of camera frames in shared memory.
+
+    The drive loop copies each frame into the next slot once; the vision process
+    reads the newest slot in place. Every slot carries a sequence counter that is odd
+    while the slot is being written, so the reader can tell a torn frame apart.
+    """
+
+    def __init__(self, shape, slots=4, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        meta_bytes = 8 * (_RING_HEADER + _SLOT_META * slots + _RESULT_FIELDS)
+        size = meta_bytes + frame_bytes * slots
+
+        self._owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+
+        meta = np.ndarray((meta_bytes // 8,), dtype=np.int64, buffer=self.shm.buf)
+        self.header = meta[:_RING_HEADER]
+        self.slot_meta = meta[_RING_HEADER:_RING_HEADER + _SLOT_META * slots].reshape(slots, _SLOT_META)
+        self.result = meta[_RING_HEADER + _SLOT_META * slots:]
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=meta_bytes)
+
+        if self._owner:
+            meta[:] = 0
+            self.header[0] = -1
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, frame, frame_id, timestamp_ns):
+        slot = (int(self.header[0]) + 1) % self.slots
+        meta = self.slot_meta[slot]
+        meta[0] += 1
+        np.copyto(self.frames[slot], frame)
+        meta[1] = frame_id
+        meta[2] = timestamp_ns
+        meta[0] += 1
+        self.header[0] = slot
+        self.header[1] = frame_id
+
+    def latest(self):
+        """Returns (slot, seq, frame id, timestamp ns, view) for the newest frame, or None."""
+        slot = int(self.header[0])
+        if slot < 0:
+            return None
+        meta = self.slot_meta[slot]
+        seq = int(meta[0])
+        if seq % 2:
+            return None
+        return slot, seq, int(meta[1]), int(meta[2]), self.frames[slot]
+
+    def is_unchanged(self, slot, seq):
+        return int(self.slot_meta[slot][0]) == seq
+
+    def publish_result(self, frame_id, timestamp_ns, marker_ids):
+        marker_ids = marker_ids[:MAX_MARKERS]
+        self.result[0] += 1
+        self.result[1] = frame_id
+        self.result[2] = timestamp_ns
+        self.result[3] = time.monotonic_ns()
+        self.result[4] = len(marker_ids)
+        self.result[5:5 + len(marker_ids)] = marker_ids
+        self.result[0] += 1
+
+    def read_result(self, attempts=3):
+        for _ in range(attempts):
+            seq = int(self.result[0])
+            if seq == 0:
+                return None
+            if seq % 2:
+                continue
+            snapshot = self.result.copy()
+            if int(self.result[0]) == seq:
+                count = int(snapshot[4])
+                return MarkerResult(int(snapshot[1]), int(snapshot[2]), int(snapshot[3]),
+                                    [int(i) for i in snapshot[5:5 + count]])
+        return None
+
+    @property
+    def stop_requested(self):
+        return bool(self.header[2])
+
+    def request_stop(self):
+        self.header[2] = 1
+
+    @property
+    def worker_ready(self):
+        return bool(self.header[3])
+
+    def set_worker_ready(self):
+        self.header[3] = 1
+
+    def close(self):
+        # Drop the numpy views before closing the mapping
+        self.header = self.slot_meta = self.result = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the mapping is released with the process
+            pass
+        if self._owner:
+            self.shm.unlink()
+
+
+def _vision_process_main(ring_name, shape, slots, frame_ready, tracking):
+    ring = SharedFrameRing(shape, slots, name=ring_name)
+    aruco_dict = aruco.Dictionary_get(aruco.DICT_4X4_100)
+    aruco_params = aruco.DetectorParameters_create()
+    tracking_detector = TrackingMarkerDetector(aruco_dict, aruco_params) if tracking else None
+    gray = np.empty(shape[:2], dtype=np.uint8)
+    last_frame_id = -1
+
+    # Run one detection on a blank frame so the first real frame is not detected cold
+    gray[:] = 0
+    detect_marker_ids(gray, aruco_dict, aruco_params)
+    if tracking_detector is not None:
+        tracking_detector.detect(gray)
+        tracking_detector.reset()
+    ring.set_worker_ready()
+
+    try:
+        while not ring.stop_requested:
+            if not frame_ready.wait(timeout=0.5):
+                continue
+            frame_ready.clear()
+
+            latest = ring.latest()
+            if latest is None:
+                continue
+            slot, seq, frame_id, timestamp_ns, view = latest
+            if frame_id == last_frame_id:
+                continue
+
+            cv2.cvtColor(view, cv2.COLOR_RGB2GRAY, dst=gray)
+            if not ring.is_unchanged(slot, seq):
+                # The drive loop lapped the ring while we were reading this slot
+                continue
+
+            if tracking_detector is not None:
+                marker_ids = tracking_detector.detect(gray)
+            else:
+                marker_ids = detect_marker_ids(gray, aruco_dict, aruco_params)
+            ring.publish_result(frame_id, timestamp_ns, marker_ids)
+            last_frame_id = frame_id
+    finally:
+        ring.close()
+
+
+class VisionWorker:
+    """
+    Runs ArUco marker detection in a separate process so it neither blocks the
+    DonkeyCar drive loop nor competes with it for the GIL.
+
+    Frames go in through a SharedFrameRing; the newest MarkerResult is read back
+    without blocking via get_latest_result().
+    """
+
+    def __init__(self, frame_shape=(480, 640, 3), slots=4, tracking=True):
+        self.frame_shape = tuple(frame_shape)
+        self.ring = SharedFrameRing(self.frame_shape, slots)
+        self.frame_id = 0
+        self.frames_rejected = 0
+
+        context = multiprocessing.get_context("spawn")
+        self._frame_ready = context.Event()
+        self.process = context.Process(target=_vision_process_main,
+                                       args=(self.ring.name, self.frame_shape, slots, self._frame_ready, tracking),
+                                       name="vision-worker", daemon=True)
+        self.process.start()
+
+    def submit_frame(self, cam_image_array):
+        if cam_image_array is None:
+            return
+        if cam_image_array.shape != self.frame_shape:
+            self.frames_rejected += 1
+            if self.frames_rejected == 1:
+                logger.error(f"Vision worker expects frames of shape {self.frame_shape}, got {cam_image_array.shape}")
+            return
+
+        self.frame_id += 1
+        self.ring.write(cam_image_array, self.frame_id, time.monotonic_ns())
+        self._frame_ready.set()
+
+    def get_latest_result(self):
+        return self.ring.read_result()
+
+    @property
+    def ready(self):
+        """True once the worker process has imported OpenCV and run a warm-up detection."""
+        return self.ring.worker_ready
+
+    def stop(self):
+        self.ring.request_stop()
+        self._frame_ready.set()
+        self.process.join(timeout=2.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()